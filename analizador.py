@@ -0,0 +1,258 @@
+# analizador.py
+import re, json, time
+from collections import namedtuple
+
+# Eventos que produce el analizador a partir de cada línea de robocopy
+FileEvent = namedtuple("FileEvent", "kind size path")
+DirEvent = namedtuple("DirEvent", "kind count path")
+ErrorEvent = namedtuple("ErrorEvent", "code action path message")
+RetryEvent = namedtuple("RetryEvent", "seconds")
+SummaryEvent = namedtuple("SummaryEvent", "section values")
+SpeedEvent = namedtuple("SpeedEvent", "bytes_per_sec")
+
+# Clases de archivo/directorio de robocopy (inglés y español) -> tipo normalizado
+FILE_CLASSES = {
+    "new file": "new", "nuevo archivo": "new",
+    "newer": "newer", "más reciente": "newer", "mas reciente": "newer",
+    "older": "older", "más antiguo": "older", "mas antiguo": "older",
+    "same": "same", "mismo": "same",
+    "changed": "changed", "modificado": "changed", "cambiado": "changed",
+    "tweaked": "tweaked", "retocado": "tweaked",
+    "*extra file": "extra", "*archivo extra": "extra",
+    "*mismatch": "mismatch", "*no coincide": "mismatch",
+    "lonely": "lonely", "solitario": "lonely",
+}
+DIR_CLASSES = {
+    "new dir": "new", "nuevo directorio": "new", "nuevo dir.": "new",
+    "*extra dir": "extra", "*dir. extra": "extra", "*directorio extra": "extra",
+}
+# Tipos que suponen copiar el contenido del archivo
+COPY_KINDS = frozenset(("new", "newer", "older", "changed"))
+
+SUMMARY_SECTIONS = {
+    "dirs": "dirs", "directorios": "dirs",
+    "files": "files", "archivos": "files",
+    "bytes": "bytes",
+    "times": "times", "tiempos": "times",
+}
+SUMMARY_COLUMNS = ("total", "copied", "skipped", "mismatch", "failed", "extras")
+UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+_SIZE_RE = re.compile(r"^(\d+(?:[.,]\d+)?)(?:\s*([kmgt]))?$", re.I)
+_SUMMARY_RE = re.compile(r"^\s*([A-Za-zá-ú]+)\s*:\s*(.*)$")
+_SUMMARY_VALUE_RE = re.compile(r"(\d+:\d+:\d+|\d+(?:[.,]\d+)?(?:\s[kmgt](?=\s|$))?)", re.I)
+_SPEED_RE = re.compile(r"^\s*(?:Speed|Velocidad)\s*:\s*([\d.,]+)\s*Bytes/se[cg]", re.I)
+_ERROR_RE = re.compile(r"ERROR\s+(\d+)\s+\(0x[0-9A-Fa-f]+\)\s+(.*?)\s+((?:[A-Za-z]:|\\\\|/).*)$")
+_RETRY_RE = re.compile(r"(?:Waiting|Esperando)\s+(\d+)", re.I)
+
+
+def parse_size(text):
+    """
+    Convierte tamaños de robocopy ('1024', '12.5 m', '1,2 g') a bytes.
+    """
+    m = _SIZE_RE.match(text.strip())
+    if not m:
+        return None
+    number, unit = m.groups()
+    return int(float(number.replace(",", ".")) * UNITS[(unit or "").lower()])
+
+
+class RobocopyParser:
+    """
+    Analizador incremental de la salida de robocopy: feed(línea) devuelve un
+    evento o None y va actualizando las métricas en vivo.
+    Reconoce las líneas por archivo/directorio, los errores y la tabla final.
+    """
+
+    def __init__(self, expected_bytes=None, expected_files=None):
+        self.metrics = RunMetrics(expected_bytes, expected_files)
+        self._pending_error = None
+
+    def feed(self, line):
+        event = self._parse(line)
+        if event is not None:
+            self.metrics.record(event)
+        return event
+
+    def _parse(self, line):
+        if "\t" in line:
+            return self._parse_entry(line)
+        text = line.strip()
+        if not text:
+            return None
+
+        if self._pending_error is not None:
+            # La línea siguiente a un ERROR es la descripción del sistema
+            self._pending_error = None
+            if not text.startswith(("ERROR", "Waiting", "Esperando")):
+                self.metrics.describe_error(text)
+                return None
+
+        if "ERROR " in text:
+            m = _ERROR_RE.search(text)
+            if m:
+                event = ErrorEvent(int(m.group(1)), m.group(2), m.group(3), "")
+                self._pending_error = event
+                return event
+        if text.startswith(("Waiting", "Esperando")):
+            m = _RETRY_RE.match(text)
+            return RetryEvent(int(m.group(1)) if m else 0)
+
+        if ":" in text:
+            m = _SPEED_RE.match(text)
+            if m:
+                return SpeedEvent(int(re.sub(r"[.,]", "", m.group(1))))
+            m = _SUMMARY_RE.match(text)
+            if m:
+                section = SUMMARY_SECTIONS.get(m.group(1).lower())
+                if section:
+                    return self._parse_summary(section, m.group(2))
+        return None
+
+    def _parse_entry(self, line):
+        fields = [f.strip() for f in line.rstrip("\r\n").split("\t")]
+        fields = [f for f in fields if f]
+        if len(fields) == 3:
+            kind = FILE_CLASSES.get(fields[0].lower(), fields[0].lower())
+            return FileEvent(kind, parse_size(fields[1]) or 0, fields[2])
+        if len(fields) == 2:
+            head, path = fields
+            if head.isdigit():
+                return DirEvent("existing", int(head), path)
+            cls, _, count = head.rpartition(" ")
+            if count.isdigit():
+                return DirEvent(DIR_CLASSES.get(cls.strip().lower(), cls.strip().lower()), int(count), path)
+            if head.lower() in FILE_CLASSES:
+                # Con /NJS y similares algunos archivos salen sin tamaño
+                return FileEvent(FILE_CLASSES[head.lower()], 0, path)
+        return None
+
+    def _parse_summary(self, section, rest):
+        raw = _SUMMARY_VALUE_RE.findall(rest)
+        if section == "times":
+            return SummaryEvent(section, dict(zip(("total", "copied", "failed", "extras"), raw)))
+        values = [parse_size(v) for v in raw]
+        if len(values) < len(SUMMARY_COLUMNS) or None in values:
+            return None
+        return SummaryEvent(section, dict(zip(SUMMARY_COLUMNS, values)))
+
+
+class RunMetrics:
+    """
+    Métricas en vivo de una ejecución: velocidad, ETA y archivos fallidos.
+    """
+
+    def __init__(self, expected_bytes=None, expected_files=None):
+        self.started = time.monotonic()
+        self.ended = None
+        self.expected_bytes = expected_bytes
+        self.expected_files = expected_files
+        self.bytes_done = 0
+        self.files_done = 0
+        self.counts = {}
+        # Un archivo que falla en varios reintentos aparece una sola vez
+        self._failed = {}
+        self.retries = 0
+        self.summary = {}
+        self.reported_speed = None
+
+    def record(self, event):
+        cls = type(event)
+        if cls is FileEvent:
+            self.counts[event.kind] = self.counts.get(event.kind, 0) + 1
+            if event.kind in COPY_KINDS:
+                self.files_done += 1
+                self.bytes_done += event.size
+        elif cls is ErrorEvent:
+            self._failed[event.path] = {"code": event.code, "action": event.action, "path": event.path, "message": ""}
+            self._last_failed = event.path
+        elif cls is RetryEvent:
+            self.retries += 1
+        elif cls is SummaryEvent:
+            self.summary[event.section] = event.values
+        elif cls is SpeedEvent:
+            self.reported_speed = event.bytes_per_sec
+        elif cls is DirEvent:
+            key = "dir_" + event.kind
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @property
+    def failed(self):
+        return list(self._failed.values())
+
+    def describe_error(self, message):
+        if self._failed:
+            self._failed[self._last_failed]["message"] = message
+
+    def finish(self):
+        self.ended = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.ended or time.monotonic()) - self.started
+
+    def bytes_per_sec(self):
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def files_per_sec(self):
+        return self.files_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        # Solo hay ETA si se conoce el tamaño esperado del trabajo
+        if self.expected_bytes:
+            rate = self.bytes_per_sec()
+            remaining = max(self.expected_bytes - self.bytes_done, 0)
+            return remaining / rate if rate > 0 else None
+        if self.expected_files:
+            rate = self.files_per_sec()
+            remaining = max(self.expected_files - self.files_done, 0)
+            return remaining / rate if rate > 0 else None
+        return None
+
+    def snapshot(self):
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "bytes_done": self.bytes_done,
+            "files_done": self.files_done,
+            "bytes_per_sec": round(self.bytes_per_sec(), 1),
+            "files_per_sec": round(self.files_per_sec(), 2),
+            "eta_seconds": self.eta_seconds(),
+            "expected_bytes": self.expected_bytes,
+            "expected_files": self.expected_files,
+            "counts": dict(self.counts),
+            "retries": self.retries,
+            "failed": self.failed,
+            "summary": dict(self.summary),
+            "reported_speed": self.reported_speed,
+        }
+
+    def status_line(self):
+        eta = self.eta_seconds()
+        text = (f"{self.files_done} archivos · {format_bytes(self.bytes_done)} · "
+                f"{format_bytes(self.bytes_per_sec())}/s · {self.files_per_sec():.1f} arch/s")
+        if eta is not None:
+            text += f" · ETA {int(eta // 60)}:{int(eta % 60):02d}"
+        if self._failed:
+            text += f" · {len(self._failed)} fallidos"
+        return text
+
+    def to_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(n) < 1024 or unit == "TB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+
+
+def parse_lines(lines):
+    """
+    Analiza una transcripción completa. Devuelve (eventos, métricas).
+    """
+    parser = RobocopyParser()
+    events = [e for e in map(parser.feed, lines) if e is not None]
+    parser.metrics.finish()
+    return events, parser.metrics
@@ -0,0 +1,255 @@
+# ancho_banda.py
+import re, time, threading
+from datetime import datetime, timedelta
+
+# Límite de ancho de banda por trabajo y horarios de ejecución.
+#   /BW:n          (propio de Valkyria) tope del trabajo en MB/s. Para robocopy
+#                  se traduce a /IPG; el motor nativo lo aplica con un cubo de
+#                  fichas (TokenBucket) que el planificador reajusta en marcha.
+#   /RH:hhmm-hhmm  el de robocopy: horas en que el trabajo puede copiar. Lo
+#                  aplica el planificador: fuera de horario no arranca y, si
+#                  estaba en marcha, lo pausa y lo reanuda al abrirse la ventana.
+BANDWIDTH = "/BW:"
+RUN_HOURS = "/RH:"
+MB = 1000 * 1000
+IPG_BLOCK = 64 * 1024       # robocopy espera /IPG ms después de cada bloque de 64 KB
+MIN_RATE = 256 * 1024       # un trabajo limitado nunca baja de aquí (bytes/s)
+REBALANCE_EVERY = 2.0       # segundos entre repartos del límite global
+
+
+def split_bandwidth_arg(cmd):
+    # (cmd sin /BW, MB/s o None)
+    mbps = None
+    rest = []
+    for arg in cmd:
+        if arg.upper().startswith(BANDWIDTH):
+            mbps = float(arg[len(BANDWIDTH):])
+            if mbps <= 0:
+                raise ValueError(f"{arg}: el límite debe ser mayor que 0 MB/s")
+        else:
+            rest.append(arg)
+    return rest, mbps
+
+
+def mbps_to_ipg(rate, streams=1):
+    """
+    /IPG:n en milisegundos para que streams procesos de robocopy sumen unos
+    rate bytes/s. Es aproximado: robocopy espera n ms por bloque de 64 KB y
+    además tarda lo que tarde en copiarlo, así que se queda algo por debajo.
+    Por debajo de 1 ms no se puede limitar (unos 64 MB/s por proceso): 0.
+    """
+    per_stream = rate / max(1, streams)
+    return int(IPG_BLOCK * 1000 / per_stream) if per_stream > 0 else 0
+
+
+def ipg_to_rate(ipg):
+    # La inversa: bytes/s de un proceso con /IPG:n
+    return IPG_BLOCK * 1000 / ipg if ipg > 0 else None
+
+
+# ---------- horarios ----------
+
+def parse_run_hours(value):
+    # "1900-0700" -> (1140, 420) en minutos desde medianoche; la ventana puede cruzar la medianoche
+    m = re.fullmatch(r"(\d\d)(\d\d)-(\d\d)(\d\d)", value.strip())
+    if not m:
+        raise ValueError(f"/RH:{value}: el formato es hhmm-hhmm (p. ej. /RH:1900-0700)")
+    h1, m1, h2, m2 = map(int, m.groups())
+    if h1 > 23 or h2 > 24 or m1 > 59 or m2 > 59 or (h2 == 24 and m2):
+        raise ValueError(f"/RH:{value}: hora no válida")
+    return h1 * 60 + m1, h2 * 60 + m2
+
+
+def split_run_hours(cmd):
+    # (cmd sin /RH ni /PF, ventana o None)
+    window = None
+    rest = []
+    for arg in cmd:
+        upper = arg.upper()
+        if upper.startswith(RUN_HOURS):
+            window = parse_run_hours(arg[len(RUN_HOURS):])
+        elif upper != "/PF":
+            rest.append(arg)
+    return rest, window
+
+
+def in_window(window, now=None):
+    if window is None:
+        return True
+    start, end = window
+    now = now or datetime.now()
+    t = now.hour * 60 + now.minute
+    if start == end:
+        return True
+    return start <= t < end if start < end else (t >= start or t < end)
+
+
+def next_open(window, now=None):
+    # Cuándo vuelve a abrirse la ventana (ahora si ya está abierta)
+    now = now or datetime.now()
+    if in_window(window, now):
+        return now
+    opens = now.replace(hour=window[0] // 60, minute=window[0] % 60, second=0, microsecond=0)
+    return opens if opens > now else opens + timedelta(days=1)
+
+
+def format_window(window):
+    return "-".join(f"{m // 60:02d}{m % 60:02d}" for m in window)
+
+
+# ---------- cubo de fichas ----------
+
+class TokenBucket:
+    """
+    Limita a rate bytes/s (None = sin límite) a todos los hilos que llamen a
+    consume. Se permite quedar en deuda: quien consume espera lo que tarde
+    en saldarse, así los bloques grandes (8 MB) no necesitan trocearse.
+    consumed cuenta lo que ha pasado, para medir el ritmo real.
+    """
+
+    def __init__(self, rate=None, burst=1.0):
+        self.rate = rate
+        self.burst = burst      # segundos de ritmo que se pueden acumular sin usar
+        self.consumed = 0
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(self.rate * self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self, n, cancel=None):
+        with self._lock:
+            self.consumed += n
+            if self.rate is None:
+                return
+            self._refill()
+            self._tokens -= n
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+# ---------- reparto entre trabajos ----------
+
+def fair_shares(budget, demands):
+    """
+    Reparto max-min: quien pide menos que la parte igual se queda con lo que
+    pide y el sobrante se reparte entre los demás. demands = {id: bytes/s o
+    None (lo que haya)}.
+    """
+    shares, left, remaining = {}, dict(demands), budget
+    while left:
+        fair = remaining / len(left)
+        small = {k: d for k, d in left.items() if d is not None and d <= fair}
+        if not small:
+            shares.update(dict.fromkeys(left, fair))
+            break
+        for k, d in small.items():
+            shares[k] = d
+            remaining -= d
+            del left[k]
+    return shares
+
+
+class BandwidthManager:
+    """
+    Cubos de los trabajos en marcha y, con limit (MB/s), el reparto de ese
+    límite global entre ellos. Cada REBALANCE_EVERY segundos mide cuánto ha
+    movido cada trabajo: los que no gastan su parte (disco lento, archivos
+    pequeños) la ceden a los demás, y lo que consumen los trabajos fijos
+    (robocopy, cuyo /IPG no cambia una vez lanzado) se descuenta del total.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._jobs = {}     # id -> [cubo, tope propio, fijo, consumido antes, ritmo medido]
+        self._stamp = time.monotonic()
+        self._stop = threading.Event()
+
+    def set_limit(self, limit):
+        with self._lock:
+            self.limit = limit or None
+            self._rebalance()
+
+    def register(self, job_id, cap=None, fixed=False):
+        """
+        Cubo del trabajo con su ritmo inicial: el tope propio (cap, MB/s) y,
+        con límite global, su parte del reparto. fixed para los que no se
+        pueden reajustar en marcha (robocopy): solo se miden con report.
+        """
+        with self._lock:
+            cap = cap * MB if cap else None
+            bucket = TokenBucket(cap)
+            self._jobs[job_id] = [bucket, cap, fixed, 0, None]
+            self._rebalance(new=job_id)
+            return bucket
+
+    def report(self, job_id, total_bytes):
+        # Bytes que lleva un trabajo fijo (los del analizador de su salida)
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is not None:
+                entry[0].consumed = total_bytes
+
+    def unregister(self, job_id):
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._rebalance()
+
+    def rebalance(self):
+        with self._lock:
+            self._rebalance()
+
+    def _rebalance(self, new=None):
+        now = time.monotonic()
+        elapsed = now - self._stamp
+        if elapsed >= REBALANCE_EVERY / 2:
+            self._stamp = now
+            for entry in self._jobs.values():
+                entry[4] = (entry[0].consumed - entry[3]) / elapsed
+                entry[3] = entry[0].consumed
+        if self.limit is None:
+            for bucket, cap, fixed, _, _ in self._jobs.values():
+                if not fixed:
+                    bucket.set_rate(cap)
+            return
+        budget = self.limit * MB
+        demands = {}
+        for job_id, (bucket, cap, fixed, _, measured) in self._jobs.items():
+            if fixed and job_id != new:
+                # Ya lanzado con su /IPG: cuenta lo que usa (o lo que se le dio, si aún no se ha medido)
+                demands[job_id] = measured if measured is not None else bucket.rate
+            elif measured is not None and bucket.rate is not None and measured < bucket.rate * 0.8:
+                # No llega a su parte: pide algo más de lo que usa y cede el resto
+                demands[job_id] = min(cap or float("inf"), max(MIN_RATE, measured * 1.25))
+            else:
+                demands[job_id] = cap
+        shares = fair_shares(budget, demands)
+        for job_id, (bucket, cap, fixed, _, _) in self._jobs.items():
+            if not fixed or job_id == new:
+                bucket.set_rate(max(MIN_RATE, shares[job_id]))
+
+    def start(self):
+        t = threading.Thread(target=self._loop, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(REBALANCE_EVERY):
+            self.rebalance()
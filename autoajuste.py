@@ -0,0 +1,213 @@
+# autoajuste.py
+import os, json, time, shutil, threading
+from analizador import RobocopyParser, format_bytes
+from comandos import DEFAULT_THREADS, RobocopyFlags, build_cmd
+from planificador import volume_of, requested_threads, with_threads
+from rutas import app_dir
+
+# Elige /MT y /J (E/S sin búfer) para cada par de volúmenes origen -> destino
+# con lo medido en copias anteriores o en pasadas cortas de calibración.
+# Un disco USB y un NAS de 10 GbE no tienen nada que ver, así que cada par
+# guarda su propio perfil.
+THREAD_STEPS = (1, 2, 4, 8, 16, 32, 64, 128)
+SMALL_FILE = 1 << 20        # por debajo de este tamaño medio manda archivos/s, por encima bytes/s
+MIN_BYTES = 64 << 20        # copias con menos trabajo que esto no dicen nada del volumen
+MIN_FILES = 500
+MIN_SECONDS = 2.0
+ALPHA = 0.3                 # peso de la última medida en la media móvil
+REEXPLORE = 30 * 86400      # medidas más viejas se vuelven a probar
+
+
+def volume_id(path):
+    """
+    Identificador estable del volumen: número de serie en Windows (la letra de
+    unidad cambia entre discos USB), dispositivo en POSIX.
+    """
+    if os.name == "nt":
+        try:
+            import ctypes
+            root = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+            serial = ctypes.c_uint32()
+            if ctypes.windll.kernel32.GetVolumeInformationW(root, None, 0, ctypes.byref(serial), None, None, None, 0):
+                return f"{serial.value:08X}"
+        except (OSError, AttributeError):
+            pass
+    return str(volume_of(path))
+
+
+def size_class(avg_size):
+    return "small" if avg_size < SMALL_FILE else "large"
+
+
+def combo_key(threads, unbuffered):
+    return f"{threads}{'J' if unbuffered else ''}"
+
+
+def parse_combo(key):
+    return (int(key.rstrip("J")), key.endswith("J"))
+
+
+class VolumeProfiles:
+    """
+    Caché de perfiles en JSON:
+    {"<vol origen>-><vol destino>": {"last": "small"|"large",
+        "small": {"16": {"bps", "fps", "n", "t"}, "16J": ...}, "large": {...}}}
+    Se puede usar desde varios hilos.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(app_dir(), "perfiles_volumen.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def key(self, src, dst):
+        return f"{volume_id(src)}->{volume_id(dst)}"
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def profile(self, src, dst):
+        with self._lock:
+            return json.loads(json.dumps(self._data.get(self.key(src, dst), {})))
+
+    def record(self, src, dst, threads, unbuffered, metrics, force=False):
+        """
+        Suma una medida (RunMetrics de una copia terminada). Las copias que
+        apenas movieron datos se descartan salvo con force (calibración).
+        Devuelve True si se guardó.
+        """
+        elapsed, files, nbytes = metrics.elapsed, metrics.files_done, metrics.bytes_done
+        if not files or elapsed <= 0:
+            return False
+        if not force and (elapsed < MIN_SECONDS or (nbytes < MIN_BYTES and files < MIN_FILES)):
+            return False
+        bps, fps = nbytes / elapsed, files / elapsed
+        cls = size_class(nbytes / files)
+        with self._lock:
+            prof = self._data.setdefault(self.key(src, dst), {})
+            prof["last"] = cls
+            entry = prof.setdefault(cls, {}).get(combo_key(threads, unbuffered))
+            if entry is None:
+                entry = {"bps": bps, "fps": fps, "n": 0}
+            else:
+                entry["bps"] += ALPHA * (bps - entry["bps"])
+                entry["fps"] += ALPHA * (fps - entry["fps"])
+            entry["n"] += 1
+            entry["t"] = time.time()
+            prof[cls][combo_key(threads, unbuffered)] = entry
+            self._save()
+        return True
+
+    def suggest(self, src, dst, avg_size=None, unbuffered_ok=True, explore=True):
+        """
+        (hilos, sin_búfer) para una copia entre estos volúmenes. Con explore se
+        prueba de vez en cuando un vecino del mejor conocido (mitad, doble o /J)
+        que aún no tenga medida, así el perfil converge solo con el uso.
+        """
+        prof = self.profile(src, dst)
+        cls = size_class(avg_size) if avg_size is not None else prof.get("last", "small")
+        now = time.time()
+        combos = {k: v for k, v in prof.get(cls, {}).items() if unbuffered_ok or not k.endswith("J")}
+        if not combos:
+            return DEFAULT_THREADS, False
+        metric = "fps" if cls == "small" else "bps"
+        threads, unbuffered = parse_combo(max(combos, key=lambda k: combos[k][metric]))
+        if explore:
+            i = THREAD_STEPS.index(threads) if threads in THREAD_STEPS else THREAD_STEPS.index(DEFAULT_THREADS)
+            neighbours = [(THREAD_STEPS[j], unbuffered) for j in (i + 1, i - 1) if 0 <= j < len(THREAD_STEPS)]
+            # /J solo compensa con archivos grandes
+            if unbuffered_ok and cls == "large":
+                neighbours.append((threads, not unbuffered))
+            for cand in neighbours:
+                entry = combos.get(combo_key(*cand))
+                if entry is None or now - entry.get("t", 0) > REEXPLORE:
+                    return cand
+        return threads, unbuffered
+
+    def estimate(self, src, dst, nbytes, files):
+        """
+        Segundos que tardaría una copia de files archivos y nbytes entre estos
+        volúmenes con la mejor combinación medida; None si aún no hay medidas.
+        Se toma el peor de los dos ritmos (bytes/s y archivos/s) porque manda
+        el que más limite.
+        """
+        if not files:
+            return 0.0
+        prof = self.profile(src, dst)
+        cls = size_class(nbytes / files)
+        combos = prof.get(cls) or prof.get("large" if cls == "small" else "small")
+        if not combos:
+            return None
+        best = max(combos.values(), key=lambda e: e["fps" if cls == "small" else "bps"])
+        return max(nbytes / best["bps"] if best["bps"] else 0.0, files / best["fps"] if best["fps"] else 0.0)
+
+    def apply(self, cmd, unbuffered_ok=True, explore=False):
+        # Añade /MT (y /J) al comando si no los fija ya el usuario
+        if requested_threads(cmd) is not None:
+            return cmd
+        threads, unbuffered = self.suggest(cmd[1], cmd[2], unbuffered_ok=unbuffered_ok, explore=explore)
+        cmd = with_threads(cmd, threads)
+        if unbuffered and RobocopyFlags.UNBUFFERED not in cmd:
+            cmd.append(RobocopyFlags.UNBUFFERED)
+        return cmd
+
+
+def calibrate(profiles, src, dst, backend, steps=(2, 8, 32, 64), seconds=3.0, emit=print, cancel=None):
+    """
+    Pasadas cortas de copia (seconds cada una) de src a una carpeta temporal
+    en el volumen de dst, una por número de hilos y, con robocopy, otra con /J
+    para el mejor. La primera pasada solo calienta la caché de lectura y no
+    cuenta. Las medidas van al perfil; devuelve (hilos, sin_búfer) del mejor.
+    """
+    scratch = os.path.join(dst, ".valkyria_calibracion")
+    dst_existed = os.path.isdir(dst)
+    unbuffered_ok = backend.name == "robocopy"
+    results = {}
+
+    def one_pass(n, threads, unbuffered):
+        target = os.path.join(scratch, str(n))
+        extra = [RobocopyFlags.UNBUFFERED] if unbuffered else []
+        cmd = build_cmd(src, target, RobocopyFlags.COPY_SUBDIRS, f"/MT:{threads}", *extra)
+        parser = RobocopyParser()
+        stop = threading.Event()
+        timer = threading.Timer(seconds, stop.set)
+        timer.start()
+        if cancel is not None:
+            threading.Thread(target=lambda: cancel.wait(seconds) and stop.set(), daemon=True).start()
+        try:
+            backend.run(cmd, parser.feed, stop)
+        finally:
+            timer.cancel()
+            parser.metrics.finish()
+            shutil.rmtree(target, ignore_errors=True)
+        return parser.metrics
+
+    try:
+        one_pass(0, DEFAULT_THREADS, False)
+        plan = [(t, False) for t in steps]
+        n = 1
+        while plan and not (cancel and cancel.is_set()):
+            threads, unbuffered = plan.pop(0)
+            m = one_pass(n, threads, unbuffered)
+            n += 1
+            if not m.files_done:
+                continue
+            results[(threads, unbuffered)] = m
+            profiles.record(src, dst, threads, unbuffered, m, force=True)
+            emit(f"[calibración] /MT:{threads}{' /J' if unbuffered else ''}: "
+                 f"{format_bytes(m.bytes_per_sec())}/s, {m.files_per_sec():.1f} arch/s\n")
+            if not plan and unbuffered_ok and not any(u for _, u in results):
+                best = max(results, key=lambda k: results[k].bytes_per_sec())
+                plan.append((best[0], True))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        if not dst_existed:
+            shutil.rmtree(dst, ignore_errors=True)
+    return profiles.suggest(src, dst, unbuffered_ok=unbuffered_ok, explore=False)
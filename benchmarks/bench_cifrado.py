@@ -0,0 +1,55 @@
+# bench_cifrado.py
+"""
+Compara el cifrado de una carpeta en un solo hilo (ZIP deflate + Fernet)
+con el pipeline paralelo por bloques.
+
+Uso: python benchmarks/bench_cifrado.py [--mb 512] [--workers N]
+"""
+import os, sys, time, shutil, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cifrado import encrypt_folder_to_file
+
+
+def make_tree(root, total_mb):
+    # Mitad texto comprimible, mitad datos aleatorios: parecido a un backup real
+    os.makedirs(root, exist_ok=True)
+    line = b"2024-01-01 12:00:00 INFO Copiando archivo de prueba con datos repetitivos\n"
+    text = line * (1024 * 1024 // len(line) + 1)
+    for i in range(total_mb):
+        sub = os.path.join(root, f"dir{i % 16:02d}")
+        os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f"f{i:05d}.bin"), "wb") as f:
+            f.write(text[:1024 * 1024] if i % 2 else os.urandom(1024 * 1024))
+
+
+def run(folder, out_dir, workers):
+    start = time.perf_counter()
+    enc_path, _ = encrypt_folder_to_file(folder, out_dir, key_path=os.path.join(out_dir, "bench.key"), workers=workers)
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(enc_path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=256, help="Tamaño de la carpeta sintética en MB")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="valk_bench_")
+    try:
+        src = os.path.join(tmp, "src")
+        make_tree(src, args.mb)
+        results = {}
+        for workers in (1, args.workers):
+            out = os.path.join(tmp, f"out{workers}")
+            elapsed, size = run(src, out, workers)
+            results[workers] = elapsed
+            print(f"workers={workers:<3} {elapsed:8.2f} s  {args.mb / elapsed:8.1f} MB/s  salida {size / 1e6:.1f} MB")
+        print(f"Aceleración: x{results[1] / results[args.workers]:.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
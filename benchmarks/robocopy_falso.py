@@ -0,0 +1,57 @@
+# robocopy_falso.py
+"""
+Sustituto de robocopy para medir en Linux: no copia nada, reproduce una
+salida grabada (un log real de robocopy o la que genera el motor nativo con
+/L /V) al ritmo indicado, para que el planificador, el analizador y el log
+de la interfaz trabajen como con un robocopy de verdad.
+
+Uso: robocopy_falso.py ORIGEN DESTINO [modificadores...]
+    VALKYRIA_FALSO_LOG      grabación a reproducir (obligatoria)
+    VALKYRIA_FALSO_LINEAS   líneas por segundo (0 = lo más rápido posible)
+    VALKYRIA_FALSO_MBPS     o bien MB/s según los tamaños de las líneas de archivo
+    VALKYRIA_FALSO_RC       código de retorno (por defecto 1, copiado sin errores)
+
+suite.py lo pone en el PATH con el nombre robocopy.
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analizador import RobocopyParser
+
+TICK = 0.01     # solo se duerme si va más de 10 ms adelantado, no en cada línea
+
+
+def replay(lines, out, lines_per_sec=0.0, mbps=0.0):
+    parser = RobocopyParser() if mbps else None
+    t0 = time.monotonic()
+    for n, line in enumerate(lines, 1):
+        out.write(line)
+        if lines_per_sec:
+            ahead = n / lines_per_sec - (time.monotonic() - t0)
+        elif parser is not None:
+            parser.feed(line)
+            ahead = parser.metrics.bytes_done / (mbps * 1e6) - (time.monotonic() - t0)
+        else:
+            continue
+        # Adelantado respecto al ritmo pedido: se espera a que el reloj lo alcance
+        if ahead > TICK:
+            out.flush()
+            time.sleep(ahead)
+    out.flush()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    log = os.environ.get("VALKYRIA_FALSO_LOG")
+    if not log:
+        sys.stderr.write("robocopy_falso: falta VALKYRIA_FALSO_LOG\n")
+        return 16
+    with open(log, encoding="utf-8", errors="replace") as f:
+        lines = f.readlines()
+    replay(lines, sys.stdout, float(os.environ.get("VALKYRIA_FALSO_LINEAS") or 0),
+           float(os.environ.get("VALKYRIA_FALSO_MBPS") or 0))
+    return int(os.environ.get("VALKYRIA_FALSO_RC") or 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
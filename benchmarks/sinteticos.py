@@ -0,0 +1,111 @@
+# sinteticos.py
+"""
+Árboles de prueba reproducibles para los benchmarks. Con la misma forma,
+escala y semilla salen siempre los mismos nombres, tamaños y contenidos;
+si el árbol ya existe con esos parámetros se reutiliza.
+"""
+import os, json, random
+
+MARKER = ".valkyria_bench.json"
+# Contenido: la mitad de los archivos texto comprimible, la otra mitad aleatorio
+_LINE = b"2024-01-01 12:00:00 INFO Copiando archivo de prueba con datos repetitivos\n"
+
+SHAPES = {
+    # forma: (archivos, carpetas, profundidad máxima, tamaño mínimo, tamaño máximo) a escala 1
+    "pequenos": (20000, 400, 3, 512, 16 * 1024),
+    "grandes": (4, 1, 1, 128 * 1024 * 1024, 256 * 1024 * 1024),
+    "profundo": (3000, 600, 40, 1024, 64 * 1024),
+}
+
+
+def _content(rng, size, random_block, text_block):
+    # Bloques de 1 MB reutilizados: generar 1 GB de aleatorio real tardaría más que el benchmark
+    block = random_block if rng.random() < 0.5 else text_block
+    offset = rng.randrange(len(block) // 2)
+    while size > 0:
+        piece = block[offset:offset + size]
+        yield piece
+        size -= len(piece)
+        offset = 0
+
+
+def _dirs(rng, count, max_depth):
+    # Carpetas relativas: cadenas de hasta max_depth niveles colgando unas de otras
+    dirs = [""]
+    for i in range(count):
+        parent = rng.choice(dirs)
+        if parent.count("/") + 1 >= max_depth:
+            parent = ""
+        dirs.append(f"{parent}/d{i:04d}" if parent else f"d{i:04d}")
+    return dirs
+
+
+def make_tree(root, shape, scale=1.0, seed=0):
+    """
+    Crea (o reutiliza) el árbol shape en root. Devuelve
+    {"shape", "scale", "seed", "files", "dirs", "bytes"}.
+    """
+    files, ndirs, depth, min_size, max_size = SHAPES[shape]
+    params = {"shape": shape, "scale": scale, "seed": seed}
+    marker = os.path.join(root, MARKER)
+    try:
+        with open(marker, encoding="utf-8") as f:
+            info = json.load(f)
+        if all(info.get(k) == v for k, v in params.items()):
+            return info
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(f"{shape}:{seed}")
+    if shape == "grandes":
+        # Los archivos enormes se escalan en tamaño, no en número
+        min_size, max_size = int(min_size * scale), int(max_size * scale)
+    else:
+        files, ndirs = max(1, int(files * scale)), max(1, int(ndirs * scale))
+    random_block = random.Random(seed).randbytes(1024 * 1024)
+    text_block = (_LINE * (2 * 1024 * 1024 // len(_LINE) + 1))[:2 * 1024 * 1024]
+    dirs = _dirs(rng, ndirs, depth)
+    for d in dirs:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    total = 0
+    for i in range(files):
+        size = rng.randint(min_size, max_size)
+        path = os.path.join(root, rng.choice(dirs), f"f{i:06d}.dat")
+        with open(path, "wb") as f:
+            for piece in _content(rng, size, random_block, text_block):
+                f.write(piece)
+        total += size
+    info = dict(params, files=files, dirs=len(dirs), bytes=total)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+def tree_files(root):
+    # Rutas relativas de los archivos del árbol (sin el marcador), en orden estable
+    out = []
+    for base, dirs, names in os.walk(root):
+        dirs.sort()
+        for name in sorted(names):
+            if name != MARKER:
+                out.append(os.path.relpath(os.path.join(base, name), root))
+    return out
+
+
+def perturb_copy(src_files, dst_root, seed=0, changed=0.05, removed=0.02, extra=0.02):
+    """
+    Toca una copia ya hecha para que la comparación tenga trabajo: reescribe
+    una parte de los archivos, borra otra y añade extras.
+    """
+    rng = random.Random(f"perturbar:{seed}")
+    for rel in src_files:
+        path = os.path.join(dst_root, rel)
+        r = rng.random()
+        if r < changed:
+            with open(path, "ab") as f:
+                f.write(b"cambio\n")
+        elif r < changed + removed:
+            os.remove(path)
+        elif r < changed + removed + extra:
+            with open(path + ".extra", "wb") as f:
+                f.write(b"extra\n")
@@ -0,0 +1,429 @@
+# suite.py
+"""
+Banco de pruebas de rendimiento: copia (motor nativo y robocopy falso),
+diferencias, análisis del log, comandos y cifrado sobre árboles sintéticos
+(sinteticos.py). Cada caso corre en su propio proceso, así el pico de memoria
+(RSS) es solo suyo. Mientras se copia, un bucle como el de Tk con el LogSink
+de la interfaz mide cuánto tarda en responder (latidos cada 16 ms).
+El resultado se guarda en JSON para comparar entre versiones.
+
+Uso: python benchmarks/suite.py [--scale 0.1] [--cases copia_nativa,diferencias]
+                                [--work DIR] [--out resultado.json] [--compare anterior.json]
+                                [--grabacion log_de_robocopy.txt]
+
+Funciona en cualquier Linux: robocopy se sustituye por robocopy_falso.py.
+"""
+import os, sys, json, time, heapq, shutil, platform, argparse, resource, itertools, subprocess, threading, tempfile, timeit
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+from sinteticos import make_tree, tree_files, perturb_copy
+
+HEARTBEAT_MS = 16
+FAKE_RATE = 5000        # líneas/s del caso robocopy_falso_ritmo (un robocopy con archivos pequeños)
+
+
+# ---------- bucle de interfaz ----------
+
+class BucleUI:
+    """
+    Imita el hilo de Tk: after()/after_cancel() y lo mínimo de un Text
+    (insert, get, delete, see) para el LogSink. Un latido reprogramado cada
+    HEARTBEAT_MS apunta con cuánto retraso llega: eso es lo que el usuario
+    nota como interfaz trabada.
+    """
+
+    def __init__(self):
+        self._timers = []
+        self._ids = itertools.count()
+        self._cancelled = set()
+        self._lines = [""]
+        self.delays = []
+
+    def after(self, ms, fn):
+        tid = next(self._ids)
+        heapq.heappush(self._timers, (time.perf_counter() + ms / 1000, tid, fn))
+        return tid
+
+    def after_cancel(self, tid):
+        self._cancelled.add(tid)
+
+    def insert(self, index, text, tag=None):
+        parts = text.split("\n")
+        self._lines[-1] += parts[0]
+        self._lines.extend(parts[1:])
+
+    def get(self, start, end):
+        n = int(end.split(".")[0]) - 1
+        return "".join(line + "\n" for line in self._lines[:n])
+
+    def delete(self, start, end):
+        del self._lines[:int(end.split(".")[0]) - 1]
+
+    def see(self, index):
+        pass
+
+    def _beat(self):
+        due = time.perf_counter() + HEARTBEAT_MS / 1000
+        self.after(HEARTBEAT_MS, lambda: (self.delays.append(time.perf_counter() - due), self._beat()))
+
+    def run(self, done):
+        self._beat()
+        while not done.is_set():
+            due, tid, fn = self._timers[0]
+            wait = due - time.perf_counter()
+            if wait > 0:
+                done.wait(min(wait, 0.05))
+                continue
+            heapq.heappop(self._timers)
+            if tid in self._cancelled:
+                self._cancelled.discard(tid)
+                continue
+            fn()
+
+    def latency(self):
+        if not self.delays:
+            return {}
+        d = sorted(self.delays)
+        pick = lambda q: round(d[min(len(d) - 1, int(q * len(d)))] * 1000, 2)
+        return {"ui_latidos": len(d), "ui_p50_ms": pick(0.5), "ui_p99_ms": pick(0.99), "ui_max_ms": round(d[-1] * 1000, 2)}
+
+
+# ---------- preparación (proceso principal) ----------
+
+def _tree(work, shape, scale):
+    return os.path.join(work, "arboles", f"{shape}-{scale:g}")
+
+
+def _recording(work, shape, scale):
+    return os.path.join(work, f"grabacion-{shape}-{scale:g}.log")
+
+
+def prepare(work, scale, cases, recording=None):
+    from motores import NativeBackend
+    from comandos import build_cmd
+    shapes = {"pequenos"}
+    if any(c.startswith("copia_nativa") or c == "diferencias" for c in cases):
+        shapes |= {"profundo"}
+    if any(c.startswith(("copia_nativa_grandes", "cifrado", "copia_delta", "multidestino")) for c in cases):
+        shapes |= {"grandes"}
+    for shape in sorted(shapes):
+        info = make_tree(_tree(work, shape, scale), shape, scale)
+        print(f"árbol {shape}: {info['files']} archivos, {info['dirs']} carpetas, {info['bytes'] / 1e6:.0f} MB", file=sys.stderr)
+    log = _recording(work, "pequenos", scale)
+    if recording:
+        shutil.copyfile(recording, log)
+    elif not os.path.exists(log):
+        # La grabación por defecto: lo que diría robocopy /L /V del árbol de archivos pequeños
+        empty = tempfile.mkdtemp(dir=work)
+        with open(log, "w", encoding="utf-8") as f:
+            NativeBackend().run(build_cmd(_tree(work, "pequenos", scale), empty, "/E", "/L", "/V"), f.write)
+        os.rmdir(empty)
+    if "diferencias" in cases:
+        dst = os.path.join(work, f"diferencias-destino-{scale:g}")
+        if not os.path.isdir(dst):
+            src = _tree(work, "profundo", scale)
+            shutil.copytree(src, dst)
+            perturb_copy(tree_files(src), dst)
+
+
+def _fake_robocopy_path(work):
+    # Carpeta con un "robocopy" que lanza robocopy_falso.py, para ponerla delante en el PATH
+    bin_dir = os.path.join(work, "bin")
+    shim = os.path.join(bin_dir, "robocopy")
+    os.makedirs(bin_dir, exist_ok=True)
+    with open(shim, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "robocopy_falso.py")}" "$@"\n')
+    os.chmod(shim, 0o755)
+    return bin_dir
+
+
+# ---------- casos (cada uno en su proceso) ----------
+
+def _copy_with_ui(work, src, backend_factory, extra=(), checkpoints=True):
+    """
+    Una copia por el planificador con el mismo camino que la interfaz
+    (run_cmd -> Scheduler -> on_line -> analizador + LogSink).
+    """
+    from comandos import build_cmd
+    from planificador import Scheduler
+    from analizador import RobocopyParser
+    from registro import LogSink
+
+    dst = tempfile.mkdtemp(prefix="destino-", dir=work)
+    ui = BucleUI()
+    sink = LogSink(ui, spill_path=os.path.join(work, "derrame.txt"))
+    parser = RobocopyParser()
+    lines = [0]
+
+    def on_line(job, line):
+        lines[0] += 1
+        parser.feed(line)
+        sink.put(line)
+
+    sched = Scheduler(db_path=":memory:", backend_factory=backend_factory, on_line=on_line, checkpoints=checkpoints)
+    done = threading.Event()
+    job = sched.submit(build_cmd(src, dst, "/E", *extra))
+    threading.Thread(target=lambda: (sched.wait(job), done.set()), daemon=True).start()
+    t0 = time.perf_counter()
+    sink.start()
+    sched.start()
+    ui.run(done)
+    elapsed = time.perf_counter() - t0
+    sink.drain()
+    sink.close()
+    sched.stop()
+    shutil.rmtree(dst, ignore_errors=True)
+    m = parser.metrics
+    return dict(ui.latency(), segundos=round(elapsed, 3), rc=job.rc, lineas=lines[0],
+                lineas_s=round(lines[0] / elapsed), archivos=m.files_done,
+                archivos_s=round(m.files_done / elapsed), mb_s=round(m.bytes_done / elapsed / 1e6, 1))
+
+
+def case_copia_nativa(work, scale, shape, extra=()):
+    from motores import NativeBackend
+    return _copy_with_ui(work, _tree(work, shape, scale), NativeBackend, extra)
+
+
+def case_robocopy_falso(work, scale, rate=0):
+    # Sin diario: con él el planificador partiría el trabajo y cada parte repetiría la grabación entera
+    from motores import RobocopyBackend
+    os.environ["PATH"] = _fake_robocopy_path(work) + os.pathsep + os.environ["PATH"]
+    os.environ["VALKYRIA_FALSO_LOG"] = _recording(work, "pequenos", scale)
+    os.environ["VALKYRIA_FALSO_LINEAS"] = str(rate)
+    return _copy_with_ui(work, _tree(work, "pequenos", scale), RobocopyBackend, checkpoints=False)
+
+
+def case_diferencias(work, scale):
+    from diferencias import diff_trees
+    t0 = time.perf_counter()
+    result = diff_trees(_tree(work, "profundo", scale), os.path.join(work, f"diferencias-destino-{scale:g}"))
+    elapsed = time.perf_counter() - t0
+    files = sum(result.counts.values())
+    return {"segundos": round(elapsed, 3), "archivos": files, "archivos_s": round(files / elapsed), **result.counts}
+
+
+def case_analizador(work, scale):
+    from analizador import RobocopyParser
+    with open(_recording(work, "pequenos", scale), encoding="utf-8") as f:
+        lines = f.readlines()
+    rounds = max(1, 200000 // max(1, len(lines)))
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        parser = RobocopyParser()
+        for line in lines:
+            parser.feed(line)
+    elapsed = time.perf_counter() - t0
+    return {"segundos": round(elapsed, 3), "lineas": len(lines) * rounds,
+            "lineas_s": round(len(lines) * rounds / elapsed)}
+
+
+def case_comandos(work, scale):
+    from comandos import build_cmd
+    from motor_nativo import parse_robocopy_args
+    n = 20000
+    build = timeit.timeit(lambda: build_cmd("C:/origen", "E:/destino", "/MIR", "/XF", "*.tmp", "*.bak", "/XD", "node_modules"), number=n)
+    parse = timeit.timeit(lambda: parse_robocopy_args(["/MIR", "/MT:16", "/XF", "*.tmp", "/XD", "node_modules", "/R:3"]), number=n)
+    return {"build_cmd_us": round(build / n * 1e6, 2), "parse_args_us": round(parse / n * 1e6, 2)}
+
+
+def _touch_blocks(src, stamp):
+    # Unos pocos KB cambiados en medio de cada archivo grande, con fecha posterior (más allá de /FFT)
+    for rel in tree_files(src):
+        path = os.path.join(src, rel)
+        with open(path, "r+b") as f:
+            f.seek(os.path.getsize(path) // 2)
+            f.write(os.urandom(4096))
+        os.utime(path, (stamp, stamp))
+
+
+def case_copia_delta(work, scale):
+    """
+    Archivos grandes ya copiados que cambian en unos KB: copia completa
+    frente a /DELTA sin firma (lee el destino) y con firma en caché.
+    """
+    from motores import NativeBackend
+    from comandos import build_cmd
+    from telemetria import TELEMETRY
+    os.environ["VALKYRIA_HOME"] = tempfile.mkdtemp(prefix="datos-", dir=work)   # firmas.sqlite aparte
+    src = tempfile.mkdtemp(prefix="delta-origen-", dir=work)
+    dst = src.replace("origen", "destino")
+    shutil.rmtree(src)
+    shutil.copytree(_tree(work, "grandes", scale), src)
+    shutil.copytree(src, dst)
+    size = sum(os.path.getsize(os.path.join(src, rel)) for rel in tree_files(src))
+    stamp = time.time()
+    result = {"mb": round(size / 1e6, 1)}
+    for name, extra in (("completa", ()), ("delta", ("/DELTA:1",)), ("delta_firma", ("/DELTA:1",))):
+        stamp += 10
+        _touch_blocks(src, stamp)
+        written = TELEMETRY.counters.get(("delta_bytes_written", ()), 0)
+        t0 = time.perf_counter()
+        NativeBackend().run(build_cmd(src, dst, "/E", *extra), lambda line: None)
+        result[f"{name}_s"] = round(time.perf_counter() - t0, 3)
+        if extra:
+            result[f"{name}_escrito_mb"] = round((TELEMETRY.counters.get(("delta_bytes_written", ()), 0) - written) / 1e6, 1)
+    shutil.rmtree(src, ignore_errors=True)
+    shutil.rmtree(dst, ignore_errors=True)
+    return result
+
+
+def case_multidestino(work, scale, targets=3):
+    """
+    El mismo origen a varios destinos: una copia nativa por destino frente a
+    una sola con /TO: (un recorrido y una lectura del origen).
+    """
+    from motores import NativeBackend
+    from multidestino import FanOutBackend, build_fanout_cmd
+    from comandos import build_cmd
+    from telemetria import TELEMETRY
+    src = _tree(work, "grandes", scale)
+    size = sum(os.path.getsize(os.path.join(src, rel)) for rel in tree_files(src))
+    result = {"mb": round(size / 1e6, 1), "destinos": targets}
+    dsts = [tempfile.mkdtemp(prefix=f"multi-{i}-", dir=work) for i in range(targets)]
+    t0 = time.perf_counter()
+    for dst in dsts:
+        NativeBackend().run(build_cmd(src, dst, "/E", "/MT:8"), lambda line: None)
+    result["separadas_s"] = round(time.perf_counter() - t0, 3)
+    for dst in dsts:
+        shutil.rmtree(dst, ignore_errors=True)
+    read = TELEMETRY.counters.get(("fanout_bytes_read", ()), 0)
+    t0 = time.perf_counter()
+    FanOutBackend().run(build_fanout_cmd(src, [(dst, ["/E"]) for dst in dsts]) + ["/MT:8"], lambda line: None)
+    result["una_lectura_s"] = round(time.perf_counter() - t0, 3)
+    result["leido_mb"] = round((TELEMETRY.counters.get(("fanout_bytes_read", ()), 0) - read) / 1e6, 1)
+    for dst in dsts:
+        shutil.rmtree(dst, ignore_errors=True)
+    return result
+
+
+def case_cifrado(work, scale, workers):
+    from cifrado import encrypt_folder_to_file
+    src = _tree(work, "grandes", scale)
+    out = tempfile.mkdtemp(prefix="cifrado-", dir=work)
+    size = sum(os.path.getsize(os.path.join(src, rel)) for rel in tree_files(src))
+    t0 = time.perf_counter()
+    enc, _ = encrypt_folder_to_file(src, out, key_path=os.path.join(out, "bench.key"), workers=workers)
+    elapsed = time.perf_counter() - t0
+    result = {"segundos": round(elapsed, 3), "mb_s": round(size / elapsed / 1e6, 1),
+              "salida_mb": round(os.path.getsize(enc) / 1e6, 1), "workers": workers}
+    shutil.rmtree(out, ignore_errors=True)
+    return result
+
+
+def case_deduplicado(work, scale):
+    from deduplicado import backup
+    src = _tree(work, "pequenos", scale)
+    store = tempfile.mkdtemp(prefix="almacen-", dir=work)
+    t0 = time.perf_counter()
+    _, _, stats = backup(src, store, name="bench")
+    elapsed = time.perf_counter() - t0
+    shutil.rmtree(store, ignore_errors=True)
+    return {"segundos": round(elapsed, 3), "mb_s": round(stats["bytes_read"] / elapsed / 1e6, 1),
+            "archivos_s": round(stats["files"] / elapsed), "trozos": stats["chunks"],
+            "almacenado_mb": round(stats["bytes_stored"] / 1e6, 1)}
+
+
+CASES = {
+    "comandos": case_comandos,
+    "analizador": case_analizador,
+    "copia_nativa_pequenos": lambda w, s: case_copia_nativa(w, s, "pequenos"),
+    "copia_nativa_profundo": lambda w, s: case_copia_nativa(w, s, "profundo"),
+    "copia_nativa_grandes": lambda w, s: case_copia_nativa(w, s, "grandes"),
+    "copia_nativa_paquetes": lambda w, s: case_copia_nativa(w, s, "pequenos", ["/BUNDLE"]),
+    "copia_delta": case_copia_delta,
+    "multidestino": case_multidestino,
+    "robocopy_falso": lambda w, s: case_robocopy_falso(w, s),
+    "robocopy_falso_ritmo": lambda w, s: case_robocopy_falso(w, s, FAKE_RATE),
+    "diferencias": case_diferencias,
+    "cifrado_1": lambda w, s: case_cifrado(w, s, 1),
+    "cifrado_n": lambda w, s: case_cifrado(w, s, os.cpu_count() or 1),
+    "deduplicado": case_deduplicado,
+}
+
+
+def run_child(name, work, scale):
+    os.environ["VALKYRIA_HOME"] = os.path.join(work, "home")
+    result = CASES[name](work, scale)
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["rss_pico_mb"] = round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    print(json.dumps(result))
+
+
+# ---------- informe ----------
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(HERE),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    # Diferencia en % de cada métrica numérica común; el signo bueno depende de la métrica (s y ms: menos es mejor)
+    for name, metrics in new["casos"].items():
+        before = old.get("casos", {}).get(name)
+        if not before or "error" in metrics:
+            continue
+        print(f"\n{name}")
+        for key, value in metrics.items():
+            prev = before.get(key)
+            if isinstance(value, (int, float)) and isinstance(prev, (int, float)) and prev:
+                print(f"  {key:<14} {prev:>12g} -> {value:<12g} {(value - prev) / prev * 100:+7.1f}%")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks de Valkyria")
+    ap.add_argument("--scale", type=float, default=0.1, help="Tamaño de los árboles (1 = 20000 archivos pequeños, ~800 MB grandes)")
+    ap.add_argument("--cases", help=f"Casos separados por comas (por defecto todos: {', '.join(CASES)})")
+    ap.add_argument("--work", help="Carpeta de trabajo (se reutilizan los árboles entre ejecuciones)")
+    ap.add_argument("--out", help="Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>.json)")
+    ap.add_argument("--compare", help="Resultado anterior con el que comparar")
+    ap.add_argument("--grabacion", help="Log real de robocopy para el robocopy falso (por defecto, /L /V del árbol)")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    work = os.path.abspath(args.work or os.path.join(tempfile.gettempdir(), "valkyria_bench"))
+    os.makedirs(work, exist_ok=True)
+    if args.child:
+        run_child(args.child, work, args.scale)
+        return 0
+
+    cases = args.cases.split(",") if args.cases else list(CASES)
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        ap.error(f"casos desconocidos: {', '.join(unknown)}")
+    prepare(work, args.scale, cases, args.grabacion)
+
+    report = {
+        "fecha": datetime.now().isoformat(timespec="seconds"), "commit": _git_rev(), "escala": args.scale,
+        "python": platform.python_version(), "sistema": platform.platform(), "cpus": os.cpu_count(),
+        "casos": {},
+    }
+    for name in cases:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--work", work,
+                               "--scale", str(args.scale)], capture_output=True, text=True)
+        try:
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = {"error": (proc.stderr.strip().splitlines() or ["sin salida"])[-1]}
+        report["casos"][name] = result
+        print(f"{name:<24} " + "  ".join(f"{k}={v}" for k, v in result.items()), file=sys.stderr)
+
+    out = args.out or os.path.join(HERE, "resultados", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados: {out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0 if all("error" not in r for r in report["casos"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
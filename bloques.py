@@ -0,0 +1,182 @@
+# bloques.py
+import os, sqlite3, hashlib, threading
+from rutas import app_dir
+
+# Copia delta por bloques (/DELTA[:MB], propio de Valkyria; lo aplica el motor
+# nativo). Un disco de VM o un PST de 50 GB que ha cambiado en unos MB no se
+# vuelve a copiar entero: el archivo se trata en bloques de BLOCK_SIZE, se
+# compara el hash de cada bloque del origen con el del destino y solo se
+# escriben, en su sitio, los bloques distintos (y se recorta o se alarga el
+# final si cambió el tamaño).
+#
+# La firma del destino (el hash de cada bloque) se guarda en firmas.sqlite con
+# el tamaño y la fecha con que quedó el archivo: mientras el destino no cambie,
+# la siguiente pasada no tiene que leerlo, solo leer el origen. Sin firma (o si
+# el destino lo tocó otro) se lee el destino una vez y se compara byte a byte.
+#
+# Los bloques se comparan alineados, como cambian los discos de VM, los PST o
+# las bases de datos (se reescriben en su sitio). Si se insertan datos en medio
+# del archivo, todo lo que queda detrás se reescribe.
+#
+# El destino se parchea en su sitio. Antes del primer bloque escrito (y tras
+# cada uno, porque escribir pone la fecha de ahora) se le pone la fecha
+# UNFINISHED_MTIME_NS, como hace robocopy con los archivos a medias: si la
+# copia se corta, el archivo queda más viejo que el origen y la siguiente
+# pasada lo vuelve a comparar entero, también con /XO. La fecha buena se la
+# pone el motor (shutil.copystat) solo al terminar.
+DELTA = "/DELTA"
+UNFINISHED_MTIME_NS = 315532800 * 10 ** 9     # 1980-01-01
+_UTIME_FD = os.utime in os.supports_fd
+DEFAULT_THRESHOLD = 64 * 1024 * 1024    # tamaño mínimo para copiar por bloques
+BLOCK_SIZE = 1024 * 1024
+DIGEST_SIZE = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+    block INTEGER NOT NULL, hashes BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def wants_delta(cmd):
+    return any(a.upper().split(":")[0] == DELTA for a in cmd)
+
+
+def block_hash(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class SignatureCache:
+    """
+    Firmas por bloques de los archivos de destino, por (ruta, tamaño, mtime).
+    Se comparte entre los hilos de copia.
+    """
+
+    def __init__(self, db_path=None):
+        self.conn = sqlite3.connect(db_path or os.path.join(app_dir(), "firmas.sqlite"), check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, path, st, block=BLOCK_SIZE):
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime_ns, block, hashes FROM signatures WHERE path=?",
+                                    (self._key(path),)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns and row[2] == block:
+            return row[3]
+        return None
+
+    def put(self, path, size, mtime_ns, block, hashes):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?)",
+                              (self._key(path), size, mtime_ns, block, bytes(hashes)))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _read_full(f, buf):
+    # Bloque completo salvo al final del archivo: las firmas dependen de que los bloques no se desplacen
+    view = memoryview(buf)
+    got = 0
+    while got < len(buf):
+        n = f.readinto(view[got:])
+        if not n:
+            break
+        got += n
+    return got
+
+
+def _write_all(f, data):
+    while data:
+        data = data[f.write(data):]
+
+
+def _mark_unfinished(f, path):
+    if _UTIME_FD:
+        os.utime(f.fileno(), ns=(UNFINISHED_MTIME_NS, UNFINISHED_MTIME_NS))
+    else:
+        os.utime(path, ns=(UNFINISHED_MTIME_NS, UNFINISHED_MTIME_NS))
+
+
+class DeltaResult:
+    def __init__(self, size):
+        self.size = size
+        self.blocks = 0
+        self.changed = 0
+        self.written = 0
+        self.read_dst = 0
+        self.cached = False
+
+    def summary(self):
+        source = "firma en caché" if self.cached else f"{self.read_dst} bytes leídos del destino"
+        return f"{self.changed}/{self.blocks} bloques, {self.written} bytes escritos, {source}"
+
+
+def delta_copy(src_path, dst_path, src_st, cache=None, block=BLOCK_SIZE, on_block=None, cancel=None, sync=False):
+    """
+    Actualiza dst_path (que ya existe) para que sea igual a src_path
+    escribiendo solo los bloques distintos. src_st es el stat del origen: con
+    su tamaño y su fecha se guarda la firma, porque el motor pone esa fecha al
+    destino al terminar (shutil.copystat). on_block(n) se llama con lo que se
+    lee del destino y lo que se escribe en él. Con sync, fsync al terminar.
+    Devuelve un DeltaResult, o None si se canceló a medias (sin firma: el
+    destino no debe quedar con la fecha del origen).
+    """
+    result = DeltaResult(src_st.st_size)
+    with open(src_path, "rb", buffering=0) as fsrc, open(dst_path, "r+b", buffering=0) as fdst:
+        dst_size = os.fstat(fdst.fileno()).st_size
+        old = cache.get(dst_path, os.fstat(fdst.fileno()), block) if cache is not None else None
+        result.cached = old is not None
+        hashes = bytearray()
+        buf, other = bytearray(block), bytearray(block)
+        view = memoryview(buf)
+        offset = 0
+        while True:
+            if cancel is not None and cancel.is_set():
+                return None
+            n = _read_full(fsrc, buf)
+            if not n:
+                break
+            data = view[:n]
+            digest = block_hash(data)
+            hashes += digest
+            i = result.blocks
+            result.blocks += 1
+            if offset + n > dst_size:
+                same = False
+            elif old is not None:
+                same = old[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] == digest
+            else:
+                fdst.seek(offset)
+                m = _read_full(fdst, other)
+                result.read_dst += m
+                if on_block:
+                    on_block(m)
+                same = m == n and other[:n] == data
+            if not same:
+                if not result.changed:
+                    _mark_unfinished(fdst, dst_path)
+                fdst.seek(offset)
+                _write_all(fdst, data)
+                _mark_unfinished(fdst, dst_path)
+                result.changed += 1
+                result.written += n
+                if on_block:
+                    on_block(n)
+            offset += n
+        if offset < dst_size:
+            fdst.truncate(offset)
+            _mark_unfinished(fdst, dst_path)
+        if sync and (result.changed or offset < dst_size):
+            os.fsync(fdst.fileno())
+    if cache is not None:
+        cache.put(dst_path, src_st.st_size, src_st.st_mtime_ns, block, hashes)
+    return result
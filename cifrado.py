@@ -0,0 +1,287 @@
+# cifrado.py
+import os, io, time, zlib, struct, base64, zipfile, tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken
+from telemetria import TELEMETRY
+
+# Formato de archivo cifrado por bloques:
+#   cabecera: MAGIC + tamaño de bloque (>I)
+#   bloques:  longitud (>I) + token Fernet (en binario, sin base64)
+# Cada token cifra (índice >Q, flags >B) + datos, así un bloque reordenado,
+# repetido o un archivo truncado se detectan al descifrar.
+# En modo paralelo cada bloque se comprime con zlib por separado (FLAG_ZLIB)
+# y el ZIP interior va sin comprimir, así los bloques no dependen entre sí.
+MAGIC = b"VALKENC1"
+CHUNK_SIZE = 1024 * 1024
+FLAG_LAST = 0x01
+FLAG_ZLIB = 0x02
+ZLIB_LEVEL = 6
+
+_HEADER = struct.Struct(">I")
+_FRAME = struct.Struct(">I")
+_CHUNK_HEAD = struct.Struct(">QB")
+
+
+def generate_and_save_key(key_path):
+    key = Fernet.generate_key()
+    with open(key_path, "wb") as f:
+        f.write(key)
+    return key
+
+def load_key(key_path):
+    with open(key_path, "rb") as f:
+        return f.read()
+
+def resolve_key(out_dir, base_name, key_path=None):
+    """
+    Carga la clave indicada o genera una nueva junto al destino.
+    Devuelve (clave, ruta, creada).
+    """
+    if not key_path:
+        key_path = os.path.join(out_dir, f"{base_name}.key")
+    if not os.path.exists(key_path):
+        return generate_and_save_key(key_path), key_path, True
+    return load_key(key_path), key_path, False
+
+
+class EncryptedWriter(io.RawIOBase):
+    """
+    Stream de solo escritura: agrupa lo escrito en bloques de tamaño fijo
+    y escribe cada bloque cifrado en cuanto se llena.
+    Con workers > 1 los bloques se comprimen en un pool de procesos y se
+    cifran en un pool de hilos; la cola de bloques en vuelo está acotada
+    y la salida se escribe en orden.
+    Al cerrar pasa a telemetria los bytes cifrados y el tiempo que quien
+    escribe ha pasado esperando al cifrado (seal_seconds).
+    """
+
+    def __init__(self, fileobj, key, chunk_size=CHUNK_SIZE, workers=1):
+        self._out = fileobj
+        self._fernet = Fernet(key)
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+        self._index = 0
+        self._deflate_pool = self._aes_pool = None
+        self._pending = deque()
+        self.plain_bytes = 0
+        self.seal_seconds = 0.0
+        if workers > 1:
+            self._deflate_pool = ProcessPoolExecutor(workers)
+            self._aes_pool = ThreadPoolExecutor(workers)
+            self._max_pending = workers * 2
+        self._out.write(MAGIC + _HEADER.pack(chunk_size))
+
+    @property
+    def parallel(self):
+        return self._deflate_pool is not None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buf += data
+        self.plain_bytes += len(data)
+        while len(self._buf) >= self._chunk_size:
+            self._emit(bytes(self._buf[:self._chunk_size]), 0)
+            del self._buf[:self._chunk_size]
+        return len(data)
+
+    def _seal(self, index, flags, payload):
+        token = self._fernet.encrypt(_CHUNK_HEAD.pack(index, flags) + payload)
+        return base64.urlsafe_b64decode(token)
+
+    def _seal_compressed(self, index, flags, payload, compressed):
+        data = compressed.result()
+        # Si el bloque no comprime (ya estaba comprimido), se guarda tal cual
+        if len(data) < len(payload):
+            return self._seal(index, flags | FLAG_ZLIB, data)
+        return self._seal(index, flags, payload)
+
+    def _write_frame(self, raw):
+        self._out.write(_FRAME.pack(len(raw)) + raw)
+
+    def _emit(self, payload, flags):
+        t0 = time.perf_counter()
+        index = self._index
+        self._index += 1
+        if not self.parallel:
+            self._write_frame(self._seal(index, flags, payload))
+        else:
+            compressed = self._deflate_pool.submit(zlib.compress, payload, ZLIB_LEVEL)
+            self._pending.append(self._aes_pool.submit(self._seal_compressed, index, flags, payload, compressed))
+            # Cola acotada: si hay demasiados bloques en vuelo, se espera al más antiguo
+            while len(self._pending) > self._max_pending:
+                self._write_frame(self._pending.popleft().result())
+        self.seal_seconds += time.perf_counter() - t0
+
+    def _shutdown(self):
+        if self.parallel:
+            for fut in self._pending:
+                fut.cancel()
+            self._aes_pool.shutdown(wait=True)
+            self._deflate_pool.shutdown(wait=True)
+            self._deflate_pool = self._aes_pool = None
+
+    def abort(self):
+        # Cierra sin escribir el bloque final: el archivo queda inválido a propósito
+        self._shutdown()
+        super().close()
+
+    def close(self):
+        try:
+            if not self.closed and not self._out.closed:
+                # El último bloque siempre se marca, aunque vaya vacío
+                self._emit(bytes(self._buf), FLAG_LAST)
+                self._buf.clear()
+                t0 = time.perf_counter()
+                while self._pending:
+                    self._write_frame(self._pending.popleft().result())
+                self._out.flush()
+                self.seal_seconds += time.perf_counter() - t0
+                TELEMETRY.count("bytes_encrypted", self.plain_bytes)
+                TELEMETRY.observe("encrypt", self.seal_seconds)
+        finally:
+            self._shutdown()
+            super().close()
+
+
+def iter_decrypted_chunks(fileobj, key):
+    """
+    Lee un archivo cifrado por bloques y devuelve el texto plano bloque a bloque.
+    Lanza ValueError si el archivo está truncado, reordenado o la clave no es válida.
+    """
+    head = fileobj.read(len(MAGIC) + _HEADER.size)
+    if head[:len(MAGIC)] != MAGIC:
+        raise ValueError("No es un archivo cifrado por bloques de Valkyria")
+    f = Fernet(key)
+    expected = 0
+    while True:
+        size = fileobj.read(_FRAME.size)
+        if len(size) < _FRAME.size:
+            raise ValueError("Archivo cifrado truncado")
+        (length,) = _FRAME.unpack(size)
+        raw = fileobj.read(length)
+        if len(raw) < length:
+            raise ValueError("Archivo cifrado truncado")
+        try:
+            plain = f.decrypt(base64.urlsafe_b64encode(raw))
+        except InvalidToken:
+            raise ValueError("Clave incorrecta o bloque cifrado corrupto")
+        index, flags = _CHUNK_HEAD.unpack_from(plain)
+        if index != expected:
+            raise ValueError(f"Bloque fuera de orden: {index} (esperado {expected})")
+        expected += 1
+        if flags & FLAG_ZLIB:
+            yield zlib.decompress(plain[_CHUNK_HEAD.size:])
+        else:
+            yield plain[_CHUNK_HEAD.size:]
+        if flags & FLAG_LAST:
+            return
+
+
+def iter_folder_entries(folder_path, exclude=()):
+    """
+    Recorre la carpeta en orden estable y devuelve (ruta, nombre_en_zip).
+    Las carpetas se devuelven también para conservar las vacías.
+    """
+    exclude = {os.path.normcase(os.path.abspath(p)) for p in exclude if p}
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        rel_root = os.path.relpath(root, folder_path)
+        if rel_root != ".":
+            yield root, rel_root.replace(os.sep, "/") + "/"
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            if os.path.normcase(os.path.abspath(full)) in exclude:
+                continue
+            yield full, os.path.relpath(full, folder_path).replace(os.sep, "/")
+
+
+def write_zip_stream(stream, entries, compression=zipfile.ZIP_DEFLATED):
+    # ZipFile admite streams no posicionables: escribe descriptores de datos tras cada archivo
+    files = 0
+    with zipfile.ZipFile(stream, "w", compression=compression, allowZip64=True) as zf:
+        for full, arcname in entries:
+            zf.write(full, arcname)
+            files += 1
+    TELEMETRY.count("zip_entries", files)
+
+
+def encrypt_folder_to_file(folder_path, out_dir, key_path=None, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Comprime la carpeta a ZIP y lo cifra por bloques mientras se genera,
+    sin ZIP temporal y con memoria constante.
+    workers: núcleos para comprimir/cifrar (por defecto todos; 1 = un solo hilo).
+    Devuelve ruta del .enc y del .key (si se generó).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    base_name = os.path.basename(os.path.normpath(folder_path)) or "backup"
+    enc_path = os.path.join(out_dir, f"{base_name}.zip.enc")
+    key, key_path, key_created = resolve_key(out_dir, base_name, key_path)
+
+    # Se escribe a un .part y se renombra al final: nunca queda un .enc a medias
+    part_path = enc_path + ".part"
+    # El destino suele estar dentro de la carpeta a cifrar: no incluirse a sí mismo
+    exclude = (enc_path, part_path, key_path)
+    try:
+        with open(part_path, "wb") as ef:
+            writer = EncryptedWriter(ef, key, chunk_size, workers or os.cpu_count() or 1)
+            try:
+                t0 = time.perf_counter()
+                # En paralelo la compresión la hacen los bloques: el ZIP va sin comprimir
+                compression = zipfile.ZIP_STORED if writer.parallel else zipfile.ZIP_DEFLATED
+                write_zip_stream(writer, iter_folder_entries(folder_path, exclude), compression)
+                writer.close()
+                # Lo que no fue esperar al cifrado: leer los archivos y armar el ZIP
+                TELEMETRY.observe("zip", time.perf_counter() - t0 - writer.seal_seconds)
+            except BaseException:
+                writer.abort()
+                raise
+        os.replace(part_path, enc_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+
+    return enc_path, (key_path if key_created else None)
+
+
+def decrypt_file_to_zip(enc_path, zip_path, key_path):
+    """
+    Descifra un .zip.enc a un ZIP en disco bloque a bloque.
+    Acepta también el formato antiguo (un único token Fernet).
+    """
+    key = load_key(key_path)
+    with open(enc_path, "rb") as ef, open(zip_path, "wb") as zf:
+        if ef.read(len(MAGIC)) != MAGIC:
+            # Formato antiguo: todo el archivo es un token
+            ef.seek(0)
+            zf.write(Fernet(key).decrypt(ef.read()))
+            return zip_path
+        ef.seek(0)
+        for chunk in iter_decrypted_chunks(ef, key):
+            zf.write(chunk)
+    return zip_path
+
+
+def restore_encrypted(enc_path, target_dir, key_path):
+    """
+    Restaura un .zip.enc en la carpeta indicada.
+    El ZIP intermedio va a disco junto al destino, nunca a memoria.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    fd, zip_path = tempfile.mkstemp(suffix=".zip", dir=target_dir)
+    os.close(fd)
+    try:
+        decrypt_file_to_zip(enc_path, zip_path, key_path)
+        with zipfile.ZipFile(zip_path) as zf:
+            zf.extractall(target_dir)
+    finally:
+        try:
+            os.remove(zip_path)
+        except OSError:
+            pass
+    return target_dir
@@ -0,0 +1,247 @@
+# cli.py
+"""
+Ejecución sin interfaz a partir de un archivo de trabajos (TOML o JSON),
+pensada para el Programador de tareas, cron o CI.
+
+Uso: python cli.py trabajos.toml [--backend nativo] [--summary resumen.json] [--bandwidth MB/s] [--no-history]
+                   [--metrics valkyria.prom|metricas.jsonl] [-v]
+
+Ejemplo de trabajos.toml:
+
+    [[jobs]]
+    name = "documentos"
+    src = "C:/Users/ana/Documents"
+    dst = "E:/Backup/Documents"
+    mode = "mirror"                 # ver comandos.MODES
+    threads = 8                     # /MT:n (sin él, el perfil del volumen)
+    exclude_dirs = ["node_modules"] # /XD
+    shards = 4                      # procesos a la vez por subcarpetas (particiones.py)
+    bandwidth = 20                  # tope en MB/s (ancho_banda.py)
+    run_hours = "1900-0700"         # /RH: fuera de ese horario espera o se pausa
+    bundle = 64                     # archivos de hasta 64 KB en paquetes (paquetes.py, motor nativo)
+    delta = 256                     # archivos desde 256 MB ya copiados: solo los bloques cambiados (bloques.py)
+    encrypt = true                  # instantánea cifrada al terminar
+    profile = true                  # perfil cProfile + tracemalloc de la copia (telemetria.py)
+    verify = true                   # comparar por hash origen y destino al terminar
+    # Más destinos con una sola lectura del origen (multidestino.py, motor nativo),
+    # cada uno con su modo y sus filtros; verify y encrypt son del primer destino
+    also = [{dst = "F:/Rotacion/Documents", mode = "incremental"},
+            {dst = "//remoto/copias/Documents", mode = "mirror", exclude_files = ["*.tmp"]}]
+
+    [[jobs]]
+    name = "equipo"
+    src = "C:/Users"
+    dst = "//nas/almacen"
+    target = "dedup"                # almacén deduplicado (deduplicado.py) en vez de robocopy
+    dedup_name = "pc01-usuarios"    # cadena de copias (por defecto equipo-carpeta)
+
+No importa tkinter, y cryptography solo si algún trabajo pide cifrado o almacén
+deduplicado.
+Cada resultado lleva en "metrics" los segundos por fase (listar, copiar,
+purgar...). Con --metrics se vuelcan también los contadores de todo el proceso
+en texto de Prometheus o, si el archivo acaba en .jsonl, en JSON lines.
+Escribe en stdout un resumen JSON y sale con 0 si todo fue bien, 1 si algún
+trabajo falló y 2 si el archivo de trabajos no es válido.
+"""
+import os, sys, json, time, argparse
+from comandos import MODES, build_cmd
+from multidestino import build_fanout_cmd
+from ancho_banda import split_bandwidth_arg, split_run_hours
+from telemetria import PROFILE, Exporter
+
+# Claves del trabajo que se traducen a modificadores de robocopy
+OPTION_FLAGS = {
+    "threads": "/MT:{}",
+    "retries": "/R:{}",
+    "wait": "/W:{}",
+    "max_age": "/MAXAGE:{}",
+    "min_age": "/MINAGE:{}",
+    "min_size": "/MIN:{}",
+    "max_size": "/MAX:{}",
+    "log": "/LOG:{}",
+    "shards": "/SHARDS:{}",
+    "bandwidth": "/BW:{}",
+    "run_hours": "/RH:{}",
+    "bundle": "/BUNDLE:{}",
+    "delta": "/DELTA:{}",
+}
+
+
+class JobFileError(ValueError):
+    pass
+
+
+def load_jobs(path):
+    if path.lower().endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    jobs = data.get("jobs") if isinstance(data, dict) else data
+    if not isinstance(jobs, list) or not jobs:
+        raise JobFileError("El archivo no tiene una lista 'jobs'")
+    for i, job in enumerate(jobs, 1):
+        for key in ("src", "dst"):
+            if not job.get(key):
+                raise JobFileError(f"Trabajo {i}: falta '{key}'")
+        job.setdefault("name", f"trabajo{i}")
+        if job.get("target", "copy") not in ("copy", "dedup"):
+            raise JobFileError(f"Trabajo {job['name']}: target debe ser 'copy' o 'dedup'")
+        for spec in [job, *job.get("also", [])]:
+            if not spec.get("dst"):
+                raise JobFileError(f"Trabajo {job['name']}: a un destino de 'also' le falta 'dst'")
+            mode = spec.setdefault("mode", "incremental")
+            if mode not in MODES:
+                raise JobFileError(f"Trabajo {job['name']}: modo desconocido '{mode}' (válidos: {', '.join(MODES)})")
+        try:
+            split_run_hours(split_bandwidth_arg(job_flags(job))[0])
+        except ValueError as e:
+            raise JobFileError(f"Trabajo {job['name']}: {e}")
+    return jobs
+
+
+def job_flags(job):
+    flags = list(MODES[job["mode"]])
+    for key, fmt in OPTION_FLAGS.items():
+        if job.get(key) is not None:
+            flags.append(fmt.format(job[key]))
+    if job.get("exclude_files"):
+        flags += ["/XF", *job["exclude_files"]]
+    if job.get("exclude_dirs"):
+        flags += ["/XD", *job["exclude_dirs"]]
+    if job.get("profile"):
+        flags.append(PROFILE)
+    flags += list(job.get("flags", []))
+    return flags
+
+
+def run_jobs(jobs, backend=None, verbose=False, volume_limit=1, bandwidth=None, history=True):
+    """
+    Encola todos los trabajos en un planificador en memoria y espera.
+    Devuelve la lista de resultados (uno por trabajo).
+    """
+    from planificador import Scheduler, DONE
+    from motores import get_backend
+    from analizador import RobocopyParser
+    from autoajuste import VolumeProfiles
+    from historial import RunHistory
+
+    parsers = {}
+
+    def on_line(job, line):
+        parsers[job.id].feed(line)
+        if verbose:
+            sys.stderr.write(f"[{job.name}] {line}")
+
+    sched = Scheduler(db_path=":memory:", thread_budget=max(16, (os.cpu_count() or 1) * 4),
+                      volume_limit=volume_limit, on_line=on_line,
+                      backend_factory=lambda: get_backend(backend), tuner=VolumeProfiles(),
+                      bandwidth=bandwidth, history=RunHistory() if history else None)
+    submitted = []
+    for spec in jobs:
+        if spec.get("target") == "dedup":
+            continue
+        if spec.get("also"):
+            cmd = build_fanout_cmd(spec["src"], [(t["dst"], job_flags(t)) for t in [spec, *spec["also"]]])
+        else:
+            cmd = build_cmd(spec["src"], spec["dst"], *job_flags(spec))
+        job = sched.submit(cmd, priority=spec.get("priority", 0), name=spec["name"])
+        parsers[job.id] = RobocopyParser()
+        submitted.append((spec, job))
+    sched.start()
+
+    results = [dedup_job(spec) for spec in jobs if spec.get("target") == "dedup"]
+    for spec, job in submitted:
+        sched.wait(job)
+        metrics = parsers[job.id].metrics
+        metrics.finish()
+        result = {
+            "name": spec["name"], "src": spec["src"], "dst": spec["dst"], "mode": spec["mode"],
+            "also": [t["dst"] for t in spec.get("also", [])],
+            "state": job.state, "rc": job.rc, "threads": job.threads,
+            "elapsed": round((job.ended or time.time()) - (job.started or time.time()), 3),
+            "files_copied": metrics.files_done, "bytes_copied": metrics.bytes_done,
+            "failed": metrics.failed, "summary": metrics.summary, "history_run": job.run_id,
+            "metrics": job.metrics,
+        }
+        if spec.get("verify") and job.state == DONE:
+            result["verify"] = verify_job(spec)
+        if spec.get("encrypt") and job.state == DONE:
+            result["snapshot"] = encrypt(spec)
+        results.append(result)
+    sched.stop()
+    return results
+
+
+def dedup_job(spec):
+    # Import diferido, como encrypt: cryptography solo si hace falta
+    from deduplicado import backup
+    started = time.time()
+    result = {"name": spec["name"], "src": spec["src"], "dst": spec["dst"], "mode": "dedup"}
+    try:
+        snap_id, key_created, stats = backup(spec["src"], spec["dst"], spec.get("dedup_name"), spec.get("key"))
+        result.update(state="done", rc=0, snapshot={"id": snap_id, "key_created": key_created, **stats})
+    except Exception as e:
+        result.update(state="failed", rc=None, error=str(e))
+    result["elapsed"] = round(time.time() - started, 3)
+    return result
+
+
+def verify_job(spec):
+    from verificacion import verify
+    report = verify(spec["src"], spec["dst"], job_flags(spec), workers=min(32, (os.cpu_count() or 1) * 2),
+                    emit=lambda line: None)
+    return report.as_dict()
+
+
+def encrypt(spec):
+    # Import diferido: cryptography solo se carga si algún trabajo cifra
+    from instantaneas import create_snapshot
+    try:
+        snap_id, key_created, stats = create_snapshot(spec["dst"], out_dir=spec["dst"], key_path=spec.get("key"))
+        return {"id": snap_id, "key_created": key_created, **stats}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Valkyria sin interfaz: ejecuta un archivo de trabajos")
+    ap.add_argument("jobfile", help="Archivo .toml o .json con la lista de trabajos")
+    ap.add_argument("--backend", choices=("robocopy", "nativo"), help="Forzar backend de copia")
+    ap.add_argument("--summary", help="Guardar también el resumen JSON en este archivo")
+    ap.add_argument("--volume-limit", type=int, default=1, help="Trabajos a la vez por volumen")
+    ap.add_argument("--bandwidth", type=float, help="Tope en MB/s para todos los trabajos juntos")
+    ap.add_argument("--no-history", action="store_true", help="No guardar la salida en el historial de ejecuciones")
+    ap.add_argument("--metrics", help="Volcar tiempos por fase y contadores (.prom de Prometheus o .jsonl)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Mostrar la salida de la copia en stderr")
+    args = ap.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.jobfile)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False))
+        return 2
+
+    exporter = Exporter(args.metrics) if args.metrics else None
+    if exporter is not None:
+        exporter.start()
+    try:
+        results = run_jobs(jobs, backend=args.backend, verbose=args.verbose, volume_limit=args.volume_limit,
+                           bandwidth=args.bandwidth, history=not args.no_history)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+    ok = all(r["rc"] is not None and r["rc"] < 8 and "error" not in r.get("snapshot", {})
+             and r.get("verify", {}).get("ok", True) for r in results)
+    summary = json.dumps({"ok": ok, "jobs": results}, ensure_ascii=False, indent=2)
+    print(summary)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(summary)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
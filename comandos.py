@@ -39,9 +39,12 @@ class RobocopyFlags:
     # ============================================
 
     MULTITHREAD = "/MT:16"              # Copia usando 16 hilos (ajustable)
+    UNBUFFERED = "/J"                   # E/S sin búfer (recomendado para archivos grandes)
     RETRIES = "/R:3"                    # Reintentos por archivo fallido
     WAIT = "/W:5"                       # Espera entre reintentos (segundos)
     FILE_TIME_TOLERANCE = "/FFT"        # Tolerancia de tiempo para FAT/NTFS
+    INTER_PACKET_GAP = "/IPG:"          # Pausa en ms tras cada bloque de 64 KB (limita el ancho de banda)
+    RUN_HOURS = "/RH:"                  # Horario en que puede copiar (hhmm-hhmm)
 
     # ============================================
     # SALIDA / LOGS / VERBOSIDAD
@@ -67,3 +70,28 @@ class RobocopyFlags:
 
     EXCLUDE_JUNCTIONS = "/XJ"          # Excluye puntos de unión (junctions)
     COPY_LINKS = "/SL"                 # Copia los archivos apuntados por enlaces simbólicos
+
+
+# Argumentos comunes a todos los trabajos. /MT no va aquí: lo decide el
+# planificador con el perfil del volumen (autoajuste.py) salvo que el trabajo lo fije
+BASE_ARGS = ["/COPY:DATSO", "/DCOPY:T", "/R:3", "/W:5", "/FFT", "/XJ", "/NP", "/TEE"]
+DEFAULT_THREADS = 16
+
+def build_cmd(src, dst, *extra):
+    return ["robocopy", src, dst, *BASE_ARGS, *extra]
+
+# Modos de trabajo (los mismos que los botones de la interfaz) -> modificadores
+MODES = {
+    "simple": [],
+    "subdirs": [RobocopyFlags.COPY_SUBDIRS_NEMPTY],
+    "subdirs_empty": [RobocopyFlags.COPY_SUBDIRS],
+    "incremental": [RobocopyFlags.COPY_SUBDIRS, RobocopyFlags.EXCLUDE_OLDER],
+    "exclude_changed": [RobocopyFlags.COPY_SUBDIRS, RobocopyFlags.EXCLUDE_CHANGED],
+    "exclude_older_extra": [RobocopyFlags.COPY_SUBDIRS, RobocopyFlags.EXCLUDE_OLDER, RobocopyFlags.EXCLUDE_EXTRA],
+    "create": [RobocopyFlags.CREATE_STRUCTURE_ONLY],
+    "mirror": [RobocopyFlags.MIRROR],
+    "mirror_exclude_extra": [RobocopyFlags.MIRROR, RobocopyFlags.EXCLUDE_EXTRA],
+    "restartable_mirror": [RobocopyFlags.MIRROR, RobocopyFlags.RESTARTABLE],
+    "purge": [RobocopyFlags.PURGE],
+    "compare": [RobocopyFlags.LIST_ONLY, RobocopyFlags.VERBOSE],
+}
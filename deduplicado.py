@@ -0,0 +1,334 @@
+# deduplicado.py
+import os, sys, json, time, zlib, base64, socket, hashlib, argparse, threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken
+from cifrado import resolve_key, load_key, iter_decrypted_chunks
+from instantaneas import _write_encrypted, scan_folder
+from telemetria import TELEMETRY
+
+# Almacén deduplicado: los archivos se parten en trozos definidos por su
+# contenido y cada trozo distinto se guarda una sola vez, comprimido y cifrado
+# con la clave Fernet de siempre (cifrado.resolve_key). Diez equipos con el
+# mismo sistema y programas ocupan casi lo mismo que uno, y en cada copia solo
+# viajan los trozos que el almacén aún no tiene.
+#
+#   <almacén>/almacen.json                       formato y parámetros del troceado
+#   <almacén>/almacen.key                        clave (si no se indica otra)
+#   <almacén>/chunks/ab/<id>                     token Fernet (binario) de flags + datos
+#   <almacén>/snapshots/<nombre>/NNNNNN.manifest.enc
+#
+# El id de un trozo es un BLAKE2b con clave derivada de la Fernet: no delata el
+# contenido a quien no tenga la clave, y dos equipos con la misma clave
+# comparten trozos. Cada manifiesto guarda, por archivo, [tamaño, mtime_ns,
+# [ids]]; se escribe el último, así una copia sin manifiesto no existe.
+FORMAT = 1
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+WINDOW = 48                 # bytes que deciden cada corte
+MASK = (1 << 12) - 1        # 1 de cada 4096 candidatos corta: ~1 MB de media
+SCAN_STEP = 256 * 1024
+MAX_CHECKS = 1 << 15        # datos patológicos (un byte repetido): se corta en MAX_CHUNK
+READ_BLOCK = 1024 * 1024
+FLAG_ZLIB = 0x01
+ZLIB_LEVEL = 6
+
+# Candidatos a corte: dos bytes seguidos de este grupo (1 de cada 256 posiciones
+# en datos aleatorios y algo parecido en texto). bytes.translate + find los
+# encuentran a velocidad de C; solo en ellos se calcula el crc32 de la ventana.
+_ANCHOR = b"ybpvkjxqzGP7():\x13"
+_MARKS = bytes(0 if i in _ANCHOR else 1 for i in range(256))
+
+
+def cut_point(buf):
+    """
+    Longitud del primer trozo de buf (que trae MAX_CHUNK bytes o el resto
+    del archivo). Solo depende del contenido desde el inicio del trozo: un
+    cambio al principio de un archivo no mueve los cortes de más adelante.
+    """
+    size = len(buf)
+    if size <= MIN_CHUNK:
+        return size
+    end = min(size, MAX_CHUNK)
+    checks = 0
+    for start in range(MIN_CHUNK - 1, end - 1, SCAN_STEP):
+        marks = buf[start:min(end, start + SCAN_STEP + 1)].translate(_MARKS)
+        i = marks.find(b"\0\0")
+        while i >= 0:
+            pos = start + i + 2
+            if not zlib.crc32(buf[pos - WINDOW:pos]) & MASK:
+                return pos
+            checks += 1
+            if checks >= MAX_CHECKS:
+                return end
+            i = marks.find(b"\0\0", i + 1)
+    return end
+
+
+def iter_chunks(f):
+    buf = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buf) < MAX_CHUNK:
+            block = f.read(READ_BLOCK)
+            if block:
+                buf += block
+            else:
+                eof = True
+        if not buf:
+            return
+        n = cut_point(buf)
+        yield bytes(buf[:n])
+        del buf[:n]
+
+
+class ChunkStore:
+    """
+    Trozos cifrados de un almacén. put escribe a .part y renombra: dos equipos
+    que suben el mismo trozo a la vez escriben lo mismo y gana cualquiera.
+    """
+
+    def __init__(self, root, key):
+        self.root = root
+        self._fernet = Fernet(key)
+        self._id_key = hashlib.blake2b(key, digest_size=32, person=b"valkyria-trozos").digest()
+
+    def chunk_id(self, data):
+        return hashlib.blake2b(data, digest_size=20, key=self._id_key).hexdigest()
+
+    def path(self, cid):
+        return os.path.join(self.root, "chunks", cid[:2], cid)
+
+    def has(self, cid):
+        return os.path.exists(self.path(cid))
+
+    def put(self, cid, data):
+        # Devuelve los bytes escritos en el almacén
+        packed = zlib.compress(data, ZLIB_LEVEL)
+        flags = 0
+        if len(packed) < len(data):
+            data, flags = packed, FLAG_ZLIB
+        raw = base64.urlsafe_b64decode(self._fernet.encrypt(bytes((flags,)) + data))
+        path = self.path(cid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(part, "wb") as f:
+            f.write(raw)
+        os.replace(part, path)
+        return len(raw)
+
+    def get(self, cid):
+        with open(self.path(cid), "rb") as f:
+            raw = f.read()
+        try:
+            plain = self._fernet.decrypt(base64.urlsafe_b64encode(raw))
+        except InvalidToken:
+            raise ValueError(f"Trozo {cid}: clave incorrecta o trozo corrupto")
+        data = zlib.decompress(plain[1:]) if plain[0] & FLAG_ZLIB else plain[1:]
+        if self.chunk_id(data) != cid:
+            raise ValueError(f"Trozo {cid}: el contenido no coincide con su id")
+        return data
+
+
+def _check_store(store_dir):
+    # Crea almacen.json o comprueba que el almacén usa este mismo troceado
+    path = os.path.join(store_dir, "almacen.json")
+    params = {"format": FORMAT, "min": MIN_CHUNK, "max": MAX_CHUNK, "window": WINDOW, "mask": MASK}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            found = json.load(f)
+        if found != params:
+            raise ValueError(f"{store_dir}: almacén con otro formato o troceado ({found})")
+        return
+    os.makedirs(store_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+
+
+def _snap_dir(store_dir, name):
+    return os.path.join(store_dir, "snapshots", name)
+
+
+def _manifest_path(store_dir, name, snap_id):
+    return os.path.join(_snap_dir(store_dir, name), f"{snap_id:06d}.manifest.enc")
+
+
+def list_names(store_dir):
+    root = os.path.join(store_dir, "snapshots")
+    return sorted(os.listdir(root)) if os.path.isdir(root) else []
+
+
+def list_snapshots(store_dir, name):
+    folder = _snap_dir(store_dir, name)
+    if not os.path.isdir(folder):
+        return []
+    ids = []
+    for entry in os.listdir(folder):
+        if entry.endswith(".manifest.enc"):
+            try:
+                ids.append(int(entry.split(".", 1)[0]))
+            except ValueError:
+                pass
+    return sorted(ids)
+
+
+def load_manifest(store_dir, name, snap_id, key):
+    with open(_manifest_path(store_dir, name, snap_id), "rb") as f:
+        return json.loads(b"".join(iter_decrypted_chunks(f, key)))
+
+
+def default_name(folder_path):
+    # Un nombre por equipo y carpeta: cada equipo de la flota lleva su propia cadena
+    base = os.path.basename(os.path.normpath(folder_path)) or "backup"
+    return f"{socket.gethostname()}-{base}"
+
+
+def backup(folder_path, store_dir, name=None, key_path=None, workers=None):
+    """
+    Copia la carpeta al almacén: solo se leen los archivos nuevos o con otro
+    tamaño/fecha que en la copia anterior de ese nombre, y solo se escriben
+    los trozos que el almacén no tenía.
+    Devuelve (id o None si no hubo cambios, ruta .key si se generó, estadísticas).
+    """
+    t0 = time.perf_counter()
+    _check_store(store_dir)
+    name = name or default_name(folder_path)
+    key, key_path, key_created = resolve_key(store_dir, "almacen", key_path)
+    store = ChunkStore(store_dir, key)
+    existing = list_snapshots(store_dir, name)
+    prev = load_manifest(store_dir, name, existing[-1], key) if existing else {"files": {}, "dirs": []}
+    prev_files = prev["files"]
+    snap_id = (existing[-1] if existing else 0) + 1
+
+    stats = {"files": 0, "reused": 0, "changed": 0, "chunks": 0, "chunks_new": 0,
+             "bytes": 0, "bytes_read": 0, "bytes_stored": 0}
+    lock = threading.Lock()
+    seen = set()    # trozos ya comprobados o subidos en esta copia
+
+    def store_file(rel):
+        ids, read, stored, new, total = [], 0, 0, 0, 0
+        with open(os.path.join(folder_path, rel), "rb") as f:
+            for data in iter_chunks(f):
+                cid = store.chunk_id(data)
+                ids.append(cid)
+                read += len(data)
+                total += 1
+                with lock:
+                    fresh = cid not in seen
+                    seen.add(cid)
+                if fresh and not store.has(cid):
+                    stored += store.put(cid, data)
+                    new += 1
+        with lock:
+            stats["chunks"] += total
+            stats["chunks_new"] += new
+            stats["bytes_read"] += read
+            stats["bytes_stored"] += stored
+        return ids
+
+    current, dirs = scan_folder(folder_path, exclude_dirs=(store_dir,), exclude_files=(key_path,))
+    files, todo = {}, []
+    for rel in sorted(current):
+        st = current[rel]
+        stats["files"] += 1
+        stats["bytes"] += st.st_size
+        old = prev_files.get(rel)
+        if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            files[rel] = old
+            stats["reused"] += 1
+        else:
+            todo.append(rel)
+    stats["removed"] = len(prev_files.keys() - current.keys())
+    if existing and not todo and not stats["removed"] and dirs == prev["dirs"]:
+        TELEMETRY.observe("dedup", time.perf_counter() - t0)
+        return None, (key_path if key_created else None), stats
+
+    with ThreadPoolExecutor(workers or min(16, (os.cpu_count() or 1) * 2)) as pool:
+        for rel, ids in zip(todo, pool.map(store_file, todo)):
+            st = current[rel]
+            files[rel] = [st.st_size, st.st_mtime_ns, ids]
+            stats["changed"] += 1
+
+    manifest = {
+        "id": snap_id,
+        "name": name,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+        "source": os.path.abspath(folder_path),
+        "parent": existing[-1] if existing else None,
+        "files": files,
+        "dirs": dirs,
+    }
+    os.makedirs(_snap_dir(store_dir, name), exist_ok=True)
+    _write_encrypted(_manifest_path(store_dir, name, snap_id), key,
+                     lambda w: w.write(json.dumps(manifest, separators=(",", ":")).encode("utf-8")))
+    TELEMETRY.count("dedup_bytes_read", stats["bytes_read"])
+    TELEMETRY.count("dedup_bytes_stored", stats["bytes_stored"])
+    TELEMETRY.observe("dedup", time.perf_counter() - t0)
+    return snap_id, (key_path if key_created else None), stats
+
+
+def restore(store_dir, name, key_path, target_dir, snap_id=None, workers=None):
+    """
+    Reconstruye en target_dir la copia indicada (por defecto la última).
+    Cada trozo se comprueba contra su id al descifrarlo.
+    """
+    key = load_key(key_path)
+    existing = list_snapshots(store_dir, name)
+    if not existing:
+        raise ValueError(f"No hay copias '{name}' en {store_dir}")
+    snap_id = snap_id or existing[-1]
+    if snap_id not in existing:
+        raise ValueError(f"No existe la copia {snap_id} de '{name}'")
+    manifest = load_manifest(store_dir, name, snap_id, key)
+    store = ChunkStore(store_dir, key)
+
+    os.makedirs(target_dir, exist_ok=True)
+    for rel in manifest["dirs"]:
+        os.makedirs(os.path.join(target_dir, rel), exist_ok=True)
+
+    def restore_file(item):
+        rel, (size, mtime_ns, ids) = item
+        path = os.path.join(target_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            for cid in ids:
+                f.write(store.get(cid))
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    with ThreadPoolExecutor(workers or min(16, (os.cpu_count() or 1) * 2)) as pool:
+        list(pool.map(restore_file, manifest["files"].items()))
+    return snap_id
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Copia deduplicada y cifrada a un almacén de trozos")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("backup", help="Copiar una carpeta al almacén")
+    b.add_argument("src")
+    b.add_argument("store")
+    b.add_argument("--name", help="Nombre de la cadena de copias (por defecto equipo-carpeta)")
+    b.add_argument("--key", help="Archivo .key (por defecto almacen.key dentro del almacén)")
+    r = sub.add_parser("restore", help="Restaurar una copia del almacén")
+    r.add_argument("store")
+    r.add_argument("name")
+    r.add_argument("target")
+    r.add_argument("--key")
+    r.add_argument("--id", type=int)
+    sub.add_parser("list", help="Listar las copias del almacén").add_argument("store")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "backup":
+        snap_id, key_created, stats = backup(args.src, args.store, args.name, args.key)
+        print(json.dumps({"id": snap_id, "key_created": key_created, **stats}, ensure_ascii=False))
+    elif args.cmd == "restore":
+        key = args.key or os.path.join(args.store, "almacen.key")
+        print(restore(args.store, args.name, key, args.target, args.id))
+    else:
+        for name in list_names(args.store):
+            print(name, " ".join(map(str, list_snapshots(args.store, name))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# diferencias.py
+import os, sys, json, time, argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from analizador import format_bytes
+from indice import ChangeSet
+from motor_nativo import Selector, parse_robocopy_args
+
+# Comparación previa (en seco) de origen y destino sin lanzar robocopy /L /V:
+# recorre los dos árboles a la vez con os.scandir (un pool por niveles), cruza
+# los listados ordenados y clasifica cada archivo como lo haría robocopy.
+# El resultado sirve de lista de trabajo para la copia siguiente.
+CATEGORIES = ("new", "newer", "older", "changed", "extra", "same")
+LABELS = {
+    "new": "Nuevo", "newer": "Más reciente", "older": "Más antiguo",
+    "changed": "Modificado", "extra": "Extra", "same": "Idéntico",
+}
+_KINDS = {"New File": "new", "Newer": "newer", "Older": "older", "Changed": "changed", "same": "same"}
+_key = (lambda name: name.lower()) if os.name == "nt" else (lambda name: name)
+
+
+class DiffResult:
+    """
+    entries[categoría] = [(rel, tamaño, mtime_ns), ...] con rel usando '/'.
+    Los idénticos solo se cuentan (salvo keep_same) para no llenar la memoria.
+    """
+
+    def __init__(self, src, dst, args):
+        self.src, self.dst, self.args = src, dst, list(args)
+        self.entries = {c: [] for c in CATEGORIES}
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self.bytes = dict.fromkeys(CATEGORIES, 0)
+        self.new_dirs = []
+        self.extra_dirs = []
+        self.elapsed = 0.0
+
+    def add(self, category, rel, size, mtime_ns, keep=True):
+        self.counts[category] += 1
+        self.bytes[category] += size
+        if keep:
+            self.entries[category].append((rel, size, mtime_ns))
+
+    def sort(self):
+        for rows in self.entries.values():
+            rows.sort()
+        self.new_dirs.sort()
+        self.extra_dirs.sort()
+
+    def rows(self, categories=CATEGORIES):
+        for c in categories:
+            for rel, size, mtime_ns in self.entries[c]:
+                yield c, rel, size, mtime_ns
+
+    def summary(self):
+        parts = [f"{self.counts[c]} {LABELS[c].lower()} ({format_bytes(self.bytes[c])})" for c in CATEGORIES if self.counts[c]]
+        parts.append(f"{len(self.new_dirs)} carpetas nuevas, {len(self.extra_dirs)} carpetas extra")
+        return ", ".join(parts) + f" · {self.elapsed:.1f} s"
+
+    def as_dict(self, with_entries=False):
+        data = {"src": self.src, "dst": self.dst, "args": self.args, "elapsed": round(self.elapsed, 3),
+                "counts": self.counts, "bytes": self.bytes,
+                "new_dirs": len(self.new_dirs), "extra_dirs": len(self.extra_dirs)}
+        if with_entries:
+            data["entries"] = {c: rows for c, rows in self.entries.items() if rows}
+            data["new_dirs"], data["extra_dirs"] = self.new_dirs, self.extra_dirs
+        return data
+
+    def to_change_set(self, flags=()):
+        """
+        Lista de trabajo para la copia: ChangeSet con lo que robocopy haría
+        con estos modificadores (/XO, /XN, /XC y extras solo con /PURGE o /MIR).
+        Se pasa a JobIndex.plan_commands igual que el del índice.
+        """
+        opts = parse_robocopy_args(list(flags))
+        cs = ChangeSet()
+        cs.changed = [r for r, _, _ in self.entries["new"]]
+        for category, skip in (("newer", opts.exclude_newer), ("older", opts.exclude_older),
+                               ("changed", opts.exclude_changed)):
+            if not skip:
+                cs.changed += [r for r, _, _ in self.entries[category]]
+        cs.missing_dirs = list(self.new_dirs)
+        if opts.purge and not opts.exclude_extra:
+            cs.extras = [r for r, _, _ in self.entries["extra"]]
+            cs.extra_dirs = list(self.extra_dirs)
+        cs.changed.sort()
+        return cs.group()
+
+
+def _scan(path, select):
+    # ([(nombre, stat)], [nombre]) ordenados por nombre; (None, None) si la carpeta no existe
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                kind = select.entry_kind(e)
+                if kind == "dir":
+                    if not select.excluded_dir(e.name, e.path):
+                        dirs.append(e.name)
+                elif kind == "file":
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    if not select.excluded_file(e.name, st):
+                        files.append((e.name, st))
+    except (FileNotFoundError, NotADirectoryError):
+        return None, None
+    files.sort(key=lambda f: _key(f[0]))
+    dirs.sort(key=_key)
+    return files, dirs
+
+
+def _merge(left, right, key):
+    # Cruce de dos listas ordenadas: (izq o None, der o None)
+    i = j = 0
+    while i < len(left) or j < len(right):
+        a = key(left[i]) if i < len(left) else None
+        b = key(right[j]) if j < len(right) else None
+        if b is None or (a is not None and a < b):
+            yield left[i], None
+            i += 1
+        elif a is None or b < a:
+            yield None, right[j]
+            j += 1
+        else:
+            yield left[i], right[j]
+            i += 1
+            j += 1
+
+
+def _visit(src, dst, opts, select, task):
+    """
+    Se ejecuta en el pool. task = (rel, lado) con lado 'both', 'src' (carpeta
+    nueva) o 'dst' (carpeta extra). Devuelve (filas, subtareas, carpetas).
+    """
+    rel, side = task
+    join = lambda root: os.path.join(root, *rel.split("/")) if rel else root
+    child = lambda name: f"{rel}/{name}" if rel else name
+    s_files, s_dirs = _scan(join(src), select) if side != "dst" else ([], [])
+    d_files, d_dirs = _scan(join(dst), select) if side != "src" else ([], [])
+    s_files, s_dirs, d_files, d_dirs = s_files or [], s_dirs or [], d_files or [], d_dirs or []
+    rows, tasks, dirs = [], [], []
+    for s, d in _merge(s_files, d_files, lambda f: _key(f[0])):
+        if s is None:
+            rows.append(("extra", child(d[0]), d[1].st_size, d[1].st_mtime_ns))
+            continue
+        kind, _ = select.classify(s[1], d[1] if d else None)
+        rows.append((_KINDS.get(kind, "changed"), child(s[0]), s[1].st_size, s[1].st_mtime_ns))
+    if opts.subdirs:
+        for s, d in _merge(s_dirs, d_dirs, _key):
+            if s is None:
+                dirs.append(("extra", child(d)))
+                tasks.append((child(d), "dst"))
+            elif d is None:
+                dirs.append(("new", child(s)))
+                tasks.append((child(s), "src"))
+            else:
+                tasks.append((child(s), side))
+    return rows, tasks, dirs
+
+
+def diff_trees(src, dst, args=("/E",), workers=16, keep_same=False, cancel=None):
+    """
+    Compara src y dst con la selección y los criterios de robocopy para args
+    (patrones, /XF, /XD, /XJ, /FFT, edad y tamaño). Devuelve un DiffResult.
+    """
+    t0 = time.monotonic()
+    src, dst = os.path.abspath(src), os.path.abspath(dst)
+    opts = parse_robocopy_args(list(args))
+    select = Selector(opts)
+    result = DiffResult(src, dst, args)
+    visit = partial(_visit, src, dst, opts, select)
+    pending = [("", "both")]
+    with ThreadPoolExecutor(workers) as pool:
+        while pending and not (cancel and cancel.is_set()):
+            next_level = []
+            # map conserva el orden: el resultado no depende de qué hilo acabe antes
+            for rows, tasks, dirs in pool.map(visit, pending):
+                for category, rel, size, mtime_ns in rows:
+                    result.add(category, rel, size, mtime_ns, keep_same or category != "same")
+                for category, rel in dirs:
+                    (result.new_dirs if category == "new" else result.extra_dirs).append(rel)
+                next_level += tasks
+            pending = next_level
+    result.sort()
+    result.elapsed = time.monotonic() - t0
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compara origen y destino sin copiar nada")
+    ap.add_argument("src")
+    ap.add_argument("dst")
+    ap.add_argument("flags", nargs="*", help="Modificadores de robocopy (por defecto /E)")
+    ap.add_argument("--json", help="Guardar el resultado completo en este archivo")
+    ap.add_argument("--workers", type=int, default=16)
+    args = ap.parse_args(argv)
+    result = diff_trees(args.src, args.dst, args.flags or ["/E"], args.workers)
+    print(result.summary())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result.as_dict(with_entries=True), f, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+# historial.py
+import os, sys, gzip, json, time, zlib, shutil, sqlite3, argparse, threading
+from datetime import datetime
+from analizador import RobocopyParser, ErrorEvent, format_bytes
+from rutas import app_dir
+
+# Historial de ejecuciones: la salida completa de cada trabajo se guarda
+# comprimida en segmentos (historial/AAAA-MM/<ejecución>/NNN.log.gz, de hasta
+# SEGMENT_BYTES sin comprimir cada uno) y un índice SQLite apunta lo que hace
+# falta para buscar sin volver a leer los logs: trabajo, fechas, rc, totales,
+# segmentos y, por cada ruta que falló, el segmento y la posición (bytes sin
+# comprimir) de su línea de ERROR. "¿En qué ejecuciones falló X?" es una
+# consulta al índice; solo al abrir el log se descomprime, y solo un segmento.
+SEGMENT_BYTES = 4 * 1024 * 1024
+FLUSH_EVERY = 5.0           # segundos: lo escrito se puede leer aunque la aplicación se cierre de golpe
+KEEP_DAYS = 365
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, job INTEGER, name TEXT, src TEXT, dst TEXT, cmd TEXT,
+    started REAL NOT NULL, ended REAL, state TEXT, rc INTEGER, lines INTEGER DEFAULT 0, raw_bytes INTEGER DEFAULT 0,
+    files INTEGER DEFAULT 0, bytes INTEGER DEFAULT 0, failed INTEGER DEFAULT 0, folder TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE TABLE IF NOT EXISTS segments (
+    run INTEGER NOT NULL, seq INTEGER NOT NULL, first_line INTEGER NOT NULL, lines INTEGER NOT NULL,
+    raw_bytes INTEGER NOT NULL, PRIMARY KEY (run, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS failures (
+    run INTEGER NOT NULL, path TEXT NOT NULL, path_key TEXT NOT NULL, name_key TEXT NOT NULL,
+    code INTEGER, action TEXT, message TEXT, seq INTEGER NOT NULL, offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failures_path ON failures (path_key);
+CREATE INDEX IF NOT EXISTS failures_name ON failures (name_key);
+CREATE INDEX IF NOT EXISTS failures_run ON failures (run);
+"""
+
+
+def _key(path):
+    return os.path.normcase(path.rstrip("\\/"))
+
+
+def _segment_path(folder, seq):
+    return os.path.join(folder, f"{seq:03d}.log.gz")
+
+
+class RunLog:
+    """
+    Salida de una ejecución en curso. write(línea) desde un solo hilo a la
+    vez (el planificador ya serializa la salida de cada trabajo); close() al
+    terminar completa el índice.
+    """
+
+    def __init__(self, history, run_id, folder):
+        self.history = history
+        self.run_id = run_id
+        self.folder = folder
+        self.parser = RobocopyParser()
+        self.seq = -1
+        self.offset = 0
+        self.lines = 0
+        self.raw_bytes = 0
+        self._first_line = 0
+        self._gz = None
+        self._failures = {}     # ruta -> [código, acción, segmento, posición]
+        self._flushed = time.monotonic()
+
+    def _next_segment(self):
+        if self._gz is not None:
+            self._close_segment()
+        self.seq += 1
+        self.offset = 0
+        self._first_line = self.lines
+        self._gz = gzip.open(_segment_path(self.folder, self.seq), "wb", compresslevel=6)
+
+    def _close_segment(self):
+        self._gz.close()
+        self._gz = None
+        self.history._add_segment(self.run_id, self.seq, self._first_line, self.lines - self._first_line, self.offset)
+
+    def write(self, line):
+        if self._gz is None or self.offset >= SEGMENT_BYTES:
+            self._next_segment()
+        event = self.parser.feed(line)
+        if type(event) is ErrorEvent and event.path not in self._failures:
+            self._failures[event.path] = [event.code, event.action, self.seq, self.offset]
+        data = line.encode("utf-8", "replace")
+        self._gz.write(data)
+        self.offset += len(data)
+        self.raw_bytes += len(data)
+        self.lines += line.count("\n")
+        now = time.monotonic()
+        if now - self._flushed > FLUSH_EVERY:
+            self._gz.flush(zlib.Z_SYNC_FLUSH)
+            self._flushed = now
+
+    def close(self, state, rc):
+        if self._gz is not None:
+            self._close_segment()
+        m = self.parser.metrics
+        messages = {f["path"]: f["message"] for f in m.failed}
+        failures = [(path, code, action, messages.get(path, ""), seq, offset)
+                    for path, (code, action, seq, offset) in self._failures.items()]
+        self.history._finish(self, state, rc, m.files_done, m.bytes_done, failures)
+
+
+class RunHistory:
+    """
+    Índice y logs del historial. Se puede usar desde varios hilos. Al abrirlo
+    se borran las ejecuciones de hace más de keep_days días (None = nunca).
+    """
+
+    def __init__(self, root=None, keep_days=KEEP_DAYS):
+        self.root = root or app_dir("historial")
+        os.makedirs(self.root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.root, "indice.sqlite"), check_same_thread=False, timeout=30)
+        self.db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        if keep_days:
+            self.prune(keep_days)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    # ---------- escritura ----------
+
+    def open_run(self, name, cmd, job_id=None):
+        started = time.time()
+        month = datetime.fromtimestamp(started).strftime("%Y-%m")
+        with self._lock, self.db:
+            cur = self.db.execute("INSERT INTO runs (job, name, src, dst, cmd, started, state, folder) VALUES (?, ?, ?, ?, ?, ?, ?, '')",
+                                  (job_id, name, cmd[1] if len(cmd) > 1 else None, cmd[2] if len(cmd) > 2 else None,
+                                   json.dumps(cmd), started, "running"))
+            run_id = cur.lastrowid
+            folder = f"{month}/{run_id}"
+            self.db.execute("UPDATE runs SET folder=? WHERE id=?", (folder, run_id))
+        path = os.path.join(self.root, *folder.split("/"))
+        os.makedirs(path, exist_ok=True)
+        return RunLog(self, run_id, path)
+
+    def _add_segment(self, run_id, seq, first_line, lines, raw_bytes):
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?)", (run_id, seq, first_line, lines, raw_bytes))
+
+    def _finish(self, log, state, rc, files, nbytes, failures):
+        with self._lock, self.db:
+            self.db.execute("UPDATE runs SET ended=?, state=?, rc=?, lines=?, raw_bytes=?, files=?, bytes=?, failed=? WHERE id=?",
+                            (time.time(), state, rc, log.lines, log.raw_bytes, files, nbytes, len(failures), log.run_id))
+            self.db.executemany("INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                ((log.run_id, path, _key(path), os.path.normcase(os.path.basename(path.rstrip("\\/"))),
+                                  code, action, message, seq, offset)
+                                 for path, code, action, message, seq, offset in failures))
+
+    def prune(self, keep_days=KEEP_DAYS):
+        # Borra del índice y del disco las ejecuciones más antiguas que keep_days
+        limit = time.time() - keep_days * 86400
+        with self._lock:
+            old = self.db.execute("SELECT id, folder FROM runs WHERE started < ?", (limit,)).fetchall()
+            if not old:
+                return 0
+            with self.db:
+                for table, column in (("failures", "run"), ("segments", "run"), ("runs", "id")):
+                    self.db.executemany(f"DELETE FROM {table} WHERE {column}=?", ((run_id,) for run_id, _ in old))
+        for _, folder in old:
+            shutil.rmtree(os.path.join(self.root, *folder.split("/")), ignore_errors=True)
+        return len(old)
+
+    # ---------- consultas ----------
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            cur = self.db.execute(sql, args)
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def runs(self, text=None, failed_only=False, limit=200):
+        """
+        Ejecuciones, de la más reciente a la más antigua. text filtra por
+        nombre, origen o destino; failed_only, las que tuvieron archivos fallidos o rc >= 8.
+        """
+        sql, args = "SELECT * FROM runs WHERE 1=1", []
+        if text:
+            sql += " AND (name LIKE ? OR src LIKE ? OR dst LIKE ?)"
+            args += [f"%{text}%"] * 3
+        if failed_only:
+            sql += " AND (failed > 0 OR rc >= 8)"
+        return self._query(sql + " ORDER BY started DESC LIMIT ?", args + [limit])
+
+    def failures(self, query, limit=500):
+        """
+        Fallos de una ruta en todas las ejecuciones: con separador de carpetas
+        es la ruta o un prefijo (todo lo que hay debajo); sin él, el nombre del
+        archivo. Admite * y ? (GLOB). Cada fila trae la ejecución y dónde está
+        su ERROR en el log (seq, offset).
+        """
+        key = os.path.normcase(query.strip().rstrip("\\/"))
+        column = "path_key" if ("/" in key or "\\" in key) else "name_key"
+        if any(c in key for c in "*?["):
+            where, args = f"f.{column} GLOB ?", [key]
+        elif column == "path_key":
+            # Prefijo por rango: usa el índice, a diferencia de LIKE
+            where, args = "(f.path_key = ? OR (f.path_key > ? AND f.path_key < ?))", [key, key + os.sep, key + os.sep + "\U0010ffff"]
+        else:
+            where, args = "f.name_key = ?", [key]
+        return self._query(f"SELECT f.*, r.name, r.started, r.rc, r.state, r.src, r.dst FROM failures f "
+                           f"JOIN runs r ON r.id = f.run WHERE {where} ORDER BY r.started DESC LIMIT ?", args + [limit])
+
+    def run(self, run_id):
+        rows = self._query("SELECT * FROM runs WHERE id=?", (run_id,))
+        return rows[0] if rows else None
+
+    def read(self, run_id, seq=0, offset=0, max_lines=None):
+        """
+        Líneas del log de una ejecución desde el segmento seq y la posición
+        offset (la de failures) en adelante. Un segmento cortado por un
+        cierre brusco se lee hasta donde llegue.
+        """
+        run = self.run(run_id)
+        if run is None:
+            return
+        folder = os.path.join(self.root, *run["folder"].split("/"))
+        count = 0
+        while True:
+            path = _segment_path(folder, seq)
+            if not os.path.exists(path):
+                return
+            try:
+                with gzip.open(path, "rb") as f:
+                    if offset:
+                        f.seek(offset)
+                    for raw in f:
+                        yield raw.decode("utf-8", "replace")
+                        count += 1
+                        if max_lines is not None and count >= max_lines:
+                            return
+            except (EOFError, zlib.error, OSError):
+                pass
+            seq, offset = seq + 1, 0
+
+    def export(self, run_id, path):
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            for line in self.read(run_id):
+                out.write(line)
+
+
+def describe_run(run):
+    stamp = datetime.fromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M")
+    rc = "" if run["rc"] is None else f" rc={run['rc']}"
+    return (f"#{run['id']} {stamp} {run['name'] or ''} {run['state']}{rc} · {run['files']} archivos · "
+            f"{format_bytes(run['bytes'] or 0)} · {run['failed']} fallidos")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Historial de ejecuciones de Valkyria")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("lista", help="Últimas ejecuciones")
+    p.add_argument("texto", nargs="?", help="Filtrar por nombre, origen o destino")
+    p.add_argument("--fallidas", action="store_true")
+    p.add_argument("-n", type=int, default=50)
+    p = sub.add_parser("buscar", help="Ejecuciones en las que falló una ruta (o un nombre de archivo)")
+    p.add_argument("ruta")
+    p = sub.add_parser("ver", help="Log de una ejecución")
+    p.add_argument("id", type=int)
+    p.add_argument("--desde", help="seq:offset de un fallo (lo que muestra buscar)")
+    p.add_argument("-n", type=int, help="Número de líneas")
+    args = ap.parse_args(argv)
+
+    history = RunHistory(keep_days=None)
+    if args.command == "lista":
+        for run in history.runs(args.texto, args.fallidas, args.n):
+            print(describe_run(run))
+    elif args.command == "buscar":
+        for f in history.failures(args.ruta):
+            stamp = datetime.fromtimestamp(f["started"]).strftime("%Y-%m-%d %H:%M")
+            print(f"#{f['run']} {stamp} {f['name'] or ''} ERROR {f['code']} {f['action']} {f['path']} "
+                  f"[{f['seq']}:{f['offset']}] {f['message'] or ''}")
+    else:
+        seq, _, offset = (args.desde or "0:0").partition(":")
+        for line in history.read(args.id, int(seq), int(offset or 0), args.n):
+            sys.stdout.write(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# indice.py
+import os, time, sqlite3, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from rutas import app_dir
+
+# Índice persistente (SQLite) de los árboles origen ('s') y destino ('d') de un
+# trabajo. Cada fila guarda ruta relativa ('/' como separador), carpeta padre,
+# tamaño, mtime_ns y atributos. Con él se calcula qué ha cambiado sin que
+# robocopy tenga que recorrer y hacer stat de los dos árboles completos.
+#
+# Modos de refresco:
+#   full   lista todas las carpetas (en paralelo) y actualiza solo lo distinto
+#   quick  solo vuelve a listar carpetas cuyo mtime cambió o marcadas como
+#          sucias (p. ej. por el vigilante de eventos). OJO: modificar un
+#          archivo en su sitio no cambia el mtime de su carpeta, así que quick
+#          solo es fiable si algo registra esos cambios (mark_dirty).
+SOURCE, DEST = "s", "d"
+FFT_TOLERANCE_NS = 2 * 10 ** 9
+FULL_REFRESH_EVERY = 24 * 3600
+MAX_JOBS = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    tree TEXT NOT NULL, path TEXT NOT NULL, parent TEXT NOT NULL,
+    is_dir INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, attrs INTEGER NOT NULL,
+    PRIMARY KEY (tree, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (tree, parent);
+CREATE TABLE IF NOT EXISTS dirty (tree TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (tree, path)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _parent(rel):
+    return rel.rpartition("/")[0]
+
+def _join(root, rel):
+    return os.path.join(root, *rel.split("/")) if rel else root
+
+def _attrs(st):
+    return getattr(st, "st_file_attributes", st.st_mode)
+
+
+class ChangeSet:
+    """
+    Diferencias entre origen y destino según el índice.
+    level_dirs: carpetas existentes con archivos nuevos/cambiados/extra (basta /LEV:1)
+    subtrees:   carpetas que faltan enteras en destino (copia recursiva)
+    """
+
+    def __init__(self):
+        self.changed = []
+        self.extras = []
+        self.missing_dirs = []
+        self.extra_dirs = []
+        self.level_dirs = set()
+        self.subtrees = []
+
+    def __bool__(self):
+        return bool(self.level_dirs or self.subtrees)
+
+    def summary(self):
+        return (f"{len(self.changed)} archivos nuevos/cambiados, {len(self.extras)} extra, "
+                f"{len(self.missing_dirs)} carpetas nuevas, {len(self.extra_dirs)} carpetas extra")
+
+    def group(self):
+        """
+        Agrupa changed/extras/missing_dirs/extra_dirs en trabajos: subtrees
+        (carpetas que faltan y cuyo padre sí existe en destino) y level_dirs.
+        """
+        missing = set(self.missing_dirs)
+        self.subtrees = [r for r in self.missing_dirs if _parent(r) not in missing]
+        tops = set(self.subtrees)
+
+        def under(rel, roots):
+            while rel:
+                if rel in roots:
+                    return True
+                rel = _parent(rel)
+            return False
+
+        # Lo que cuelga de una carpeta extra lo purga el trabajo de su carpeta padre
+        extra_roots = set(self.extra_dirs)
+        for path in self.changed:
+            if not under(_parent(path), tops):
+                self.level_dirs.add(_parent(path))
+        for path in self.extras + self.extra_dirs:
+            parent = _parent(path)
+            if not under(parent, extra_roots) and not under(parent, tops):
+                self.level_dirs.add(parent)
+        return self
+
+
+class JobIndex:
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    @classmethod
+    def for_job(cls, src, dst):
+        key = f"{os.path.normcase(os.path.abspath(src))}|{os.path.normcase(os.path.abspath(dst))}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return cls(os.path.join(app_dir("indices"), f"{name}.sqlite"))
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def is_empty(self, tree):
+        return self.conn.execute("SELECT 1 FROM entries WHERE tree=? LIMIT 1", (tree,)).fetchone() is None
+
+    def mark_dirty(self, tree, rel_dirs):
+        # Carpetas que hay que volver a listar aunque su mtime no haya cambiado
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO dirty VALUES (?, ?)", ((tree, r) for r in rel_dirs))
+
+    # ---------- refresco ----------
+
+    @staticmethod
+    def _probe(root, rel, known_mtime, relist):
+        """
+        Se ejecuta en el pool: stat de la carpeta y, si hace falta, listado.
+        Devuelve (rel, stat o None, entradas o None).
+        """
+        path = _join(root, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return rel, None, None
+        if not relist and known_mtime == st.st_mtime_ns:
+            return rel, st, None
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    try:
+                        is_dir = e.is_dir(follow_symlinks=False)
+                        est = e.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries.append((e.name, is_dir, 0 if is_dir else est.st_size, est.st_mtime_ns, _attrs(est)))
+        except OSError:
+            return rel, None, None
+        return rel, st, entries
+
+    def refresh(self, tree, root, mode="full", workers=16):
+        """
+        Actualiza el índice del árbol. Devuelve las carpetas que se volvieron a listar.
+        """
+        c = self.conn
+        known = dict(c.execute("SELECT path, mtime_ns FROM entries WHERE tree=? AND is_dir=1", (tree,)))
+        dirty = {r for (r,) in c.execute("SELECT path FROM dirty WHERE tree=?", (tree,))}
+        relisted = []
+        with ThreadPoolExecutor(workers) as pool, c:
+            pending = [""]
+            while pending:
+                jobs = [pool.submit(self._probe, root, rel, known.get(rel),
+                                    mode == "full" or rel not in known or rel in dirty)
+                        for rel in pending]
+                pending = []
+                for fut in jobs:
+                    rel, st, entries = fut.result()
+                    if st is None:
+                        if rel:
+                            self._drop(tree, rel)
+                        else:
+                            c.execute("DELETE FROM entries WHERE tree=?", (tree,))
+                        continue
+                    c.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, 1, 0, ?, ?)",
+                              (tree, rel, _parent(rel), st.st_mtime_ns, _attrs(st)))
+                    if entries is None:
+                        pending.extend(r for (r,) in c.execute(
+                            "SELECT path FROM entries WHERE tree=? AND parent=? AND is_dir=1 AND path<>''", (tree, rel)))
+                        continue
+                    relisted.append(rel)
+                    pending.extend(self._apply_listing(tree, rel, entries))
+            c.execute("DELETE FROM dirty WHERE tree=?", (tree,))
+        if mode == "full":
+            self.set_meta(f"full_{tree}", time.time())
+        return relisted
+
+    def _apply_listing(self, tree, rel, entries):
+        # Sustituye el contenido conocido de la carpeta por el listado actual
+        c = self.conn
+        old = {r[0]: r[1:] for r in c.execute(
+            "SELECT path, is_dir, size, mtime_ns, attrs FROM entries WHERE tree=? AND parent=? AND path<>''", (tree, rel))}
+        subdirs = []
+        for name, is_dir, size, mtime_ns, attrs in entries:
+            path = f"{rel}/{name}" if rel else name
+            prev = old.pop(path, None)
+            if is_dir:
+                subdirs.append(path)
+                if prev is not None and not prev[0]:
+                    self._drop(tree, path)
+                # La fila de la carpeta la escribe su propio sondeo
+                continue
+            if prev is not None and prev[0]:
+                self._drop(tree, path)
+                prev = None
+            if prev != (0, size, mtime_ns, attrs):
+                c.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, 0, ?, ?, ?)",
+                          (tree, path, rel, size, mtime_ns, attrs))
+        for path in old:
+            self._drop(tree, path)
+        return subdirs
+
+    def _drop(self, tree, rel):
+        # Borra una entrada y, si era carpeta, todo lo que colgaba de ella
+        like = rel.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+        self.conn.execute("DELETE FROM entries WHERE tree=? AND (path=? OR path LIKE ? ESCAPE '\\')",
+                          (tree, rel, like))
+
+    # ---------- cambios ----------
+
+    def change_set(self, flags=(), tolerance_ns=FFT_TOLERANCE_NS):
+        """
+        Calcula las diferencias. Con los modificadores del trabajo se descartan
+        las que robocopy ignoraría de todos modos (/XO, /XN, /XC, extras sin /PURGE).
+        """
+        from motor_nativo import parse_robocopy_args
+        opts = parse_robocopy_args(flags)
+        c = self.conn
+        cs = ChangeSet()
+        cs.missing_dirs = [r for (r,) in c.execute(
+            "SELECT s.path FROM entries s WHERE s.tree='s' AND s.is_dir=1 AND s.path<>'' "
+            "AND NOT EXISTS (SELECT 1 FROM entries d WHERE d.tree='d' AND d.path=s.path AND d.is_dir=1) ORDER BY s.path")]
+        cs.extra_dirs = [r for (r,) in c.execute(
+            "SELECT d.path FROM entries d WHERE d.tree='d' AND d.is_dir=1 AND d.path<>'' "
+            "AND NOT EXISTS (SELECT 1 FROM entries s WHERE s.tree='s' AND s.path=d.path AND s.is_dir=1) ORDER BY d.path")]
+        rows = c.execute(
+            "SELECT s.path, s.size, s.mtime_ns, d.path, d.is_dir, d.size, d.mtime_ns "
+            "FROM entries s LEFT JOIN entries d ON d.tree='d' AND d.path=s.path "
+            "WHERE s.tree='s' AND s.is_dir=0 AND (d.path IS NULL OR d.is_dir=1 OR d.size<>s.size "
+            "OR abs(d.mtime_ns - s.mtime_ns) > ?) ORDER BY s.path", (tolerance_ns,))
+        for path, size, mtime_ns, d_path, d_is_dir, d_size, d_mtime_ns in rows:
+            if d_path is not None and not d_is_dir:
+                diff = mtime_ns - d_mtime_ns
+                if abs(diff) <= tolerance_ns:
+                    if opts.exclude_changed:
+                        continue
+                elif diff > 0 and opts.exclude_newer:
+                    continue
+                elif diff < 0 and opts.exclude_older:
+                    continue
+            cs.changed.append(path)
+        if (opts.purge or opts.list_only) and not opts.exclude_extra:
+            cs.extras = [r for (r,) in c.execute(
+                "SELECT d.path FROM entries d WHERE d.tree='d' AND d.is_dir=0 "
+                "AND NOT EXISTS (SELECT 1 FROM entries s WHERE s.tree='s' AND s.path=d.path AND s.is_dir=0) ORDER BY d.path")]
+        else:
+            cs.extra_dirs = []
+        return cs.group()
+
+    @staticmethod
+    def plan_commands(build_cmd, src, dst, flags, changes, max_jobs=MAX_JOBS):
+        """
+        Convierte el ChangeSet en comandos: /LEV:1 en las carpetas afectadas y
+        recursivo en los subárboles nuevos. Si salen demasiados, un único
+        comando completo.
+        """
+        if len(changes.level_dirs) + len(changes.subtrees) > max_jobs:
+            return [build_cmd(src, dst, *flags)]
+        cmds = [build_cmd(_join(src, rel), _join(dst, rel), *flags, "/LEV:1") for rel in sorted(changes.level_dirs)]
+        cmds += [build_cmd(_join(src, rel), _join(dst, rel), *flags) for rel in changes.subtrees]
+        return cmds
+
+    def after_copy(self, dst, changes):
+        # El destino solo lo ha tocado la copia: basta con volver a listar lo afectado
+        dirty = set(changes.level_dirs) | set(changes.subtrees) | {_parent(r) for r in changes.subtrees}
+        self.mark_dirty(DEST, dirty)
+        self.refresh(DEST, dst, "quick")
+
+    def needs_full(self, tree, every=FULL_REFRESH_EVERY):
+        last = float(self.get_meta(f"full_{tree}", 0))
+        return self.is_empty(tree) or time.time() - last > every
+
+    def set_watching(self, ttl):
+        """
+        Latido del vigilante de eventos: el origen se da por vigilado durante
+        ttl segundos más (0 lo da por no vigilado). Si el proceso muere sin
+        pasar por su finally, la marca caduca sola.
+        """
+        self.set_meta("watching_s", f"{time.time() + ttl:.3f}" if ttl else 0)
+
+    def source_watched(self):
+        # Solo entonces el modo rápido del origen es fiable (ver mark_dirty)
+        try:
+            return float(self.get_meta("watching_s", 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,195 @@
+# instantaneas.py
+import os, json, time, zipfile, hashlib, tempfile
+from datetime import datetime
+from cifrado import (EncryptedWriter, iter_decrypted_chunks, write_zip_stream,
+                     resolve_key, load_key, decrypt_file_to_zip)
+from telemetria import TELEMETRY
+
+# Cadena de instantáneas cifradas dentro de <destino>/<nombre>.snapshots/:
+#   NNNNNN.zip.enc       ZIP cifrado solo con los archivos nuevos o cambiados
+#   NNNNNN.manifest.enc  manifiesto cifrado (JSON) con TODOS los archivos vivos
+# Cada entrada del manifiesto es [tamaño, mtime_ns, blake2b, id de la instantánea
+# que guarda ese contenido], así cualquier punto se restaura sin recorrer la cadena.
+# El manifiesto se escribe el último: una instantánea sin manifiesto no existe.
+HASH_BLOCK = 1024 * 1024
+
+
+def snapshot_dir(out_dir, base_name):
+    return os.path.join(out_dir, f"{base_name}.snapshots")
+
+def _archive_path(snap_dir, snap_id):
+    return os.path.join(snap_dir, f"{snap_id:06d}.zip.enc")
+
+def _manifest_path(snap_dir, snap_id):
+    return os.path.join(snap_dir, f"{snap_id:06d}.manifest.enc")
+
+def list_snapshots(snap_dir):
+    if not os.path.isdir(snap_dir):
+        return []
+    ids = []
+    for name in os.listdir(snap_dir):
+        if name.endswith(".manifest.enc"):
+            try:
+                ids.append(int(name.split(".", 1)[0]))
+            except ValueError:
+                pass
+    return sorted(ids)
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(snap_dir, snap_id, key):
+    with open(_manifest_path(snap_dir, snap_id), "rb") as f:
+        return json.loads(b"".join(iter_decrypted_chunks(f, key)))
+
+def _write_encrypted(path, key, write, workers=1):
+    # Escribe a .part y renombra: el archivo final está completo o no existe
+    part = path + ".part"
+    try:
+        with open(part, "wb") as f:
+            writer = EncryptedWriter(f, key, workers=workers)
+            try:
+                write(writer)
+                writer.close()
+            except BaseException:
+                writer.abort()
+                raise
+        os.replace(part, path)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+
+
+def scan_folder(folder_path, exclude_dirs=(), exclude_files=()):
+    """
+    Recorre la carpeta y devuelve ({ruta_rel: stat}, [carpetas_rel]).
+    """
+    exclude_dirs = {os.path.normcase(os.path.abspath(p)) for p in exclude_dirs}
+    exclude_files = {os.path.normcase(os.path.abspath(p)) for p in exclude_files}
+    files, dirs = {}, []
+    for root, subdirs, names in os.walk(folder_path):
+        subdirs[:] = sorted(d for d in subdirs
+                            if os.path.normcase(os.path.abspath(os.path.join(root, d))) not in exclude_dirs)
+        rel_root = os.path.relpath(root, folder_path)
+        if rel_root != ".":
+            dirs.append(rel_root.replace(os.sep, "/"))
+        for name in names:
+            full = os.path.join(root, name)
+            if os.path.normcase(os.path.abspath(full)) in exclude_files:
+                continue
+            files[os.path.relpath(full, folder_path).replace(os.sep, "/")] = os.stat(full)
+    return files, dirs
+
+
+def create_snapshot(folder_path, out_dir, key_path=None, workers=None):
+    """
+    Crea una instantánea incremental cifrada de la carpeta.
+    Solo se re-archivan los archivos nuevos o cuyo contenido cambió respecto
+    a la última instantánea (tamaño/fecha iguales => no se vuelve a leer).
+    Devuelve (id o None si no hubo cambios, ruta .key si se generó, estadísticas).
+    """
+    t0 = time.perf_counter()
+    base_name = os.path.basename(os.path.normpath(folder_path)) or "backup"
+    snap_dir = snapshot_dir(out_dir, base_name)
+    os.makedirs(snap_dir, exist_ok=True)
+    key, key_path, key_created = resolve_key(out_dir, base_name, key_path)
+
+    existing = list_snapshots(snap_dir)
+    prev = load_manifest(snap_dir, existing[-1], key) if existing else {"files": {}, "dirs": []}
+    prev_files = prev["files"]
+    snap_id = (existing[-1] if existing else 0) + 1
+
+    stats = {"changed": 0, "reused": 0, "removed": 0, "bytes": 0}
+    current, dirs = scan_folder(folder_path, exclude_dirs=(snap_dir,),
+                                exclude_files=(key_path, os.path.join(out_dir, f"{base_name}.zip.enc")))
+    files, changed = {}, []
+    for rel in sorted(current):
+        st = current[rel]
+        old = prev_files.get(rel)
+        if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            files[rel] = old
+            stats["reused"] += 1
+            continue
+        digest = file_hash(os.path.join(folder_path, rel))
+        if old and old[2] == digest:
+            # Solo cambió la fecha: el contenido sigue en la instantánea anterior
+            files[rel] = [st.st_size, st.st_mtime_ns, digest, old[3]]
+            stats["reused"] += 1
+            continue
+        files[rel] = [st.st_size, st.st_mtime_ns, digest, snap_id]
+        changed.append(rel)
+        stats["changed"] += 1
+        stats["bytes"] += st.st_size
+    stats["removed"] = len(prev_files.keys() - files.keys())
+
+    unchanged = (not changed and not stats["removed"] and existing
+                 and all(prev_files[r][1] == files[r][1] for r in files) and dirs == prev["dirs"])
+    if unchanged:
+        TELEMETRY.observe("snapshot", time.perf_counter() - t0)
+        return None, (key_path if key_created else None), stats
+
+    if changed:
+        entries = [(os.path.join(folder_path, rel), rel) for rel in changed]
+        _write_encrypted(_archive_path(snap_dir, snap_id), key,
+                         lambda w: write_zip_stream(w, entries, zipfile.ZIP_STORED if w.parallel else zipfile.ZIP_DEFLATED),
+                         workers or os.cpu_count() or 1)
+
+    manifest = {
+        "id": snap_id,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "parent": existing[-1] if existing else None,
+        "files": files,
+        "dirs": dirs,
+    }
+    _write_encrypted(_manifest_path(snap_dir, snap_id), key,
+                     lambda w: w.write(json.dumps(manifest, separators=(",", ":")).encode("utf-8")))
+    TELEMETRY.observe("snapshot", time.perf_counter() - t0)
+    return snap_id, (key_path if key_created else None), stats
+
+
+def restore_snapshot(snap_dir, key_path, target_dir, snap_id=None):
+    """
+    Reconstruye en target_dir el estado de la instantánea indicada (por defecto la última).
+    Cada archivo se extrae de la instantánea de la cadena que guarda su contenido.
+    """
+    key = load_key(key_path)
+    existing = list_snapshots(snap_dir)
+    if not existing:
+        raise ValueError(f"No hay instantáneas en {snap_dir}")
+    snap_id = snap_id or existing[-1]
+    if snap_id not in existing:
+        raise ValueError(f"No existe la instantánea {snap_id}")
+    manifest = load_manifest(snap_dir, snap_id, key)
+
+    os.makedirs(target_dir, exist_ok=True)
+    for rel in manifest["dirs"]:
+        os.makedirs(os.path.join(target_dir, rel), exist_ok=True)
+
+    by_source = {}
+    for rel, (size, mtime_ns, digest, source) in manifest["files"].items():
+        by_source.setdefault(source, []).append((rel, mtime_ns))
+
+    for source, members in sorted(by_source.items()):
+        # El ZIP de cada eslabón se descifra a disco, nunca a memoria
+        fd, zip_path = tempfile.mkstemp(suffix=".zip", dir=target_dir)
+        os.close(fd)
+        try:
+            decrypt_file_to_zip(_archive_path(snap_dir, source), zip_path, key_path)
+            with zipfile.ZipFile(zip_path) as zf:
+                for rel, mtime_ns in members:
+                    zf.extract(rel, target_dir)
+                    os.utime(os.path.join(target_dir, rel), ns=(mtime_ns, mtime_ns))
+        finally:
+            try:
+                os.remove(zip_path)
+            except OSError:
+                pass
+    return snap_id
@@ -0,0 +1,827 @@
+# motor_nativo.py
+import os, time, errno, shutil, sqlite3, fnmatch, threading
+from functools import partial
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from ancho_banda import TokenBucket, ipg_to_rate
+from paquetes import DEFAULT_LIMIT, BUNDLE_FILES, BUNDLE_BYTES, read_bundle, write_entry
+from bloques import DEFAULT_THRESHOLD, SignatureCache, delta_copy
+from rutas import partial_path, discard_partial, fsync_dir
+from telemetria import TELEMETRY
+
+# Motor de copia en Python puro que interpreta los mismos argumentos que robocopy
+# y escribe su salida con el mismo formato, para que el analizador y el log
+# funcionen igual con cualquiera de los dos.
+
+COPY_BLOCK = 8 * 1024 * 1024
+FFT_TOLERANCE_NS = 2 * 10 ** 9
+
+# Bits del código de retorno de robocopy
+RC_COPIED, RC_EXTRAS, RC_MISMATCH, RC_FAILED, RC_FATAL = 1, 2, 4, 8, 16
+
+
+def format_summary(stats, elapsed):
+    """
+    Líneas de la tabla final con el formato de robocopy a partir de
+    {"dirs"|"files"|"bytes": {"total", "copied", ...}}.
+    """
+    lines = ["\n", "-" * 78 + "\n", "\n",
+             f"{'':15}{'Total':>10}{'Copied':>10}{'Skipped':>10}{'Mismatch':>10}{'FAILED':>10}{'Extras':>10}\n"]
+    for label, section in (("Dirs", "dirs"), ("Files", "files"), ("Bytes", "bytes")):
+        row = stats[section]
+        values = "".join(f"{row[c]:>10}" for c in ("total", "copied", "skipped", "mismatch", "failed", "extras"))
+        lines.append(f"{label:>10} :   {values}\n")
+    hms = str(timedelta(seconds=int(elapsed)))
+    lines += [f"{'Times':>10} :   {hms:>10}\n", "\n"]
+    speed = int(stats["bytes"]["copied"] / elapsed) if elapsed > 0 else 0
+    lines.append(f"{'Speed':>10} :   {speed:>16} Bytes/sec.\n")
+    lines.append(f"{'Ended':>10} : {datetime.now():%A, %B %d, %Y %H:%M:%S}\n")
+    return lines
+
+
+class NativeOptions:
+    """
+    Opciones de robocopy que entiende el motor nativo.
+    """
+
+    def __init__(self):
+        self.file_patterns = []
+        self.subdirs = False          # /S
+        self.empty_dirs = False       # /E
+        self.purge = False            # /PURGE (o /MIR)
+        self.exclude_older = False    # /XO
+        self.exclude_newer = False    # /XN
+        self.exclude_changed = False  # /XC
+        self.exclude_extra = False    # /XX
+        self.exclude_lonely = False   # /XL
+        self.max_age = None           # /MAXAGE: (datetime límite)
+        self.min_age = None           # /MINAGE:
+        self.min_size = None          # /MIN:
+        self.max_size = None          # /MAX:
+        self.exclude_files = []       # /XF
+        self.exclude_dirs = []        # /XD
+        self.create_only = False      # /CREATE
+        self.list_only = False        # /L
+        self.verbose = False          # /V
+        self.threads = 1              # /MT:n (sin /MT robocopy copia de uno en uno)
+        self.retries = 3              # /R:n
+        self.wait = 5                 # /W:n
+        self.fft = False              # /FFT
+        self.exclude_junctions = False  # /XJ
+        self.copy_dir_times = False   # /DCOPY:T
+        self.levels = None            # /LEV:n
+        self.ipg = 0                  # /IPG:n (ms por bloque de 64 KB -> cubo de fichas)
+        self.bundle = 0               # /BUNDLE[:KB] (propio): archivos de hasta n bytes van en paquetes
+        self.delta = 0                # /DELTA[:MB] (propio): archivos desde n bytes se actualizan por bloques
+        self.log_path = None          # /LOG: o /LOG+:
+        self.log_append = False
+        self.unknown = []
+
+
+def _age_limit(value):
+    # robocopy: n < 1900 son días; si no, fecha AAAAMMDD
+    n = int(value)
+    if n < 1900:
+        return datetime.now() - timedelta(days=n)
+    return datetime.strptime(str(n), "%Y%m%d")
+
+
+def parse_robocopy_args(args):
+    """
+    Convierte la lista de argumentos de robocopy (después de origen y destino)
+    en NativeOptions. Los modificadores desconocidos se guardan en unknown.
+    """
+    opts = NativeOptions()
+    collecting = None
+    for arg in args:
+        if not arg.startswith("/"):
+            # Patrones: de archivos (antes de cualquier modificador) o de /XF y /XD
+            (collecting if collecting is not None else opts.file_patterns).append(arg)
+            continue
+        collecting = None
+        name, _, value = arg[1:].partition(":")
+        name = name.upper()
+        if name == "S":
+            opts.subdirs = True
+        elif name == "E":
+            opts.subdirs = opts.empty_dirs = True
+        elif name == "MIR":
+            opts.subdirs = opts.empty_dirs = opts.purge = True
+        elif name == "PURGE":
+            opts.purge = True
+        elif name == "XO":
+            opts.exclude_older = True
+        elif name == "XN":
+            opts.exclude_newer = True
+        elif name == "XC":
+            opts.exclude_changed = True
+        elif name == "XX":
+            opts.exclude_extra = True
+        elif name == "XL":
+            opts.exclude_lonely = True
+        elif name == "MAXAGE":
+            opts.max_age = _age_limit(value)
+        elif name == "MINAGE":
+            opts.min_age = _age_limit(value)
+        elif name == "MIN":
+            opts.min_size = int(value)
+        elif name == "MAX":
+            opts.max_size = int(value)
+        elif name == "XF":
+            collecting = opts.exclude_files
+        elif name == "XD":
+            collecting = opts.exclude_dirs
+        elif name == "CREATE":
+            opts.create_only = True
+        elif name == "L":
+            opts.list_only = True
+        elif name == "V":
+            opts.verbose = True
+        elif name == "MT":
+            opts.threads = max(1, min(int(value or 8), 128))
+        elif name == "R":
+            opts.retries = int(value)
+        elif name == "W":
+            opts.wait = int(value)
+        elif name == "FFT":
+            opts.fft = True
+        elif name == "XJ":
+            opts.exclude_junctions = True
+        elif name == "DCOPY":
+            opts.copy_dir_times = "T" in value.upper()
+        elif name == "LEV":
+            opts.levels = int(value)
+        elif name == "IPG":
+            opts.ipg = int(value or 0)
+        elif name == "BUNDLE":
+            opts.bundle = int(value) * 1024 if value else DEFAULT_LIMIT
+        elif name == "DELTA":
+            opts.delta = int(value) * 1024 * 1024 if value else DEFAULT_THRESHOLD
+        elif name in ("LOG", "LOG+"):
+            opts.log_path, opts.log_append = value, name == "LOG+"
+        elif name in ("COPY", "NP", "TEE", "Z", "J", "NFL", "NDL", "NJH", "NJS", "B", "ZB"):
+            # Sin efecto en el motor nativo (o ya es su comportamiento)
+            pass
+        elif name in ("RH", "PF"):
+            # Los horarios los aplica el planificador (ancho_banda.py)
+            pass
+        else:
+            opts.unknown.append(arg)
+    return opts
+
+
+def copy_file_data(src_path, dst_path, on_block=None, cancel=None, sync=False):
+    """
+    Copia el contenido con copy_file_range o sendfile (sin pasar por espacio
+    de usuario) cuando el sistema lo permite; si no, con lecturas por bloques.
+    on_block(n) se llama tras cada bloque copiado. Con sync, fsync antes de
+    cerrar. Devuelve los bytes copiados, o None si cancel se activó a medias
+    (dst_path queda incompleto).
+    """
+    with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+        copied = _copy_fds(fsrc, fdst, on_block, cancel)
+        if copied is not None and sync:
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        return copied
+
+
+def _copy_fds(fsrc, fdst, on_block, cancel):
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    size = os.fstat(infd).st_size
+    copied = 0
+    for method in ("copy_file_range", "sendfile"):
+        func = getattr(os, method, None)
+        if func is None or copied:
+            continue
+        try:
+            while copied < size:
+                if method == "copy_file_range":
+                    n = func(infd, outfd, min(COPY_BLOCK, size - copied))
+                else:
+                    n = func(outfd, infd, copied, min(COPY_BLOCK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+                if on_block:
+                    on_block(n)
+                if cancel is not None and cancel.is_set():
+                    return None
+            if copied >= size:
+                return copied
+        except OSError as e:
+            # Sistema de archivos sin soporte: se prueba el siguiente método
+            if copied or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                         errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP):
+                raise
+    buf = bytearray(COPY_BLOCK)
+    view = memoryview(buf)
+    fsrc.seek(copied)
+    fdst.seek(copied)
+    while True:
+        n = fsrc.readinto(buf)
+        if not n:
+            break
+        fdst.write(view[:n])
+        copied += n
+        if on_block:
+            on_block(n)
+        if cancel is not None and cancel.is_set():
+            return None
+    return copied
+
+
+def is_link(entry):
+    # Enlace simbólico o, en Windows, unión (is_junction existe desde Python 3.12)
+    return entry.is_symlink() or getattr(entry, "is_junction", lambda: False)()
+
+
+class Selector:
+    """
+    Qué entra en la copia según los filtros de robocopy: patrones de archivo,
+    /XF, /XD, /MIN, /MAX, /MAXAGE, /MINAGE y, con /XJ, ni enlaces simbólicos
+    ni uniones; y cómo se clasifica cada archivo frente al destino. Lo usan
+    el motor, la verificación, las diferencias y la pasada previa, para que
+    todos vean los mismos archivos.
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def entry_kind(self, entry):
+        """
+        "dir", "file" o None (se salta) para una entrada de os.scandir. Sin /XJ
+        los enlaces se siguen; uno roto se salta.
+        """
+        try:
+            if self.opts.exclude_junctions and is_link(entry):
+                return None
+            if entry.is_dir():
+                return "dir"
+            return "file" if entry.is_file() else None
+        except OSError:
+            return None
+
+    def classify(self, s, d):
+        """
+        Compara dos stat como robocopy. Devuelve el tipo y si hay que copiar.
+        """
+        o = self.opts
+        if d is None:
+            return "New File", not o.exclude_lonely
+        diff = s.st_mtime_ns - d.st_mtime_ns
+        tolerance = FFT_TOLERANCE_NS if o.fft else 0
+        if abs(diff) <= tolerance:
+            if s.st_size == d.st_size:
+                return "same", False
+            return "Changed", not o.exclude_changed
+        if diff > 0:
+            return "Newer", not o.exclude_newer
+        return "Older", not o.exclude_older
+
+    def excluded_file(self, name, st):
+        if st is None:
+            return self.excluded_values(name)
+        return self.excluded_values(name, st.st_size, st.st_mtime)
+
+    def excluded_values(self, name, size=None, mtime=None):
+        # Como excluded_file con el tamaño y la fecha (en segundos) sueltos; sin ellos solo los patrones
+        o = self.opts
+        if o.file_patterns and not any(fnmatch.fnmatch(name, p) for p in o.file_patterns):
+            return True
+        if any(fnmatch.fnmatch(name, p) for p in o.exclude_files):
+            return True
+        if size is None:
+            return False
+        if o.min_size is not None and size < o.min_size:
+            return True
+        if o.max_size is not None and size > o.max_size:
+            return True
+        if o.max_age or o.min_age:
+            mtime = datetime.fromtimestamp(mtime)
+            if o.max_age and mtime < o.max_age:
+                return True
+            if o.min_age and mtime > o.min_age:
+                return True
+        return False
+
+    def excluded_dir(self, name, path):
+        return any(fnmatch.fnmatch(name, p) or os.path.normcase(path) == os.path.normcase(os.path.abspath(p))
+                   for p in self.opts.exclude_dirs)
+
+
+class NativeEngine:
+    """
+    Copia src -> dst con la semántica de robocopy: recorre los dos árboles en
+    paralelo con os.scandir, clasifica cada archivo (New/Newer/Older/Changed/
+    Same/EXTRA) y copia con un pool de opts.threads hilos.
+    emit(línea) recibe la salida con el formato de robocopy.
+    Con journal (puntos_control.Journal) se apunta cada carpeta y subárbol
+    terminados sin errores y, al relanzar, se saltan; para poder fiarse del
+    diario, cada copia hace fsync y la carpeta también antes de apuntarla.
+    throttle (ancho_banda.TokenBucket) limita los bytes/s de todas las copias;
+    sin él, /IPG se convierte en uno equivalente. Con /BUNDLE los archivos
+    pequeños de cada carpeta se copian en paquetes (paquetes.py); con /DELTA
+    los grandes que ya están en destino se actualizan por bloques (bloques.py).
+    Al terminar pasa a telemetria los segundos (sumados entre hilos) de
+    listar, copiar y purgar.
+    """
+
+    def __init__(self, src, dst, opts, emit, cancel=None, journal=None, throttle=None):
+        self.src = os.path.abspath(src)
+        self.dst = os.path.abspath(dst)
+        self.opts = opts
+        self.select = Selector(opts)
+        self._emit = emit
+        self.cancel = cancel or threading.Event()
+        self._lock = threading.Lock()
+        self._out_lock = threading.Lock()
+        self.stats = {s: dict.fromkeys(("total", "copied", "skipped", "mismatch", "failed", "extras"), 0)
+                      for s in ("dirs", "files", "bytes")}
+        self._dir_times = []
+        self.fatal = False          # no se pudo listar el origen o crear el destino raíz
+        self.times = dict.fromkeys(("enumerate", "copy", "purge"), 0.0)
+        self.signatures = None      # bloques.SignatureCache, se abre en run() si hay /DELTA
+        self._inflight = threading.BoundedSemaphore(max(4, opts.threads * 4))
+        self.journal = None if opts.list_only else journal
+        self._sync = self.journal is not None
+        self._ck_lock = threading.Lock()
+        self._ck_files = {}   # rel -> [copias pendientes + 1 mientras se recorre, sin fallos]
+        self._ck_tree = {}    # rel -> [partes abiertas (archivos + subcarpetas), sin fallos]
+        if throttle is None and opts.ipg:
+            throttle = TokenBucket(ipg_to_rate(opts.ipg))
+        self._on_block = partial(throttle.consume, cancel=self.cancel) if throttle is not None else None
+
+    def emit(self, line):
+        with self._out_lock:
+            self._emit(line)
+
+    def _count(self, section, column, n=1):
+        with self._lock:
+            self.stats[section][column] += n
+
+    def _timed(self, phase, t0):
+        with self._lock:
+            self.times[phase] += time.perf_counter() - t0
+
+    # ---------- selección ----------
+
+    # ---------- recorrido ----------
+
+    def _scan(self, path):
+        """
+        ({nombre: stat} de archivos, {nombre: ruta} de carpetas) de path, o
+        (None, None) si no existe. Otros errores al listar se propagan.
+        """
+        files, dirs = {}, {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    kind = self.select.entry_kind(entry)
+                    try:
+                        if kind == "dir":
+                            dirs[entry.name] = entry.path
+                        elif kind == "file":
+                            files[entry.name] = entry.stat()
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            return None, None
+        return files, dirs
+
+    def _visit(self, copy_pool, level, rel):
+        src_dir = os.path.join(self.src, rel) if rel else self.src
+        dst_dir = os.path.join(self.dst, rel) if rel else self.dst
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            src_files, src_dirs = self._scan(src_dir)
+        except OSError as e:
+            self._dir_failed(e, "Accessing Source Directory", src_dir, rel)
+            src_files, ok = None, False
+        self._timed("enumerate", t0)
+        if src_files is None:
+            if self.journal is not None and rel:
+                self._ck_release(os.path.dirname(rel), ok)
+            return []
+        if self.journal is not None:
+            self._ck_start(rel)
+        # Con diario: los archivos de esta carpeta ya quedaron copiados en otro intento
+        files_done = self.journal is not None and rel in self.journal.dirs
+        copies = self.plan_dir(rel, src_files, src_dirs, files_done)
+        if copies is None:
+            # Sin carpeta de destino no se copia nada de ella ni se baja a sus subcarpetas
+            if self.journal is not None:
+                self._ck_copy_done(rel, False)
+                self._ck_release(rel, False)
+            return []
+        self._submit_dir(copy_pool, rel, src_dir, dst_dir, copies)
+        if self.journal is not None:
+            self._ck_copy_done(rel, True)
+
+        subdirs = self._subdirs(level, rel, src_dirs)
+        if self.journal is not None:
+            subdirs = [child for child in subdirs if child not in self.journal.subtrees]
+            # Se abre una parte por subcarpeta y se cierra la reserva del recorrido
+            with self._ck_lock:
+                self._ck_tree[rel][0] += len(subdirs)
+            self._ck_release(rel, True)
+        return subdirs
+
+    def plan_dir(self, rel, src_files, src_dirs, files_done=False):
+        """
+        Una carpeta ya listada en origen: lista el destino, escribe las líneas
+        de la carpeta y de sus archivos, cuenta, crea la carpeta y trata los
+        extras (y con /PURGE los borra). Devuelve [(nombre, stat origen, stat
+        destino o None)] de los archivos que hay que copiar (con /L, ninguno),
+        o None si no se pudo listar o crear la carpeta de destino.
+        """
+        o = self.opts
+        src_dir = os.path.join(self.src, rel) if rel else self.src
+        dst_dir = os.path.join(self.dst, rel) if rel else self.dst
+        t0 = time.perf_counter()
+        try:
+            dst_files, dst_dirs = self._scan(dst_dir)
+        except OSError as e:
+            self._count("dirs", "total")
+            self._dir_failed(e, "Accessing Destination Directory", dst_dir, rel)
+            return None
+        finally:
+            self._timed("enumerate", t0)
+        dst_exists = dst_files is not None
+        dst_files, dst_dirs = dst_files or {}, dst_dirs or {}
+        selected = [(name, s) for name, s in sorted(src_files.items()) if not self.select.excluded_file(name, s)]
+
+        self._count("dirs", "total")
+        if not dst_exists:
+            self.emit(f"\t  New Dir  {len(selected):>8}\t{src_dir}{os.sep}\n")
+            # Con /S (sin /E) las carpetas se crean al copiar su primer archivo
+            if not o.list_only and (o.empty_dirs or not rel):
+                try:
+                    os.makedirs(dst_dir, exist_ok=True)
+                except OSError as e:
+                    self._dir_failed(e, "Creating Destination Directory", dst_dir, rel)
+                    return None
+            self._count("dirs", "copied")
+        else:
+            self._count("dirs", "skipped")
+            self.emit(f"\t{len(selected):>20}\t{src_dir}{os.sep}\n")
+        if o.copy_dir_times and not o.list_only:
+            self._dir_times.append((src_dir, dst_dir))
+
+        copies = []
+        for name, s in ([] if files_done else selected):
+            self._count("files", "total")
+            self._count("bytes", "total", s.st_size)
+            d = dst_files.get(name)
+            kind, copy = self.select.classify(s, d)
+            src_path = os.path.join(src_dir, name)
+            if not copy:
+                self._count("files", "skipped")
+                self._count("bytes", "skipped", s.st_size)
+                if o.verbose:
+                    self.emit(f"\t  {kind:<10}\t\t{s.st_size:>12}\t{src_path}\n")
+                continue
+            self.emit(f"\t  {kind:<10}\t\t{s.st_size:>12}\t{src_path}\n")
+            if o.list_only:
+                self._count("files", "copied")
+                self._count("bytes", "copied", s.st_size)
+            else:
+                copies.append((name, s, d))
+
+        # Extras: lo que hay en destino y no en origen
+        if not o.exclude_extra and not files_done:
+            for name, d in sorted(dst_files.items()):
+                if name in src_files or any(fnmatch.fnmatch(name, p) for p in o.exclude_files):
+                    continue
+                self._count("files", "extras")
+                self._count("bytes", "extras", d.st_size)
+                path = os.path.join(dst_dir, name)
+                self.emit(f"\t  *EXTRA File\t\t{d.st_size:>12}\t{path}\n")
+                if o.purge and not o.list_only:
+                    self._remove(path, os.remove)
+
+        if o.subdirs and not o.exclude_extra:
+            for name, path in sorted(dst_dirs.items()):
+                if name in src_dirs or self.select.excluded_dir(name, path):
+                    continue
+                self._count("dirs", "extras")
+                self.emit(f"\t*EXTRA Dir  {-1:>8}\t{path}{os.sep}\n")
+                if o.purge and not o.list_only:
+                    self._remove(path, shutil.rmtree)
+        return copies
+
+    def copy_method(self, s, d):
+        # "delta" (/DELTA), "bundle" (/BUNDLE) o None si se copia el archivo entero
+        o = self.opts
+        if o.create_only:
+            return None
+        if o.delta and d is not None and s.st_size >= o.delta:
+            return "delta"
+        if o.bundle and s.st_size <= o.bundle:
+            return "bundle"
+        return None
+
+    def _submit_dir(self, copy_pool, rel, src_dir, dst_dir, copies):
+        # Encola las copias de plan_dir: por bloques, en paquetes o enteras
+        batch, batch_bytes = [], 0
+        for name, s, d in copies:
+            method = self.copy_method(s, d)
+            if method == "delta":
+                self._submit(copy_pool, rel, self._copy_delta, os.path.join(src_dir, name), os.path.join(dst_dir, name), s)
+            elif method == "bundle":
+                batch.append((name, s))
+                batch_bytes += s.st_size
+                if len(batch) >= BUNDLE_FILES or batch_bytes >= BUNDLE_BYTES:
+                    self._submit(copy_pool, rel, self._copy_bundle, src_dir, dst_dir, batch)
+                    batch, batch_bytes = [], 0
+            else:
+                self._submit_copy(copy_pool, os.path.join(src_dir, name), os.path.join(dst_dir, name), s, rel)
+        if batch:
+            self._submit(copy_pool, rel, self._copy_bundle, src_dir, dst_dir, batch)
+
+    def _subdirs(self, level, rel, src_dirs):
+        # Subcarpetas (relativas) que toca recorrer según /S, /LEV y /XD
+        o = self.opts
+        if not o.subdirs or (o.levels is not None and level >= o.levels):
+            return []
+        return [os.path.join(rel, name) if rel else name
+                for name, path in sorted(src_dirs.items()) if not self.select.excluded_dir(name, path)]
+
+    # ---------- puntos de control ----------
+
+    def _ck_start(self, rel):
+        with self._ck_lock:
+            self._ck_files[rel] = [1, True]
+            self._ck_tree[rel] = [2, True]   # archivos propios + reserva hasta conocer las subcarpetas
+
+    def _ck_copy_done(self, rel, ok):
+        with self._ck_lock:
+            entry = self._ck_files[rel]
+            entry[0] -= 1
+            entry[1] = entry[1] and ok
+            if entry[0]:
+                return
+            del self._ck_files[rel]
+        ok = entry[1]
+        if ok and rel not in self.journal.dirs:
+            ok = self._ck_durable(rel)
+            if ok:
+                self.journal.add("D", rel)
+        self._ck_release(rel, ok)
+
+    def _ck_durable(self, rel):
+        # Barrera antes de apuntar: los archivos ya hicieron fsync al copiarse,
+        # falta la carpeta con sus rename y mkdir. Lo que no llega a disco no se apunta
+        try:
+            fsync_dir(os.path.join(self.dst, rel) if rel else self.dst)
+        except FileNotFoundError:
+            # Sin carpeta en destino (p. ej. vacía con /S) no hay nada que llevar a disco
+            pass
+        except OSError:
+            return False
+        return True
+
+    def _ck_release(self, rel, ok):
+        # Cierra una parte del subárbol rel; al cerrarse todas se apunta y se sube al padre
+        while True:
+            with self._ck_lock:
+                node = self._ck_tree[rel]
+                node[0] -= 1
+                node[1] = node[1] and ok
+                if node[0]:
+                    return
+                del self._ck_tree[rel]
+            ok = node[1] and not self.cancel.is_set() and self._ck_durable(rel)
+            if ok:
+                self.journal.add("T", rel)
+            if not rel:
+                return
+            rel = os.path.dirname(rel)
+
+    def _remove(self, path, func):
+        t0 = time.perf_counter()
+        try:
+            func(path)
+        except OSError as e:
+            self._error(e, "Deleting Extra", path)
+        self._timed("purge", t0)
+
+    def _dir_failed(self, exc, action, path, rel):
+        # Como robocopy: el ERROR de la carpeta, se cuenta como fallida y se sigue con las demás
+        self._error(exc, action, path + os.sep)
+        self._count("dirs", "failed")
+        if not rel:
+            # Sin la carpeta raíz no hay copia: código 16
+            self.fatal = True
+
+    def _error(self, exc, action, path):
+        code = getattr(exc, "winerror", None) or exc.errno or 0
+        stamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        # Como robocopy: la línea del ERROR y, en la siguiente, la descripción (sin otra línea en medio)
+        with self._out_lock:
+            self._emit(f"{stamp} ERROR {code} (0x{code:08X}) {action} {path}\n")
+            self._emit(f"{exc.strerror or exc}\n")
+
+    # ---------- copia ----------
+
+    def _submit_copy(self, pool, src_path, dst_path, st, rel=""):
+        self._submit(pool, rel, self._copy_one, src_path, dst_path, st)
+
+    def _submit(self, pool, rel, func, *args):
+        # Cola acotada: el recorrido espera si hay demasiadas copias pendientes
+        self._inflight.acquire()
+        if self.journal is not None:
+            with self._ck_lock:
+                self._ck_files[rel][0] += 1
+        fut = pool.submit(func, *args)
+        fut.add_done_callback(lambda f: self._copied(f, rel))
+
+    def _copied(self, fut, rel):
+        self._inflight.release()
+        if self.journal is not None:
+            self._ck_copy_done(rel, fut.exception() is None and fut.result())
+
+    def _copy_one(self, src_path, dst_path, st, retries=None):
+        t0 = time.perf_counter()
+        try:
+            return self._copy_attempts(src_path, dst_path, st, self._copy_data, retries)
+        finally:
+            self._timed("copy", t0)
+
+    def _copy_delta(self, src_path, dst_path, st):
+        t0 = time.perf_counter()
+        try:
+            return self._copy_attempts(src_path, dst_path, st, self._patch)
+        finally:
+            self._timed("copy", t0)
+
+    def _copy_data(self, src_path, dst_path, st):
+        # A un temporal y rename al final: una copia cortada nunca queda con el nombre bueno
+        # (con fecha de ahora, /XO la daría por más nueva que el origen y no volvería a copiarla)
+        tmp = partial_path(dst_path)
+        try:
+            copied = copy_file_data(src_path, tmp, self._on_block, self.cancel, self._sync)
+            if copied is None:
+                discard_partial(tmp)
+                return None
+            shutil.copystat(src_path, tmp)
+            os.replace(tmp, dst_path)
+        except BaseException:
+            discard_partial(tmp)
+            raise
+        return copied
+
+    def _patch(self, src_path, dst_path, st):
+        result = delta_copy(src_path, dst_path, st, self.signatures, on_block=self._on_block, cancel=self.cancel,
+                            sync=self._sync)
+        if result is None:
+            return None
+        shutil.copystat(src_path, dst_path)
+        self.emit(f"\t  Delta: {result.summary()}\t{dst_path}\n")
+        TELEMETRY.count("delta_bytes_written", result.written)
+        TELEMETRY.count("delta_bytes_skipped", result.size - result.written)
+        # Para el resumen cuenta como copiado entero, igual que en robocopy
+        return result.size
+
+    def _copy_attempts(self, src_path, dst_path, st, copy, retries=None):
+        o = self.opts
+        retries = o.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            if self.cancel.is_set():
+                return
+            try:
+                if not o.empty_dirs:
+                    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                if o.create_only:
+                    open(dst_path, "wb").close()
+                    shutil.copystat(src_path, dst_path)
+                    copied = 0
+                else:
+                    # copy deja el destino con las fechas del origen solo si termina
+                    copied = copy(src_path, dst_path, st)
+                    if copied is None:
+                        return
+                self._count("files", "copied")
+                self._count("bytes", "copied", copied)
+                return True
+            except Exception as e:
+                if not isinstance(e, OSError):
+                    e = OSError(0, str(e))
+                self._error(e, "Copying File", src_path)
+                if attempt < retries:
+                    self.emit(f"Waiting {o.wait} seconds... Retrying...\n")
+                    if self.cancel.wait(o.wait):
+                        return
+        self._count("files", "failed")
+        self._count("bytes", "failed", st.st_size)
+        return False
+
+    def _copy_bundle(self, src_dir, dst_dir, items):
+        """
+        Copia items = [(nombre, stat)] de src_dir como un paquete (paquetes.py).
+        Lo que no se puede leer o escribir así pasa por _copy_one, con sus
+        reintentos y su línea de error.
+        """
+        if self.cancel.is_set():
+            return
+        t0 = time.perf_counter()
+        entries, retry = read_bundle(src_dir, items, self.opts.bundle)
+        stats = dict(items)
+        ok = True
+        if not self.opts.empty_dirs:
+            try:
+                os.makedirs(dst_dir, exist_ok=True)
+            except OSError:
+                pass
+        for entry in entries:
+            if self.cancel.is_set():
+                return
+            try:
+                n = write_entry(entry, dst_dir, self._sync)
+            except OSError:
+                retry.append((entry.name, stats[entry.name]))
+                continue
+            if self._on_block:
+                self._on_block(n)
+            self._count("files", "copied")
+            self._count("bytes", "copied", n)
+        self._timed("copy", t0)
+        for name, st in retry:
+            ok = self._copy_one(os.path.join(src_dir, name), os.path.join(dst_dir, name), st) and ok
+        return ok
+
+    # ---------- ejecución ----------
+
+    def _header(self, started):
+        self.emit("-" * 79 + "\n   ROBOCOPY     ::     Motor nativo de Valkyria\n" + "-" * 79 + "\n\n")
+        self.emit(f"  Started : {started:%A, %B %d, %Y %H:%M:%S}\n   Source : {self.src}{os.sep}\n"
+                  f"     Dest : {self.dst}{os.sep}\n\n")
+        for arg in self.opts.unknown:
+            self.emit(f"  Aviso: el motor nativo ignora {arg}\n")
+        self.emit("-" * 78 + "\n\n")
+
+    def _summary(self, elapsed):
+        for line in format_summary(self.stats, elapsed):
+            self.emit(line)
+
+    def _open_signatures(self):
+        if self.opts.delta and not self.opts.list_only:
+            try:
+                self.signatures = SignatureCache()
+            except (OSError, sqlite3.Error) as e:
+                # Sin caché de firmas se compara leyendo el destino
+                self.emit(f"  Aviso: sin caché de firmas ({e})\n")
+
+    def _apply_dir_times(self):
+        # Al final y de dentro afuera: copiar archivos cambia la fecha de la carpeta
+        for src_dir, dst_dir in reversed(self._dir_times):
+            try:
+                shutil.copystat(src_dir, dst_dir)
+            except OSError:
+                pass
+
+    def return_code(self):
+        files = self.stats["files"]
+        rc = 0
+        if files["copied"]:
+            rc |= RC_COPIED
+        if files["extras"] or self.stats["dirs"]["extras"]:
+            rc |= RC_EXTRAS
+        if files["mismatch"]:
+            rc |= RC_MISMATCH
+        if files["failed"] or self.stats["dirs"]["failed"]:
+            rc |= RC_FAILED
+        return rc
+
+    def run(self):
+        started = datetime.now()
+        t0 = time.monotonic()
+        self._header(started)
+        if not os.path.isdir(self.src):
+            self.emit(f"{started:%Y/%m/%d %H:%M:%S} ERROR 2 (0x00000002) Accessing Source Directory {self.src}{os.sep}\n")
+            return RC_FATAL
+        self._open_signatures()
+        # Un pool recorre directorios (por niveles) y otro copia archivos
+        try:
+            with ThreadPoolExecutor(self.opts.threads) as copy_pool, \
+                 ThreadPoolExecutor(min(32, max(4, self.opts.threads))) as walk_pool:
+                level, pending = 1, [""]
+                if self.journal is not None and self.journal.resumed:
+                    self.emit(f"  Reanudando: {len(self.journal.subtrees)} subárboles y "
+                              f"{len(self.journal.dirs)} carpetas ya terminados\n")
+                    if "" in self.journal.subtrees:
+                        pending = []
+                while pending and not self.cancel.is_set():
+                    results = walk_pool.map(partial(self._visit, copy_pool, level), pending)
+                    pending = [sub for subs in results for sub in subs]
+                    level += 1
+        finally:
+            if self.signatures is not None:
+                self.signatures.close()
+        self._apply_dir_times()
+        self._summary(time.monotonic() - t0)
+        for name, seconds in self.times.items():
+            TELEMETRY.observe(name, seconds, engine="nativo")
+        TELEMETRY.count("files_scanned", self.stats["files"]["total"], by="nativo")
+        return RC_FATAL if self.cancel.is_set() or self.fatal else self.return_code()
@@ -0,0 +1,77 @@
+# motores.py
+import os, shutil, subprocess, threading
+
+# Backends de copia: todos reciben el mismo cmd que genera build_cmd
+# (["robocopy", origen, destino, *args]) y devuelven el código de retorno
+# de robocopy, pasando cada línea de salida a on_line.
+
+
+def which_robocopy():
+    return shutil.which("robocopy.exe") or shutil.which("robocopy")
+
+
+class RobocopyBackend:
+    name = "robocopy"
+
+    @staticmethod
+    def available():
+        return which_robocopy() is not None
+
+    def run(self, cmd, on_line, cancel=None):
+        # Popen para no bloquear la UI y stream de salida
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as p:
+            if cancel is not None:
+                threading.Thread(target=self._watch_cancel, args=(p, cancel), daemon=True).start()
+            for line in p.stdout:
+                on_line(line)
+            return p.wait()
+
+    @staticmethod
+    def _watch_cancel(proc, cancel):
+        while proc.poll() is None:
+            if cancel.wait(0.5):
+                proc.terminate()
+                return
+
+
+class NativeBackend:
+    name = "nativo"
+
+    @staticmethod
+    def available():
+        return True
+
+    def run(self, cmd, on_line, cancel=None, journal=None, throttle=None):
+        from motor_nativo import NativeEngine, parse_robocopy_args
+        src, dst, *args = cmd[1:]
+        opts = parse_robocopy_args(args)
+        log = None
+        if opts.log_path:
+            # /LOG: igual que robocopy con /TEE, salida al log y a pantalla
+            os.makedirs(os.path.dirname(os.path.abspath(opts.log_path)), exist_ok=True)
+            log = open(opts.log_path, "a" if opts.log_append else "w", encoding="utf-8")
+
+        def emit(line):
+            if log:
+                log.write(line)
+            on_line(line)
+
+        try:
+            return NativeEngine(src, dst, opts, emit, cancel, journal, throttle).run()
+        finally:
+            if log:
+                log.close()
+
+
+BACKENDS = {b.name: b for b in (RobocopyBackend, NativeBackend)}
+
+
+def get_backend(name=None):
+    """
+    Devuelve el backend pedido, el de VALKYRIA_BACKEND o, si no se indica,
+    robocopy cuando está disponible y el motor nativo en otro caso.
+    """
+    name = name or os.environ.get("VALKYRIA_BACKEND")
+    if name:
+        return BACKENDS[name]()
+    return RobocopyBackend() if RobocopyBackend.available() else NativeBackend()
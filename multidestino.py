@@ -0,0 +1,449 @@
+# multidestino.py
+import os, time, queue, shutil, threading
+from contextlib import ExitStack
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from comandos import BASE_ARGS
+from motor_nativo import NativeEngine, parse_robocopy_args, format_summary, RC_FATAL
+from rutas import partial_path, discard_partial
+from telemetria import TELEMETRY
+
+# Copia a varios destinos (/TO:, propio de Valkyria; lo aplica el motor
+# nativo). Un mismo origen que va al NAS, al disco USB de rotación y a un
+# recurso remoto se recorre y se lee una sola vez: cada carpeta del origen se
+# lista una vez y cada archivo que necesitan varios destinos se lee una vez en
+# bloques que se reparten (los mismos bytes, sin copiarlos) a un escritor por
+# destino.
+#
+# Cada destino lleva sus propios modificadores (/MIR en uno, /E /XO en otro,
+# sus /XF, /XD...) y su propio motor (motor_nativo.NativeEngine): lista su
+# destino, decide qué copiar, purga y cuenta por su cuenta, con sus hilos.
+# Un destino lento o que falla no frena a los demás:
+# - el recorrido espera como mucho LAG_WAIT a que un destino decida qué copia
+#   de una carpeta; si tarda más, esa carpeta la copia él solo, leyendo el
+#   origen por su cuenta;
+# - si su cola de bloques sigue llena tras LAG_GRACE mientras otro destino
+#   tiene hueco (o tras STALL_TIMEOUT si van todos igual de lentos), o si
+#   tiene demasiadas escrituras esperando, se suelta del reparto y copia por
+#   su cuenta;
+# - un error de escritura solo cuenta (y se reintenta) en ese destino; si no
+#   se puede crear o listar su carpeta raíz, ese destino acaba con rc 16 y
+#   los demás siguen.
+#
+# Formato del comando: el de un trabajo normal para el primer destino y, por
+# cada destino más, /TO:destino seguido de sus modificadores:
+#     robocopy ORIGEN D1 <args D1> /TO:D2 <args D2> /TO:D3 <args D3> [/MT:n]
+# /MT vale para todo el trabajo esté donde esté (el planificador lo pone al
+# final). Sin diario de puntos de control ni /SHARDS.
+FANOUT = "/TO:"
+STREAM_BLOCK = 1024 * 1024
+STREAM_DEPTH = 4        # bloques en cola por destino y archivo
+LAG_GRACE = 0.2         # segundos con la cola llena, si otro destino tiene hueco, antes de soltarlo
+STALL_TIMEOUT = 2.0     # segundos con la cola llena antes de soltar un destino
+LAG_WAIT = 0.2          # segundos que el recorrido espera a un destino por carpeta
+
+
+def wants_fanout(cmd):
+    return any(a.upper().startswith(FANOUT) for a in cmd)
+
+
+def build_fanout_cmd(src, targets):
+    """
+    Comando para copiar src a targets = [(destino, [modificadores])]; cada
+    destino lleva BASE_ARGS y sus modificadores.
+    """
+    (dst, flags), *rest = targets
+    cmd = ["robocopy", src, dst, *BASE_ARGS, *flags]
+    for dst, flags in rest:
+        cmd += [f"{FANOUT}{dst}", *BASE_ARGS, *flags]
+    return cmd
+
+
+def split_fanout_cmd(cmd):
+    """
+    (origen, [(destino, argumentos)], hilos) de un comando con /TO:. hilos es
+    el último /MT:n del comando (None si no hay) y no queda en los argumentos.
+    """
+    src, dst, *args = cmd[1:]
+    targets, threads = [(dst, [])], None
+    for arg in args:
+        if arg.upper().startswith(FANOUT):
+            targets.append((arg[len(FANOUT):], []))
+        elif arg.upper().startswith("/MT"):
+            threads = int(arg.partition(":")[2] or 8)
+        else:
+            targets[-1][1].append(arg)
+    return src, targets, threads
+
+
+def fanout_dsts(cmd):
+    return [dst for dst, _ in split_fanout_cmd(cmd)[1]]
+
+
+class _Stream:
+    """
+    Bloques de un archivo para un escritor: b"" es el final y None que tiene
+    que copiarlo por su cuenta (se soltó del reparto o falló la lectura).
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(STREAM_DEPTH)
+        self.detached = False
+        self._lock = threading.Lock()
+
+    def put(self, block, timeout):
+        # False si la cola sigue llena pasado timeout
+        try:
+            self.queue.put(block, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def detach(self):
+        # Lo pueden soltar a la vez el lector (cola llena) y el escritor (error)
+        with self._lock:
+            if self.detached:
+                return
+            self.detached = True
+            # Se vacía la cola y se deja el aviso: el escritor no se queda esperando
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(None)
+
+
+class _DirPlan:
+    # Lo que cada destino decide copiar de una carpeta, mientras el recorrido espera
+    def __init__(self, pending):
+        self.cond = threading.Condition()
+        self.pending = pending
+        self.closed = False
+        self.copies = {}
+
+    def offer(self, i, copies):
+        with self.cond:
+            if self.closed:
+                return False
+            self.copies[i] = copies
+            self.pending -= 1
+            self.cond.notify_all()
+            return True
+
+    def collect(self, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.pending, timeout)
+            self.closed = True
+            return self.copies
+
+
+class FanOutEngine:
+    """
+    Copia src a targets = [(destino, NativeOptions)] recorriendo y leyendo el
+    origen una vez (ver la cabecera del módulo). emit(línea) recibe la salida
+    de todos los destinos con el formato de robocopy y, al final, una línea
+    por destino y la tabla sumada. threads es el /MT del trabajo: hilos de
+    lectura y de escritura de cada destino. throttle (ancho_banda.TokenBucket)
+    limita lo escrito entre todos; un /IPG de un destino solo lo frena a él.
+    """
+
+    def __init__(self, src, targets, emit, cancel=None, threads=8, throttle=None):
+        self.src = os.path.abspath(src)
+        self.cancel = cancel or threading.Event()
+        self.threads = max(1, threads)
+        self._emit = emit
+        self._out_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.engines = []
+        for dst, opts in targets:
+            opts.threads = self.threads
+            engine = NativeEngine(src, dst, opts, emit, self.cancel, None, throttle)
+            # Un solo lock de salida: las dos líneas de un ERROR no se mezclan con otro destino
+            engine._out_lock = self._out_lock
+            self.engines.append(engine)
+        self._waiting = [0] * len(self.engines)     # escrituras repartidas aún sin empezar, por destino
+        self._reads = threading.BoundedSemaphore(self.threads * 4)
+        self.enumerate_time = 0.0
+        self.bytes_read = 0
+        self.bytes_fanned = 0
+        self.detached = 0
+        self.planners = self.copiers = self.read_pool = None
+
+    def emit(self, line):
+        with self._out_lock:
+            self._emit(line)
+
+    def _add(self, name, n):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    # ---------- recorrido ----------
+
+    def _visit(self, level, item):
+        rel, active = item
+        src_dir = os.path.join(self.src, rel) if rel else self.src
+        t0 = time.perf_counter()
+        try:
+            src_files, src_dirs = self.engines[active[0]]._scan(src_dir)
+        except OSError as e:
+            # Error del origen: lo ve cada destino que la iba a copiar; sin subcarpetas
+            for i in active:
+                self.engines[i]._dir_failed(e, "Accessing Source Directory", src_dir, rel)
+            return []
+        finally:
+            self._add("enumerate_time", time.perf_counter() - t0)
+        if src_files is None:
+            return []
+        TELEMETRY.count("files_scanned", len(src_files), by="multidestino")
+        plan = _DirPlan(len(active))
+        for i in active:
+            self.planners[i].submit(self._plan, i, plan, rel, src_files, src_dirs)
+        copies = plan.collect(LAG_WAIT)
+
+        shared, failed = {}, set()
+        for i, (dst_dir, items) in sorted(copies.items()):
+            if items is None:
+                failed.add(i)
+                continue
+            if self._waiting[i] > self.threads * 2:
+                # Va retrasado: esta carpeta la copia por su cuenta, sin frenar las lecturas
+                self.planners[i].submit(self._own, i, rel, dst_dir, items)
+                continue
+            for name, s, _ in items:
+                shared.setdefault(name, (s, []))[1].append((i, os.path.join(dst_dir, name)))
+        for name, (s, writers) in sorted(shared.items()):
+            if self.cancel.is_set():
+                break
+            self._reads.acquire()
+            fut = self.read_pool.submit(self._fan_copy, os.path.join(src_dir, name), s, writers)
+            fut.add_done_callback(lambda f: self._reads.release())
+
+        children = {}
+        for i in active:
+            if i in failed or self.engines[i].fatal:
+                continue
+            for child in self.engines[i]._subdirs(level, rel, src_dirs):
+                children.setdefault(child, []).append(i)
+        return sorted(children.items())
+
+    def _plan(self, i, plan, rel, src_files, src_dirs):
+        """
+        En el pool del destino i: plan_dir de la carpeta. Lo que se copia por
+        bloques, en paquetes o vacío (/CREATE) lo encola él; el resto se
+        ofrece al reparto y, si el recorrido ya no esperaba, también lo copia él.
+        """
+        engine = self.engines[i]
+        dst_dir = os.path.join(engine.dst, rel) if rel else engine.dst
+        copies = engine.plan_dir(rel, src_files, src_dirs)
+        if copies is None:
+            # Ya lo contó y lo escribió plan_dir; sin su carpeta raíz este destino no sigue (rc 16)
+            plan.offer(i, (dst_dir, None))
+            return
+        own = [c for c in copies if engine.opts.create_only or engine.copy_method(c[1], c[2])]
+        shared = [c for c in copies if not engine.opts.create_only and not engine.copy_method(c[1], c[2])]
+        if not plan.offer(i, (dst_dir, shared)):
+            own += shared
+        if own:
+            self._own(i, rel, dst_dir, own)
+
+    def _own(self, i, rel, dst_dir, copies):
+        src_dir = os.path.join(self.src, rel) if rel else self.src
+        self.engines[i]._submit_dir(self.copiers[i], rel, src_dir, dst_dir, copies)
+
+    # ---------- lectura compartida ----------
+
+    def _fan_copy(self, src_path, st, writers):
+        # Lee src_path una vez y reparte los bloques a un escritor por destino
+        streams = []
+        for i, dst_path in writers:
+            stream = _Stream()
+            with self._lock:
+                self._waiting[i] += 1
+            self.copiers[i].submit(self._write, i, stream, src_path, dst_path, st)
+            streams.append(stream)
+        complete = False
+        try:
+            with open(src_path, "rb") as f:
+                while not self.cancel.is_set():
+                    block = f.read(STREAM_BLOCK)
+                    self._add("bytes_read", len(block))
+                    for stream in streams:
+                        if stream.detached or stream.put(block, LAG_GRACE):
+                            continue
+                        # Cola llena: si otro destino tiene hueco, este es el que va retrasado
+                        if any(o is not stream and not o.detached and not o.queue.full() for o in streams) \
+                                or not stream.put(block, STALL_TIMEOUT - LAG_GRACE):
+                            stream.detach()
+                    if not block:
+                        complete = True
+                        break
+                    if all(stream.detached for stream in streams):
+                        break
+        except OSError:
+            # Cada destino lo reintenta por su cuenta y, si vuelve a fallar, lo apunta como suyo
+            pass
+        finally:
+            if not complete:
+                for stream in streams:
+                    stream.detach()
+
+    def _write(self, i, stream, src_path, dst_path, st):
+        engine = self.engines[i]
+        with self._lock:
+            self._waiting[i] -= 1
+        if self.cancel.is_set():
+            stream.detach()
+            return
+        t0 = time.perf_counter()
+        written, finished, retries = 0, False, None
+        # Como en el motor nativo: a un temporal y rename solo si el flujo llega entero (b"")
+        tmp = partial_path(dst_path)
+        try:
+            if not engine.opts.empty_dirs:
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                while True:
+                    block = stream.queue.get()
+                    if not block:
+                        finished = block is not None
+                        break
+                    f.write(block)
+                    written += len(block)
+                    if engine._on_block:
+                        engine._on_block(len(block))
+            if finished:
+                shutil.copystat(src_path, tmp)
+                os.replace(tmp, dst_path)
+                engine._count("files", "copied")
+                engine._count("bytes", "copied", written)
+                self._add("bytes_fanned", written)
+                return True
+            discard_partial(tmp)
+        except OSError as e:
+            discard_partial(tmp)
+            stream.detach()
+            engine._error(e, "Copying File", src_path)
+            # Este fue el primer intento: quedan los demás reintentos de /R
+            retries = engine.opts.retries - 1
+            if retries >= 0:
+                engine.emit(f"Waiting {engine.opts.wait} seconds... Retrying...\n")
+                self.cancel.wait(engine.opts.wait)
+        finally:
+            engine._timed("copy", t0)
+        if self.cancel.is_set():
+            return
+        self._add("detached", 1)
+        if retries is not None and retries < 0:
+            engine._count("files", "failed")
+            engine._count("bytes", "failed", st.st_size)
+            return False
+        # Se soltó del reparto (o falló): copia entera por su cuenta
+        return engine._copy_one(src_path, dst_path, st, retries)
+
+    # ---------- ejecución ----------
+
+    def _header(self, started):
+        self.emit("-" * 79 + f"\n   ROBOCOPY     ::     Motor nativo de Valkyria ({len(self.engines)} destinos)\n"
+                  + "-" * 79 + "\n\n")
+        self.emit(f"  Started : {started:%A, %B %d, %Y %H:%M:%S}\n   Source : {self.src}{os.sep}\n")
+        for engine in self.engines:
+            self.emit(f"     Dest : {engine.dst}{os.sep}\n")
+        self.emit("\n")
+        for i, engine in enumerate(self.engines, 1):
+            for arg in engine.opts.unknown:
+                self.emit(f"  Aviso: el motor nativo ignora {arg} (destino {i})\n")
+        self.emit("-" * 78 + "\n\n")
+
+    def run(self):
+        started = datetime.now()
+        t0 = time.monotonic()
+        self._header(started)
+        if not os.path.isdir(self.src):
+            self.emit(f"{started:%Y/%m/%d %H:%M:%S} ERROR 2 (0x00000002) Accessing Source Directory {self.src}{os.sep}\n")
+            return RC_FATAL
+        for engine in self.engines:
+            engine._open_signatures()
+        walkers = min(32, max(4, self.threads))
+        try:
+            # Al salir se cierran en orden inverso: recorrido, lecturas, planes de cada destino y sus copias
+            with ExitStack() as stack:
+                self.copiers = [stack.enter_context(ThreadPoolExecutor(self.threads)) for _ in self.engines]
+                self.planners = [stack.enter_context(ThreadPoolExecutor(walkers)) for _ in self.engines]
+                self.read_pool = stack.enter_context(ThreadPoolExecutor(self.threads))
+                walk_pool = stack.enter_context(ThreadPoolExecutor(walkers))
+                level, pending = 1, [("", list(range(len(self.engines))))]
+                while pending and not self.cancel.is_set():
+                    results = walk_pool.map(partial(self._visit, level), pending)
+                    pending = [child for children in results for child in children]
+                    level += 1
+        finally:
+            for engine in self.engines:
+                if engine.signatures is not None:
+                    engine.signatures.close()
+        for engine in self.engines:
+            engine._apply_dir_times()
+        rc = self._summary(time.monotonic() - t0)
+        TELEMETRY.observe("enumerate", self.enumerate_time, engine="multidestino")
+        for engine in self.engines:
+            for name, seconds in engine.times.items():
+                TELEMETRY.observe(name, seconds, engine="multidestino")
+        TELEMETRY.count("fanout_bytes_read", self.bytes_read)
+        TELEMETRY.count("fanout_bytes_written", self.bytes_fanned)
+        TELEMETRY.count("fanout_detached", self.detached)
+        return RC_FATAL if self.cancel.is_set() else rc
+
+    def _summary(self, elapsed):
+        # Una línea por destino y la tabla con la suma de todos; rc es la unión de los de cada destino
+        rc = 0
+        stats = {s: dict.fromkeys(("total", "copied", "skipped", "mismatch", "failed", "extras"), 0)
+                 for s in ("dirs", "files", "bytes")}
+        self.emit("\n")
+        for i, engine in enumerate(self.engines, 1):
+            code = RC_FATAL if engine.fatal else engine.return_code()
+            rc |= code
+            files = engine.stats["files"]
+            self.emit(f"  Destino {i} : {engine.dst}{os.sep}  rc={code}  copiados {files['copied']}, "
+                      f"omitidos {files['skipped']}, extras {files['extras']}, fallidos {files['failed']}\n")
+            for section, row in stats.items():
+                for column, value in engine.stats[section].items():
+                    row[column] += value
+        self.emit(f"  Lectura compartida: {self.bytes_read} bytes leídos del origen para {self.bytes_fanned} "
+                  f"escritos; {self.detached} archivos copiados aparte por un destino retrasado o con error\n")
+        for line in format_summary(stats, elapsed):
+            self.emit(line)
+        return rc
+
+
+class FanOutBackend:
+    """
+    Backend de los trabajos con /TO:. Interpreta los argumentos de cada
+    destino con parse_robocopy_args y lanza un FanOutEngine. /LOG (el primero
+    que aparezca) recibe la salida combinada, como con /TEE.
+    """
+    name = "nativo"
+
+    @staticmethod
+    def available():
+        return True
+
+    def run(self, cmd, on_line, cancel=None, throttle=None):
+        src, targets, threads = split_fanout_cmd(cmd)
+        targets = [(dst, parse_robocopy_args(args)) for dst, args in targets]
+        log_opts = next((opts for _, opts in targets if opts.log_path), None)
+        log = None
+        if log_opts is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(log_opts.log_path)), exist_ok=True)
+            log = open(log_opts.log_path, "a" if log_opts.log_append else "w", encoding="utf-8")
+
+        def emit(line):
+            if log:
+                log.write(line)
+            on_line(line)
+
+        try:
+            return FanOutEngine(src, targets, emit, cancel, threads or 8, throttle).run()
+        finally:
+            if log:
+                log.close()
@@ -0,0 +1,107 @@
+# paquetes.py
+import os
+from rutas import partial_path, discard_partial
+
+# Copia en paquetes de archivos pequeños (/BUNDLE[:KB], propio de Valkyria; lo
+# aplica el motor nativo). Contra SMB o una WAN cada archivo cuesta varias
+# idas y vueltas (abrir, escribir, cerrar, copiar fechas, atributos...) y con
+# miles de archivos de pocos KB eso manda, pongas los /MT que pongas.
+#
+# Sin un agente al otro lado cada archivo se sigue creando uno a uno en el
+# destino; lo que se ahorra es lo de alrededor:
+# - Origen: los archivos de hasta el límite de una carpeta se leen seguidos en
+#   una tarea y las fechas, permisos y atributos salen del stat del recorrido,
+#   sin el stat del origen que hace shutil.copystat por archivo.
+# - Destino: permisos y fechas se ponen sobre el descriptor ya abierto, en vez
+#   de volver a abrir el archivo por su ruta para cada cosa.
+# Cada archivo se escribe con un nombre temporal y se renombra al final, como
+# en la copia normal: nunca queda uno a medias con el nombre bueno (con la
+# fecha de ahora, /XO lo daría por más nuevo y no volvería a copiarlo).
+# Un archivo que cambió de tamaño desde el recorrido, o que no se puede leer o
+# escribir así, sigue el camino normal de copia (con sus reintentos).
+BUNDLE = "/BUNDLE"
+DEFAULT_LIMIT = 64 * 1024       # tamaño máximo de archivo que se empaqueta
+BUNDLE_FILES = 256              # archivos por paquete
+BUNDLE_BYTES = 8 * 1024 * 1024  # bytes por paquete
+# Atributos de Windows que copia /COPY:A (solo lectura, oculto, sistema, archivo, no indexar)
+_ATTR_MASK = 0x1 | 0x2 | 0x4 | 0x20 | 0x2000
+_UTIME_FD = os.utime in os.supports_fd
+
+
+def wants_bundles(cmd):
+    return any(a.upper().split(":")[0] == BUNDLE for a in cmd)
+
+
+class BundleEntry:
+    __slots__ = ("name", "mode", "attrs", "atime_ns", "mtime_ns", "data")
+
+    def __init__(self, name, st, data):
+        self.name = name
+        self.mode = st.st_mode & 0o7777
+        self.attrs = getattr(st, "st_file_attributes", 0) & _ATTR_MASK
+        self.atime_ns = st.st_atime_ns
+        self.mtime_ns = st.st_mtime_ns
+        self.data = data
+
+
+def read_bundle(src_dir, items, limit):
+    """
+    Lee seguidos los archivos items = [(nombre, stat del recorrido)] de
+    src_dir, cada uno hasta limit bytes. Devuelve (entradas, resto): las
+    BundleEntry leídas y los items que no se pudieron leer o cuyo tamaño ya no
+    es el del recorrido, para que sigan el camino normal.
+    """
+    entries, rest = [], []
+    for name, st in items:
+        try:
+            with open(os.path.join(src_dir, name), "rb") as f:
+                data = f.read(limit + 1)
+        except OSError:
+            rest.append((name, st))
+            continue
+        if len(data) != st.st_size or len(data) > limit:
+            rest.append((name, st))
+            continue
+        entries.append(BundleEntry(name, st, data))
+    return entries, rest
+
+
+def _set_attrs(path, attrs):
+    import ctypes
+    if not ctypes.windll.kernel32.SetFileAttributesW(path, attrs or 0x80):
+        raise ctypes.WinError()
+
+
+def write_entry(entry, dst_dir, sync=False):
+    """
+    Escribe una entrada en dst_dir: a un temporal en la misma carpeta, con
+    permisos y fechas puestos sobre el descriptor abierto, y rename atómico
+    al nombre final. Con sync, fsync antes de cerrar. Devuelve los bytes
+    escritos.
+    """
+    path = os.path.join(dst_dir, entry.name)
+    tmp = partial_path(path)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        try:
+            view = memoryview(entry.data)
+            while view:
+                view = view[os.write(fd, view):]
+            if os.name != "nt":
+                os.fchmod(fd, entry.mode)
+            if _UTIME_FD:
+                os.utime(fd, ns=(entry.atime_ns, entry.mtime_ns))
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if not _UTIME_FD:
+            os.utime(tmp, ns=(entry.atime_ns, entry.mtime_ns))
+        os.replace(tmp, path)
+    except BaseException:
+        discard_partial(tmp)
+        raise
+    if os.name == "nt" and entry.attrs != 0x20:
+        # Un archivo nuevo ya nace con "archivo"; el resto (solo lectura al final) se pone aquí
+        _set_attrs(path, entry.attrs)
+    return len(entry.data)
@@ -0,0 +1,248 @@
+# particiones.py
+import os, time, fnmatch, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from analizador import RobocopyParser, SUMMARY_COLUMNS
+from motor_nativo import parse_robocopy_args, format_summary, RC_FATAL
+from preescaneo import scan_tree
+
+# Copia por particiones: un robocopy con /MT sigue recorriendo los directorios
+# en un solo hilo, así que en árboles enormes los hilos de copia esperan. Aquí
+# el origen se parte en subárboles (carpetas de primer nivel o grupos
+# equilibrados por tamaño) y varios procesos trabajan a la vez. Cada carpeta
+# partida se copia con /LEV:1 (sus archivos y, con /MIR o /PURGE, sus extras) y
+# cada hijo con su propio comando, así cada uno purga solo dentro de lo suyo.
+#
+# Unidades L: con /MIR /LEV:1. robocopy solo recorre esa carpeta: copia sus
+# archivos y, al comparar con el destino, marca como *EXTRA los archivos y las
+# carpetas que no están en el origen y con /PURGE los borra (una carpeta
+# sobrante se borra entera, aunque esté más abajo del nivel). Las subcarpetas
+# que sí están en el origen no son extras y no se tocan: las cubre su propia
+# unidad. El motor nativo sigue la misma regla (tests/test_particiones.py
+# comprueba un espejo con sobrantes a varias profundidades); con robocopy.exe
+# no hay prueba automática porque solo existe en Windows.
+SHARDS = "/SHARDS:"         # modificador propio: lo quita el planificador, robocopy no lo ve
+BYTES_PER_ENTRY = 1 << 20   # cuánto "pesa" un MB frente a una entrada de directorio al repartir
+MAX_DEPTH = 3
+
+
+class Shard:
+    """
+    Un trabajo de la partición: rel es la carpeta relativa al origen ('/'
+    como separador, '' la raíz) y recursive indica si va entero o con /LEV:1.
+    """
+
+    def __init__(self, rel, recursive, weight=0):
+        self.rel = rel
+        self.recursive = recursive
+        self.weight = weight
+
+    def __repr__(self):
+        return f"Shard({self.rel!r}, {'subárbol' if self.recursive else 'nivel'}, {self.weight:.0f})"
+
+
+def split_shard_arg(cmd):
+    # (comando sin /SHARDS:n, n) ; n = 0 si no se pidió partición
+    shards, rest = 0, []
+    for arg in cmd:
+        if arg.upper().startswith(SHARDS):
+            shards = int(arg[len(SHARDS):] or 0)
+        else:
+            rest.append(arg)
+    return rest, shards
+
+
+def _join(root, rel):
+    return os.path.join(root, *rel.split("/")) if rel else root
+
+
+def _skip_dir(entry, opts):
+    if opts.exclude_junctions and entry.is_symlink():
+        return True
+    # /XD se compara con el nombre o con la ruta completa, igual que en el motor nativo
+    return any(fnmatch.fnmatch(entry.name, p) or os.path.normcase(entry.path) == os.path.normcase(os.path.abspath(p))
+               for p in opts.exclude_dirs)
+
+
+def _subdirs(path, opts):
+    try:
+        with os.scandir(path) as it:
+            return sorted(e.name for e in it if e.is_dir() and not _skip_dir(e, opts))
+    except OSError:
+        return []
+
+
+def scan_weights(root, opts, max_depth=MAX_DEPTH, workers=8):
+    """
+    Pasada previa (preescaneo, con su caché por carpeta) para repartir por
+    tamaño. Devuelve {rel: [archivos, carpetas, bytes]} hasta max_depth.
+    """
+    return scan_tree(root, opts, workers).weights(max_depth)
+
+
+def _weight(w):
+    return w[0] + w[1] + w[2] / BYTES_PER_ENTRY
+
+
+def plan_shards(src, args, workers=4, strategy="size", max_depth=MAX_DEPTH):
+    """
+    Lista de Shard para copiar src con los argumentos args, de mayor a menor
+    peso (los grandes primero para que no queden solos al final). strategy:
+      "top"   una partición por carpeta de primer nivel, sin pasada previa
+              (salvo con /S sin /E)
+      "size"  pasada rápida y se parten las carpetas que pesan más de lo que
+              toca a cada proceso, hasta max_depth niveles
+    Sin recursión (/S, /E, /MIR) o con /LEV no hay nada que partir.
+    """
+    opts = parse_robocopy_args(args)
+    if not opts.subdirs or opts.levels is not None:
+        return [Shard("", True)]
+    if strategy == "top" and (opts.empty_dirs or opts.purge):
+        # Con /S solo hace falta la pasada para no crear carpetas vacías
+        return [Shard("", False)] + [Shard(name, True) for name in _subdirs(src, opts)]
+
+    weights = scan_weights(src, opts, max_depth, workers)
+    top = _subdirs(src, opts)
+    total = sum(_weight(weights.get(name, (0, 0, 0))) for name in top)
+    target = max(total / (workers * 2), 1)
+    shards = []
+
+    def split(rel, children):
+        own = _weight(weights.get(rel, (0, 0, 0))) - sum(_weight(weights.get(c, (0, 0, 0))) for c in children)
+        shards.append(Shard(rel, False, max(own, 0)))
+        for child in children:
+            w = weights.get(child, [0, 0, 0])
+            if not opts.empty_dirs and not opts.purge and w[0] == 0:
+                # Con /S sin /E una carpeta sin archivos no se crea en destino
+                continue
+            if _weight(w) > target and child.count("/") + 1 < max_depth and w[1]:
+                split(child, [f"{child}/{n}" for n in _subdirs(_join(src, child), opts)])
+            else:
+                shards.append(Shard(child, True, _weight(w)))
+
+    split("", top)
+    shards.sort(key=lambda s: -s.weight)
+    return shards
+
+
+class ShardedBackend:
+    """
+    Envuelve otro backend: parte el trabajo con plan_shards y lanza hasta
+    workers comandos a la vez. Cada línea de archivo/carpeta/error pasa tal
+    cual; las cabeceras y tablas de cada parte se sustituyen por una cabecera
+    y una tabla final sumadas, así el analizador ve una sola ejecución.
+    El /MT del comando se reparte entre los procesos. /LOG se escribe una vez
+    con la salida combinada. Con journal (puntos_control.Journal) el plan y
+    cada partición terminada quedan apuntados y al reanudar se saltan.
+    throttle (ancho_banda.TokenBucket) se comparte entre las particiones del
+    motor nativo; con robocopy el límite ya viene como /IPG en cada proceso.
+    """
+
+    def __init__(self, inner, workers=4, strategy="size", journal=None, throttle=None):
+        self.inner = inner
+        self.workers = max(1, workers)
+        self.strategy = strategy
+        self.journal = journal
+        self.throttle = throttle
+        self.name = inner.name
+
+    def _units(self, src, args):
+        # Unidades "T:rel" (subárbol) o "L:rel" (solo ese nivel); al reanudar, las del diario
+        if self.journal is not None and self.journal.plan:
+            return self.journal.plan
+        units = [f"{'T' if s.recursive else 'L'}:{s.rel}" for s in plan_shards(src, args, self.workers, self.strategy)]
+        if self.journal is not None:
+            self.journal.set_plan(units)
+        return units
+
+    def commands(self, cmd):
+        # [(unidad, comando)] pendientes
+        exe, src, dst, *args = cmd
+        units = self._units(src, args)
+        opts = parse_robocopy_args(args)
+        per_shard = max(1, opts.threads // min(self.workers, len(units)))
+        base = [a for a in args if not a.upper().startswith(("/MT", "/LOG"))]
+        if not opts.ipg:
+            # robocopy no admite /MT junto con /IPG
+            base.append(f"/MT:{per_shard}")
+        done = self.journal.units if self.journal is not None else ()
+        return [(unit, [exe, _join(src, unit[2:]), _join(dst, unit[2:]), *base, *([] if unit[0] == "T" else ["/LEV:1"])])
+                for unit in units if unit not in done]
+
+    def run(self, cmd, on_line, cancel=None):
+        cancel = cancel or threading.Event()
+        opts = parse_robocopy_args(cmd[3:])
+        log = None
+        if opts.log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(opts.log_path)), exist_ok=True)
+            log = open(opts.log_path, "a" if opts.log_append else "w", encoding="utf-8")
+        out_lock = threading.Lock()
+
+        def emit(line):
+            with out_lock:
+                if log:
+                    log.write(line)
+                on_line(line)
+
+        started, t0 = datetime.now(), time.monotonic()
+        try:
+            cmds = self.commands(cmd)
+            emit("-" * 79 + "\n")
+            emit(f"   ROBOCOPY     ::     {len(cmds)} particiones, {self.workers} a la vez ({self.name})\n")
+            if self.journal is not None and self.journal.units:
+                emit(f"  Reanudando: {len(self.journal.units)} particiones ya terminadas\n")
+            emit("-" * 79 + "\n")
+            emit("\n")
+            emit(f"  Started : {started:%A, %B %d, %Y %H:%M:%S}\n")
+            emit(f"   Source : {cmd[1]}{os.sep}\n")
+            emit(f"     Dest : {cmd[2]}{os.sep}\n")
+            emit("\n")
+            emit("-" * 78 + "\n")
+            emit("\n")
+            with ThreadPoolExecutor(self.workers) as pool:
+                results = list(pool.map(lambda c: self._run_one(*c, emit, cancel), cmds))
+            rc = 0
+            stats = {s: dict.fromkeys(SUMMARY_COLUMNS, 0) for s in ("dirs", "files", "bytes")}
+            for code, summary in results:
+                rc |= RC_FATAL if code is None else code
+                for section, row in stats.items():
+                    for column, value in summary.get(section, {}).items():
+                        row[column] += value
+            for line in format_summary(stats, time.monotonic() - t0):
+                emit(line)
+        finally:
+            if log:
+                log.close()
+        return RC_FATAL if cancel.is_set() else rc
+
+    def _run_one(self, unit, cmd, emit, cancel):
+        if cancel.is_set():
+            return None, {}
+        parser = RobocopyParser()
+        separators = [0]
+
+        def on_line(line):
+            parser.feed(line)
+            # Cabecera: hasta el tercer separador; tabla final: desde el cuarto
+            seps = sum(1 for text in line.splitlines() if text.startswith("---"))
+            separators[0] += seps
+            if "ERROR" in line or (separators[0] == 3 and not seps):
+                emit(line)
+
+        try:
+            if self.throttle is not None:
+                code = self.inner.run(cmd, on_line, cancel, throttle=self.throttle)
+            else:
+                code = self.inner.run(cmd, on_line, cancel)
+        except Exception as e:
+            emit(f"\nERROR en la partición {cmd[1]}: {e}\n")
+            code = None
+        if self.journal is not None and code is not None and code < 8 and not cancel.is_set():
+            # Lo copiado por el proceso de la partición tiene que estar en disco antes de
+            # apuntarla. No sabemos qué archivos son, así que se vacía la caché entera
+            # (una vez por partición); en Windows no hay equivalente sin privilegios y
+            # una caída puede costar volver a copiar las últimas particiones apuntadas
+            if hasattr(os, "sync"):
+                os.sync()
+            self.journal.add("U", unit)
+        return code, parser.metrics.summary
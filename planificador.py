@@ -0,0 +1,557 @@
+# planificador.py
+import os, json, time, sqlite3, threading
+from contextlib import nullcontext
+from analizador import RobocopyParser
+from ancho_banda import (BandwidthManager, split_bandwidth_arg, split_run_hours, in_window, next_open,
+                         format_window, mbps_to_ipg)
+from comandos import DEFAULT_THREADS, RobocopyFlags
+from motor_nativo import parse_robocopy_args
+from motores import NativeBackend, get_backend
+from bloques import DELTA, wants_delta
+from paquetes import BUNDLE, wants_bundles
+from particiones import ShardedBackend, split_shard_arg
+from multidestino import FANOUT, FanOutBackend, wants_fanout, fanout_dsts
+from puntos_control import Journal
+from rutas import app_dir
+from telemetria import TELEMETRY, PROFILE, split_profile_arg, profile_capture, append_jsonl
+
+# Cola persistente de trabajos de copia con límites por volumen y un
+# presupuesto global de hilos (/MT) repartido entre los trabajos en marcha.
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED, PAUSED = (
+    "queued", "running", "done", "failed", "cancelled", "interrupted", "paused")
+STATE_LABELS = {
+    QUEUED: "En cola", RUNNING: "Ejecutando", DONE: "Terminado", FAILED: "Fallido",
+    CANCELLED: "Cancelado", INTERRUPTED: "Interrumpido", PAUSED: "En pausa (horario)",
+}
+WAITING = (QUEUED, PAUSED)
+FINISHED = (DONE, FAILED, CANCELLED)
+RESUMABLE = (FAILED, CANCELLED)
+RESUMABLE_AGE = 7 * 86400     # fallidos y cancelados de sesiones anteriores que se siguen mostrando para reanudar
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, cmd TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0, state TEXT NOT NULL,
+    created REAL, started REAL, ended REAL, rc INTEGER, threads INTEGER
+);
+"""
+
+
+def volume_of(path):
+    """
+    Volumen de una ruta: unidad o recurso UNC en Windows, dispositivo en POSIX.
+    Para destinos que aún no existen se usa el primer ancestro existente.
+    """
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        return os.path.splitdrive(path)[0].lower()
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return path
+
+
+def requested_threads(cmd):
+    # El último /MT:n del comando (BASE_ARGS o el que eligió el usuario)
+    value = None
+    for arg in cmd:
+        if arg.upper().startswith("/MT"):
+            value = int(arg.partition(":")[2] or 8)
+    return value
+
+
+def check_cmd(cmd):
+    """
+    Lo que un comando necesita para encolarse: origen, destino y /BW y /RH
+    bien escritos. Lanza ValueError con el motivo.
+    """
+    if len(cmd) < 3 or not all(isinstance(a, str) for a in cmd):
+        raise ValueError("comando incompleto: falta el origen o el destino")
+    if not cmd[1].strip() or not cmd[2].strip():
+        raise ValueError("ruta de origen o destino vacía")
+    split_run_hours(split_bandwidth_arg(cmd)[0])
+
+
+def with_threads(cmd, threads):
+    return [a for a in cmd if not a.upper().startswith("/MT")] + [f"/MT:{threads}"]
+
+
+class Job:
+    def __init__(self, row):
+        (self.id, self.name, cmd, self.priority, self.state,
+         self.created, self.started, self.ended, self.rc, self.threads) = row
+        self.cmd = json.loads(cmd)
+        self.cancel = threading.Event()
+        self.finished = threading.Event()
+        self.on_done = None
+        self.unbuffered = False
+        self.tuned = False
+        self.paused = False
+        self.window = split_run_hours(self.cmd)[1]
+        self.expected = None    # (bytes, archivos) de la pasada previa, para la ETA
+        self.run_id = None      # última ejecución en el historial (historial.py)
+        self.metrics = None     # resumen de la última ejecución (ver Scheduler._record)
+
+    @property
+    def src(self):
+        return self.cmd[1]
+
+    @property
+    def dst(self):
+        return self.cmd[2]
+
+    @property
+    def dsts(self):
+        # Todos los destinos: con /TO: (multidestino.py) hay más de uno
+        return fanout_dsts(self.cmd) if wants_fanout(self.cmd) else [self.dst]
+
+    def effective_cmd(self):
+        # El comando tal como se lanza: con los hilos asignados y /J si lo eligió el autoajuste
+        cmd = with_threads(self.cmd, self.threads) if self.threads else list(self.cmd)
+        if self.unbuffered and RobocopyFlags.UNBUFFERED not in cmd:
+            cmd.append(RobocopyFlags.UNBUFFERED)
+        return cmd
+
+    def as_dict(self):
+        return {"id": self.id, "name": self.name, "priority": self.priority, "state": self.state,
+                "src": self.src, "dst": self.dst, "threads": self.threads, "rc": self.rc,
+                "created": self.created, "started": self.started, "ended": self.ended}
+
+
+class Scheduler:
+    """
+    Lanza los trabajos en cola por prioridad (mayor primero, luego antigüedad)
+    respetando volume_limit trabajos a la vez por volumen (origen y destino).
+    Cada trabajo recibe /MT con su parte de thread_budget; si el comando no
+    fija /MT y hay tuner (autoajuste.VolumeProfiles), el perfil del par de
+    volúmenes elige hilos y /J, y la copia terminada alimenta el perfil.
+    Con checkpoints los trabajos recursivos llevan diario (puntos_control):
+    si se cortan, al relanzarlos se salta lo ya terminado.
+    /BW:n limita el trabajo a n MB/s y bandwidth (MB/s) a todos juntos, con el
+    reparto reajustado según lo que mide cada uno (ancho_banda). Con /RH el
+    trabajo solo corre dentro de su horario: al cerrarse la ventana se pausa
+    y sigue, desde su diario, cuando vuelve a abrirse.
+    Con history (historial.RunHistory) la salida de cada ejecución queda
+    guardada e indexada. Un trabajo con /TO: copia a varios destinos
+    (multidestino.py) y ocupa el volumen de cada uno.
+    Cada ejecución deja en telemetria su duración, lo copiado y los fallos, y
+    en job.metrics (y una línea de metrics_log, JSON lines, si se indica) su
+    resumen con los segundos de cada fase. Con /PROFILE la ejecución se
+    perfila (telemetria.profile_capture).
+    on_line(job, línea) y on_change(job) se llaman desde los hilos de trabajo.
+    """
+
+    def __init__(self, db_path=None, thread_budget=32, volume_limit=1, volume_limits=None,
+                 max_running=8, on_line=None, on_change=None, backend_factory=get_backend, tuner=None,
+                 checkpoints=True, bandwidth=None, history=None, metrics_log=None):
+        self.db = sqlite3.connect(db_path or os.path.join(app_dir(), "trabajos.sqlite"), check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self.thread_budget = thread_budget
+        self.volume_limit = volume_limit
+        self.volume_limits = volume_limits or {}
+        self.max_running = max_running
+        self.on_line = on_line or (lambda job, line: None)
+        self.on_change = on_change or (lambda job: None)
+        self.backend_factory = backend_factory
+        self.tuner = tuner
+        self.checkpoints = checkpoints
+        self.bandwidth = BandwidthManager(bandwidth)
+        self.history = history
+        self.metrics_log = metrics_log
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._running = {}
+        self._stopped = False
+        self._load()
+
+    # ---------- persistencia ----------
+
+    def _load(self):
+        with self._cond:
+            # Lo que estaba en marcha cuando se cerró (o se colgó) se reanuda
+            self.db.execute("UPDATE jobs SET state=? WHERE state=?", (INTERRUPTED, RUNNING))
+            self.db.execute("UPDATE jobs SET state=? WHERE state=?", (QUEUED, INTERRUPTED))
+            self.db.commit()
+            # Los fallidos y cancelados recientes también, para poder reanudarlos
+            rows = self.db.execute("SELECT * FROM jobs WHERE state IN (?, ?) OR (state IN (?, ?) AND ended > ?)",
+                                   (*WAITING, *RESUMABLE, time.time() - RESUMABLE_AGE))
+            for row in rows.fetchall():
+                try:
+                    job = Job(row)
+                except (ValueError, TypeError, AttributeError):
+                    continue    # comando guardado por una versión que no lo validaba
+                if job.state in RESUMABLE:
+                    job.finished.set()
+                self._jobs[job.id] = job
+
+    def _save(self, job):
+        self.db.execute("UPDATE jobs SET priority=?, state=?, started=?, ended=?, rc=?, threads=? WHERE id=?",
+                        (job.priority, job.state, job.started, job.ended, job.rc, job.threads, job.id))
+        self.db.commit()
+
+    # ---------- API ----------
+
+    def submit(self, cmd, priority=0, name=None, on_done=None, expected=None):
+        # Un comando sin origen o destino, o con /BW y /RH mal escritos, falla aquí (ValueError) y no al lanzarlo
+        check_cmd(cmd)
+        with self._cond:
+            cur = self.db.execute("INSERT INTO jobs (name, cmd, priority, state, created) VALUES (?, ?, ?, ?, ?)",
+                                  (name, json.dumps(cmd), priority, QUEUED, time.time()))
+            self.db.commit()
+            job = Job(self.db.execute("SELECT * FROM jobs WHERE id=?", (cur.lastrowid,)).fetchone())
+            job.on_done = on_done
+            job.expected = expected
+            self._jobs[job.id] = job
+            self._cond.notify_all()
+        self.on_change(job)
+        return job
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return False
+            job.cancel.set()
+            if job.state in WAITING:
+                job.state = CANCELLED
+                job.ended = time.time()
+                self._save(job)
+                job.finished.set()
+            self._cond.notify_all()
+        self.on_change(job)
+        return True
+
+    def resume(self, job_id):
+        # Vuelve a encolar un trabajo cancelado o fallido; robocopy se salta lo ya copiado
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (CANCELLED, FAILED):
+                return False
+            job.state, job.rc, job.started, job.ended = QUEUED, None, None, None
+            job.cancel = threading.Event()
+            job.finished = threading.Event()
+            self._save(job)
+            self._cond.notify_all()
+        self.on_change(job)
+        return True
+
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.priority = priority
+            self._save(job)
+            self._cond.notify_all()
+        self.on_change(job)
+        return True
+
+    def clear_finished(self):
+        # También de la base: los fallidos y cancelados no vuelven a aparecer en la próxima sesión
+        with self._cond:
+            done = [j.id for j in self._jobs.values() if j.state in FINISHED]
+            for job_id in done:
+                del self._jobs[job_id]
+            self.db.executemany("DELETE FROM jobs WHERE id=?", ((job_id,) for job_id in done))
+            self.db.commit()
+
+    def jobs(self):
+        with self._cond:
+            return [j.as_dict() for j in sorted(self._jobs.values(), key=lambda j: j.id)]
+
+    def running_count(self):
+        with self._cond:
+            return len(self._running)
+
+    def wait(self, job, timeout=None):
+        job.finished.wait(timeout)
+        return job.rc
+
+    def start(self):
+        self.bandwidth.start()
+        t = threading.Thread(target=self._dispatch, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        # Los trabajos en marcha se cancelan y quedan como interrumpidos para la próxima vez
+        with self._cond:
+            self._stopped = True
+            self.bandwidth.stop()
+            for job in self._running.values():
+                job.cancel.set()
+            self._cond.notify_all()
+
+    # ---------- reparto ----------
+
+    def _volumes(self, job):
+        return {volume_of(job.src), *(volume_of(dst) for dst in job.dsts)}
+
+    def _busy(self):
+        busy = {}
+        for job in self._running.values():
+            for vol in self._volumes(job):
+                busy[vol] = busy.get(vol, 0) + 1
+        return busy
+
+    def _next_runnable(self):
+        if len(self._running) >= self.max_running:
+            return None, 0
+        busy = self._busy()
+        queued = sorted((j for j in self._jobs.values() if j.state in WAITING and in_window(j.window)),
+                        key=lambda j: (-j.priority, j.id))
+        for job in queued:
+            if all(busy.get(v, 0) < self.volume_limits.get(v, self.volume_limit) for v in self._volumes(job)):
+                return job, len(queued)
+        return None, 0
+
+    def _share(self, job, waiting):
+        # Parte del presupuesto según cuántos trabajos pueden estar a la vez en marcha
+        concurrent = min(self.max_running, len(self._running) + waiting)
+        share = max(1, self.thread_budget // max(1, concurrent))
+        requested = requested_threads(job.cmd)
+        job.tuned, job.unbuffered = False, False
+        if requested is None and self.tuner is not None:
+            requested, job.unbuffered = self.tuner.suggest(job.src, job.dst, unbuffered_ok=self._unbuffered_ok())
+            job.tuned = True
+        return min(share, requested or DEFAULT_THREADS)
+
+    def _unbuffered_ok(self):
+        # /J solo lo entiende robocopy; el motor nativo lo ignora y no se mide
+        try:
+            return self.backend_factory().name == "robocopy"
+        except Exception:
+            return False
+
+    def _pause_out_of_hours(self):
+        # Se cancela y queda en pausa: al volver a lanzarlo, el diario salta lo ya copiado
+        for job in self._running.values():
+            if not job.paused and not in_window(job.window):
+                job.paused = True
+                job.cancel.set()
+
+    def _dispatch(self):
+        with self._cond:
+            while not self._stopped:
+                self._pause_out_of_hours()
+                job, waiting = self._next_runnable()
+                TELEMETRY.gauge("jobs_queued", sum(j.state in WAITING for j in self._jobs.values()))
+                TELEMETRY.gauge("jobs_running", len(self._running))
+                if job is None:
+                    self._cond.wait(1.0)
+                    continue
+                job.threads = self._share(job, waiting)
+                job.state, job.started = RUNNING, time.time()
+                self._save(job)
+                self._running[job.id] = job
+                threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _journal(self, cmd):
+        if not self.checkpoints:
+            return None
+        opts = parse_robocopy_args(cmd[3:])
+        if not opts.subdirs or opts.levels is not None or opts.list_only:
+            return None
+        return Journal.for_cmd(cmd)
+
+    def _throttle(self, job, cmd, native, streams):
+        """
+        Aplica /BW y el límite global: el motor nativo recibe un cubo que se
+        reajusta en marcha; robocopy, un /IPG fijo calculado al lanzarlo (y sin
+        /MT, que no admite junto a /IPG). Devuelve (cmd, cubo o None).
+        """
+        cmd, cap = split_bandwidth_arg(cmd)
+        cmd, _ = split_run_hours(cmd)
+        if cap is None and self.bandwidth.limit is None:
+            return cmd, None
+        bucket = self.bandwidth.register(job.id, cap, fixed=not native)
+        if not native:
+            ipg = mbps_to_ipg(bucket.rate, streams)
+            if ipg:
+                cmd = [a for a in cmd if not a.upper().startswith(("/MT", "/IPG"))] + [f"/IPG:{ipg}"]
+                job.threads = 1
+        return cmd, bucket
+
+    def _record(self, job, backend, parser, phases, wall):
+        """
+        Resumen de la ejecución para telemetria, job.metrics y metrics_log.
+        Las fases son lo que sumó cada una mientras duró el trabajo: si había
+        otros a la vez, también incluyen lo suyo.
+        """
+        m = parser.metrics
+        TELEMETRY.observe("job", wall, backend=backend)
+        TELEMETRY.count("jobs", state=job.state)
+        TELEMETRY.count("files_copied", m.files_done)
+        TELEMETRY.count("bytes_copied", m.bytes_done)
+        TELEMETRY.count("files_failed", len(m.failed))
+        TELEMETRY.count("retries", m.retries)
+        job.metrics = {
+            "ts": round(time.time(), 3), "job": job.id, "name": job.name, "run": job.run_id,
+            "state": job.state, "rc": job.rc, "backend": backend, "threads": job.threads,
+            "elapsed": round(wall, 3), "files_copied": m.files_done, "bytes_copied": m.bytes_done,
+            "failed": len(m.failed), "retries": m.retries,
+            "phases": {k: round(v, 3) for k, v in sorted(phases.items()) if v > 0},
+        }
+        if self.metrics_log:
+            try:
+                append_jsonl(self.metrics_log, job.metrics)
+            except OSError:
+                pass
+
+    def _run(self, job):
+        self.on_change(job)
+        run = _Run(self, job)
+        phases = TELEMETRY.phase_totals()
+        t0 = time.perf_counter()
+        rc = None
+        try:
+            backend, fanout = self._select_backend(job, run)
+            rc = self._execute(job, run, backend, fanout)
+        except Exception as e:
+            run.line(f"\nERROR: {e}\n")
+        self._settle(job, run, rc)
+        wall = time.perf_counter() - t0
+        after = TELEMETRY.phase_totals()
+        self._record(job, run.backend_name, run.parser,
+                     {k: v - phases.get(k, 0.0) for k, v in after.items() if k != "job"}, wall)
+        self._close_run(job, run, rc)
+        if job.state == PAUSED:
+            # No ha terminado: vuelve a la cola hasta que se abra su horario
+            self.on_line(job, f"\nEn pausa: fuera del horario /RH:{format_window(job.window)}; "
+                              f"sigue a las {next_open(job.window):%H:%M}\n")
+            self.on_change(job)
+            return
+        job.finished.set()
+        self.on_change(job)
+        if job.on_done and job.state == DONE:
+            job.on_done(rc)
+
+    def _select_backend(self, job, run):
+        """
+        Backend de la ejecución: el de backend_factory salvo que el comando
+        pida algo que solo hace el motor nativo. Devuelve (backend, fanout).
+        """
+        backend = self.backend_factory()
+        # robocopy no sabe empaquetar ni copiar por bloques: /BUNDLE y /DELTA solo los aplica el motor nativo
+        if wants_bundles(job.cmd) and not isinstance(backend, NativeBackend):
+            run.line(f"{BUNDLE} (paquetes de archivos pequeños): se copia con el motor nativo\n")
+            backend = NativeBackend()
+        if wants_delta(job.cmd) and not isinstance(backend, NativeBackend):
+            run.line(f"{DELTA} (copia por bloques de archivos grandes): se copia con el motor nativo\n")
+            backend = NativeBackend()
+        # /TO: (varios destinos con una sola lectura del origen) también es del motor nativo
+        fanout = wants_fanout(job.cmd)
+        if fanout:
+            if not isinstance(backend, NativeBackend):
+                run.line(f"{FANOUT} (varios destinos): se copia con el motor nativo\n")
+            backend = FanOutBackend()
+        run.native = fanout or isinstance(backend, NativeBackend)
+        run.backend_name = backend.name
+        return backend, fanout
+
+    def _execute(self, job, run, backend, fanout):
+        # Prepara el comando (particiones, perfil, ancho de banda, diario) y lo lanza; devuelve el rc
+        native = run.native
+        # /SHARDS:n (propio de Valkyria) reparte el trabajo en n procesos a la vez
+        cmd, shards = split_shard_arg(job.effective_cmd())
+        if fanout and shards > 1:
+            run.line(f"{FANOUT}: el trabajo no se parte en particiones\n")
+        cmd, profile = split_profile_arg(cmd)
+        cmd, run.bucket = self._throttle(job, cmd, native, max(1, shards))
+        run.journal = None if fanout else self._journal(cmd)
+        journal, throttle = run.journal, run.bucket if native else None
+        # /PROFILE (propio de Valkyria): cProfile y tracemalloc solo para esta ejecución
+        with profile_capture(f"trabajo_{job.id}") if profile else nullcontext() as capture:
+            if fanout:
+                rc = backend.run(cmd, run.line, job.cancel, throttle=throttle)
+            elif shards > 1 or (journal is not None and not native):
+                # robocopy no sabe de diarios: se apunta por particiones (de primer nivel si no se pidieron)
+                backend = ShardedBackend(backend, max(1, shards), "size" if shards > 1 else "top", journal, throttle)
+                rc = backend.run(cmd, run.line, job.cancel)
+            elif native:
+                rc = backend.run(cmd, run.line, job.cancel, journal=journal, throttle=throttle)
+            else:
+                rc = backend.run(cmd, run.line, job.cancel)
+        if capture is not None:
+            run.line(f"\n{PROFILE}: perfil en {capture.report_path} (pico de memoria "
+                     f"{capture.peak_bytes // 1024} KB; {os.path.basename(capture.stats_path)} para snakeviz)\n")
+        return rc
+
+    def _settle(self, job, run, rc):
+        # Estado final de la ejecución: terminado, fallido, cancelado, interrumpido o en pausa
+        if run.bucket is not None:
+            self.bandwidth.unregister(job.id)
+        with self._cond:
+            del self._running[job.id]
+            job.rc = rc
+            job.ended = time.time()
+            if self._stopped and job.cancel.is_set():
+                job.state = INTERRUPTED
+            elif job.paused and not self._stopped:
+                job.state = PAUSED
+                job.paused = False
+                job.cancel = threading.Event()
+            elif job.cancel.is_set():
+                job.state = CANCELLED
+            else:
+                job.state = DONE if rc is not None and rc < 8 else FAILED
+            self._save(job)
+            self._cond.notify_all()
+
+    def _close_run(self, job, run, rc):
+        # Cierra el historial y el diario y, si procede, enseña al autoajuste lo medido
+        if run.log is not None:
+            try:
+                run.log.close(job.state, rc)
+            except (OSError, sqlite3.Error):
+                pass
+        if run.journal is not None:
+            if job.state == DONE:
+                run.journal.discard()
+            else:
+                run.journal.close()
+        # Con límite de ancho de banda (o varios destinos) la velocidad no dice nada del par de discos: no se aprende
+        if job.tuned and run.bucket is None and job.state == DONE and len(job.dsts) == 1:
+            run.parser.metrics.finish()
+            try:
+                self.tuner.record(job.src, job.dst, job.threads, job.unbuffered, run.parser.metrics)
+            except OSError:
+                pass
+
+
+class _Run:
+    """
+    Lo de una ejecución de un trabajo: analizador de su salida, registro en el
+    historial, cubo de ancho de banda y diario. line() es el on_line que
+    reciben los backends.
+    """
+
+    def __init__(self, scheduler, job):
+        self.scheduler = scheduler
+        self.job = job
+        self.parser = RobocopyParser()
+        self.log = self.bucket = self.journal = None
+        self.native = False
+        self.backend_name = ""
+        try:
+            if scheduler.history is not None:
+                self.log = scheduler.history.open_run(job.name, job.cmd, job.id)
+                job.run_id = self.log.run_id
+        except (OSError, sqlite3.Error) as e:
+            scheduler.on_line(job, f"Aviso: no se guarda en el historial ({e})\n")
+
+    def line(self, line):
+        self.parser.feed(line)
+        if self.bucket is not None and not self.native:
+            self.scheduler.bandwidth.report(self.job.id, self.parser.metrics.bytes_done)
+        if self.log is not None:
+            try:
+                self.log.write(line)
+            except OSError:
+                pass
+        self.scheduler.on_line(self.job, line)
@@ -0,0 +1,361 @@
+# preescaneo.py
+import os, sys, json, time, sqlite3, argparse, threading
+from collections import deque
+from datetime import timedelta
+from analizador import format_bytes
+from motor_nativo import Selector, is_link, parse_robocopy_args
+from rutas import app_dir
+from telemetria import TELEMETRY
+
+# Pasada previa: cuántos archivos y bytes va a mover un trabajo (con sus
+# filtros /MAXAGE, /MINAGE, /MIN, /MAX, /XF, /XD...) y cómo se reparten por
+# tamaño y antigüedad, antes de lanzarlo. Sirve para la ETA de la interfaz y
+# para repartir particiones por peso.
+#
+# Cada carpeta se lista en un pool de hilos con robo de trabajo: cada hilo
+# tiene su cola de carpetas (saca por el final, en profundidad) y cuando se
+# queda sin nada roba por el principio de la de otro. El listado crudo de
+# cada carpeta (nombre, tamaño, mtime) se guarda en una caché SQLite con el
+# mtime de la carpeta: la siguiente pasada solo vuelve a listar las carpetas
+# cuyo mtime cambió. Igual que el modo quick del índice, un archivo
+# modificado en su sitio no cambia el mtime de su carpeta, así que cada
+# FULL_RESCAN_EVERY se relista todo.
+FULL_RESCAN_EVERY = 24 * 3600
+SIZE_BUCKETS = (4 << 10, 64 << 10, 1 << 20, 16 << 20, 256 << 20, 4 << 30)
+AGE_BUCKETS = (1, 7, 30, 90, 365)      # días
+SIZE_LABELS = ("< 4 KB", "< 64 KB", "< 1 MB", "< 16 MB", "< 256 MB", "< 4 GB", ">= 4 GB")
+AGE_LABELS = ("< 1 día", "< 1 semana", "< 1 mes", "< 3 meses", "< 1 año", ">= 1 año")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL, path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, listing TEXT NOT NULL,
+    PRIMARY KEY (root, path)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS roots (root TEXT PRIMARY KEY, full REAL);
+"""
+
+
+def _bucket(value, limits):
+    for i, limit in enumerate(limits):
+        if value < limit:
+            return i
+    return len(limits)
+
+
+def _join(root, rel):
+    return os.path.join(root, *rel.split("/")) if rel else root
+
+
+class ScanProfile:
+    """
+    Resultado de la pasada. files/bytes son los que cumplen los filtros;
+    skipped_* los que no. per_dir = {rel: [archivos, subcarpetas, bytes]} de
+    cada carpeta (solo lo suyo, sin lo de debajo). size_hist y age_hist son
+    listas de [archivos, bytes] por tramo (SIZE_LABELS, AGE_LABELS).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = self.bytes = self.dirs = 0
+        self.skipped_files = self.skipped_bytes = 0
+        self.size_hist = [[0, 0] for _ in SIZE_LABELS]
+        self.age_hist = [[0, 0] for _ in AGE_LABELS]
+        self.per_dir = {}
+        self.relisted = 0
+        self.cached = 0
+        self.elapsed = 0.0
+
+    @property
+    def avg_size(self):
+        return self.bytes / self.files if self.files else 0
+
+    def weights(self, max_depth):
+        """
+        {rel: [archivos, carpetas, bytes]} acumulado en cada carpeta de
+        profundidad 1..max_depth (lo que usa particiones para repartir).
+        """
+        weights = {}
+        for rel, (files, dirs, nbytes) in self.per_dir.items():
+            if not rel:
+                continue
+            parts = rel.split("/")
+            for depth in range(1, min(len(parts), max_depth) + 1):
+                acc = weights.setdefault("/".join(parts[:depth]), [0, 0, 0])
+                acc[0] += files
+                acc[1] += dirs
+                acc[2] += nbytes
+        return weights
+
+    def summary(self):
+        text = f"{self.files} archivos, {format_bytes(self.bytes)} en {self.dirs} carpetas"
+        if self.skipped_files:
+            text += f" ({self.skipped_files} fuera de los filtros, {format_bytes(self.skipped_bytes)})"
+        return text
+
+    def histogram_lines(self):
+        lines = []
+        for title, labels, hist in (("Tamaño", SIZE_LABELS, self.size_hist), ("Antigüedad", AGE_LABELS, self.age_hist)):
+            lines.append(f"{title}:")
+            for label, (files, nbytes) in zip(labels, hist):
+                if files:
+                    lines.append(f"  {label:>11}  {files:>9} archivos  {format_bytes(nbytes):>10}")
+        return lines
+
+    def as_dict(self):
+        return {"root": self.root, "files": self.files, "bytes": self.bytes, "dirs": self.dirs,
+                "skipped_files": self.skipped_files, "skipped_bytes": self.skipped_bytes,
+                "size_hist": dict(zip(SIZE_LABELS, self.size_hist)), "age_hist": dict(zip(AGE_LABELS, self.age_hist)),
+                "relisted": self.relisted, "cached": self.cached, "elapsed": round(self.elapsed, 3)}
+
+
+class ScanCache:
+    """
+    Listados por carpeta de cada raíz: {rel: (mtime_ns de la carpeta,
+    JSON {"d": [[nombre, es_enlace]], "f": [[nombre, tamaño, mtime, es_enlace]]})}.
+    Son listados crudos: los filtros de cada trabajo se aplican al leerlos.
+    """
+
+    def __init__(self, path=None):
+        self.conn = sqlite3.connect(path or os.path.join(app_dir(), "preescaneo.sqlite"), timeout=30)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def load(self, root):
+        return {path: (mtime_ns, listing) for path, mtime_ns, listing in
+                self.conn.execute("SELECT path, mtime_ns, listing FROM dirs WHERE root=?", (root,))}
+
+    def last_full(self, root):
+        row = self.conn.execute("SELECT full FROM roots WHERE root=?", (root,)).fetchone()
+        return row[0] if row else 0
+
+    def save(self, root, changed, removed, full=False):
+        """
+        Guarda los listados nuevos (changed) y quita las carpetas de removed
+        con lo que colgaba de ellas. Con full, changed es todo lo que se vio:
+        lo demás de la raíz ya no existe (o no se pudo leer) y se borra.
+        """
+        like = lambda rel: rel.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+        with self.conn:
+            if full:
+                self.conn.execute("DELETE FROM dirs WHERE root=?", (root,))
+            self.conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                                  ((root, rel, mtime_ns, listing) for rel, (mtime_ns, listing) in changed.items()))
+            for rel in removed:
+                # La carpeta ya no está: fuera ella y todo lo que colgaba de ella
+                self.conn.execute("DELETE FROM dirs WHERE root=? AND (path=? OR path LIKE ? ESCAPE '\\')",
+                                  (root, rel, like(rel)))
+            if full:
+                self.conn.execute("INSERT OR REPLACE INTO roots VALUES (?, ?)", (root, time.time()))
+
+
+class _Scanner:
+    def __init__(self, root, opts, known, workers, cancel):
+        self.root = root
+        self.opts = opts
+        self.select = Selector(opts)
+        self.known = known
+        self.cancel = cancel
+        self.now = time.time()
+        self.queues = [deque() for _ in range(workers)]
+        self.pending = 0
+        self.cond = threading.Condition()
+        self.results = []
+        self.changed = {}
+        self.removed = []
+
+    # ---------- una carpeta ----------
+
+    def _list(self, rel):
+        # (listado, relistada): de la caché si la carpeta no ha cambiado; None si no se puede leer
+        path = _join(self.root, rel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self.known.get(rel)
+        if cached is not None and cached[0] == mtime_ns:
+            return json.loads(cached[1]), False
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    # Crudo y siguiendo enlaces: la caché sirve a trabajos con y sin /XJ
+                    try:
+                        link = is_link(e)
+                        if e.is_dir():
+                            dirs.append([e.name, link])
+                        elif e.is_file():
+                            st = e.stat()
+                            files.append([e.name, st.st_size, st.st_mtime, link])
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        listing = {"d": dirs, "f": files}
+        self.changed[rel] = (mtime_ns, json.dumps(listing, ensure_ascii=False, separators=(",", ":")))
+        if cached is not None:
+            old = {name for name, _ in json.loads(cached[1])["d"]}
+            self.removed.extend(f"{rel}/{name}" if rel else name for name in old - {name for name, _ in dirs})
+        return listing, True
+
+    def _visit(self, task, acc):
+        rel, level = task
+        got = self._list(rel)
+        if got is None:
+            return []
+        listing, relisted = got
+        o = self.opts
+        acc.dirs += 1
+        acc.relisted += relisted
+        files = nbytes = 0
+        for name, size, mtime, *link in listing["f"]:
+            # Los listados guardados por versiones anteriores no traen la marca de enlace
+            if o.exclude_junctions and link and link[0]:
+                continue
+            if self.select.excluded_values(name, size, mtime):
+                acc.skipped_files += 1
+                acc.skipped_bytes += size
+                continue
+            files += 1
+            nbytes += size
+            hist = acc.size_hist[_bucket(size, SIZE_BUCKETS)]
+            hist[0] += 1
+            hist[1] += size
+            hist = acc.age_hist[_bucket((self.now - mtime) / 86400, AGE_BUCKETS)]
+            hist[0] += 1
+            hist[1] += size
+        acc.files += files
+        acc.bytes += nbytes
+        children = []
+        if o.subdirs and (o.levels is None or level < o.levels):
+            for name, link in listing["d"]:
+                if o.exclude_junctions and link:
+                    continue
+                if self.select.excluded_dir(name, os.path.join(_join(self.root, rel), name)):
+                    continue
+                children.append((f"{rel}/{name}" if rel else name, level + 1))
+        acc.per_dir[rel] = [files, len(children), nbytes]
+        return children
+
+    # ---------- pool con robo de trabajo ----------
+
+    def _take(self, i):
+        try:
+            return self.queues[i].pop()
+        except IndexError:
+            pass
+        for k in range(1, len(self.queues)):
+            try:
+                return self.queues[(i + k) % len(self.queues)].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _work(self, i):
+        acc = ScanProfile(self.root)
+        self.results.append(acc)
+        while True:
+            task = self._take(i)
+            if task is None:
+                with self.cond:
+                    if not self.pending:
+                        return
+                    self.cond.wait(0.05)
+                continue
+            children = [] if self.cancel is not None and self.cancel.is_set() else self._visit(task, acc)
+            with self.cond:
+                # Se cuentan antes de publicarlos: así pending nunca llega a 0 con trabajo a medias
+                self.pending += len(children)
+            self.queues[i].extend(children)
+            with self.cond:
+                self.pending -= 1
+                if children or not self.pending:
+                    self.cond.notify_all()
+
+    def run(self):
+        self.pending = 1
+        self.queues[0].append(("", 1))
+        threads = [threading.Thread(target=self._work, args=(i,), daemon=True) for i in range(len(self.queues))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        profile = ScanProfile(self.root)
+        for acc in self.results:
+            for field in ("files", "bytes", "dirs", "skipped_files", "skipped_bytes", "relisted"):
+                setattr(profile, field, getattr(profile, field) + getattr(acc, field))
+            for total, part in ((profile.size_hist, acc.size_hist), (profile.age_hist, acc.age_hist)):
+                for row, add in zip(total, part):
+                    row[0] += add[0]
+                    row[1] += add[1]
+            profile.per_dir.update(acc.per_dir)
+        profile.cached = profile.dirs - profile.relisted
+        return profile
+
+
+def scan_tree(root, opts, workers=16, use_cache=True, full=False, cache_path=None, cancel=None):
+    """
+    Pasada previa de root con las opciones de robocopy opts (NativeOptions).
+    Con caché solo se vuelven a listar las carpetas cuyo mtime cambió (todo
+    con full o si hace más de FULL_RESCAN_EVERY de la última completa).
+    Devuelve un ScanProfile.
+    """
+    t0 = time.monotonic()
+    root = os.path.abspath(root)
+    key = os.path.normcase(root)
+    cache = ScanCache(cache_path) if use_cache else None
+    try:
+        if cache is not None and not full:
+            full = time.time() - cache.last_full(key) > FULL_RESCAN_EVERY
+        known = cache.load(key) if cache is not None and not full else {}
+        scanner = _Scanner(root, opts, known, max(1, workers), cancel)
+        profile = scanner.run()
+        if cache is not None and not (cancel is not None and cancel.is_set()):
+            cache.save(key, scanner.changed, scanner.removed, full)
+    finally:
+        if cache is not None:
+            cache.close()
+    profile.elapsed = time.monotonic() - t0
+    TELEMETRY.observe("prescan", profile.elapsed)
+    TELEMETRY.count("files_scanned", profile.files + profile.skipped_files, by="prescan")
+    TELEMETRY.count("dirs_scanned", profile.dirs, by="prescan")
+    return profile
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "desconocida"
+    return str(timedelta(seconds=int(seconds)))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cuenta lo que copiaría un trabajo sin copiar nada")
+    ap.add_argument("src")
+    ap.add_argument("flags", nargs="*", help="Modificadores de robocopy (por defecto /E)")
+    ap.add_argument("--dst", help="Destino, para estimar la duración con el perfil de los volúmenes")
+    ap.add_argument("--full", action="store_true", help="Relistar todo aunque haya caché")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--json", help="Guardar el resultado en este archivo")
+    ap.add_argument("--workers", type=int, default=16)
+    args = ap.parse_args(argv)
+    profile = scan_tree(args.src, parse_robocopy_args(args.flags or ["/E"]), args.workers,
+                        use_cache=not args.no_cache, full=args.full)
+    print(profile.summary())
+    print("\n".join(profile.histogram_lines()))
+    print(f"{profile.relisted} carpetas listadas, {profile.cached} de la caché ({profile.elapsed:.2f} s)")
+    result = profile.as_dict()
+    if args.dst:
+        from autoajuste import VolumeProfiles
+        eta = VolumeProfiles().estimate(args.src, args.dst, profile.bytes, profile.files)
+        print(f"Duración estimada: {format_duration(eta)}")
+        result["eta_seconds"] = eta
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# puntos_control.py
+import os, json, time, hashlib, threading
+from rutas import app_dir
+
+# Diario de puntos de control de un trabajo: qué carpetas, subárboles o
+# particiones ya quedaron copiados. Si Valkyria o el equipo se caen, al
+# relanzar el mismo trabajo se salta lo terminado en vez de volver a recorrer
+# todo. Se escribe solo añadiendo líneas y con fsync por lotes: una caída
+# pierde como mucho el último lote, que simplemente se vuelve a copiar. Quien
+# apunta algo tiene que haberlo llevado antes a disco (el motor nativo hace
+# fsync de cada copia y de la carpeta; las particiones, os.sync): si no, tras
+# una caída el diario daría por copiados archivos que se quedaron en caché.
+#
+#   VALKYRIA-DIARIO 1 <firma> <creado>
+#   P\t<unidad>     plan de particiones (para no volver a calcularlo)
+#   U\t<unidad>     partición terminada
+#   D\t<rel>        archivos de la carpeta terminados (motor nativo)
+#   T\t<rel>        subárbol completo terminado (motor nativo)
+HEADER = "VALKYRIA-DIARIO 1"
+SYNC_EVERY = 1000           # entradas por lote
+SYNC_INTERVAL = 2.0         # segundos como mucho entre fsync
+MAX_AGE = 2 * 86400         # un diario más viejo no se reanuda: el origen habrá cambiado
+
+
+def signature(cmd):
+    # Identifica el trabajo sin los modificadores que pueden cambiar entre intentos
+    stable = [a for a in cmd if not a.upper().startswith(("/MT", "/J", "/SHARDS", "/BW", "/IPG", "/RH", "/PF", "/BUNDLE", "/DELTA", "/PROFILE"))]
+    return hashlib.sha1(json.dumps(stable).encode("utf-8")).hexdigest()[:20]
+
+
+class Journal:
+
+    def __init__(self, path, sig):
+        self.path = path
+        self.signature = sig
+        self.plan = []
+        self.units, self.dirs, self.subtrees = set(), set(), set()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_sync = time.monotonic()
+        resumed = self._load()
+        self._file = open(path, "a" if resumed else "w", encoding="utf-8", newline="\n")
+        if not resumed:
+            self._file.write(f"{HEADER} {sig} {int(time.time())}\n")
+            self._sync()
+        self.resumed = resumed
+
+    @classmethod
+    def for_cmd(cls, cmd):
+        sig = signature(cmd)
+        return cls(os.path.join(app_dir("puntos_control"), f"{sig}.diario"), sig)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8", newline="\n") as f:
+                data = f.read()
+        except OSError:
+            return False
+        lines = data.split("\n")
+        head = lines[0].split(" ")
+        if " ".join(head[:2]) != HEADER or len(head) < 4 or head[2] != self.signature:
+            return False
+        if time.time() - int(head[3]) > MAX_AGE:
+            return False
+        # La última línea puede haber quedado a medias (sin \n): se ignora
+        for line in lines[1:-1]:
+            kind, _, value = line.partition("\t")
+            if kind == "P":
+                self.plan.append(value)
+            elif kind == "U":
+                self.units.add(value)
+            elif kind == "D":
+                self.dirs.add(value)
+            elif kind == "T":
+                self.subtrees.add(value)
+        return True
+
+    def add(self, kind, value):
+        with self._lock:
+            self._pending.append(f"{kind}\t{value}\n")
+            if len(self._pending) >= SYNC_EVERY or time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+                self._sync()
+
+    def set_plan(self, units):
+        with self._lock:
+            self.plan = list(units)
+            self._pending += [f"P\t{u}\n" for u in units]
+            self._sync()
+
+    def _sync(self):
+        if self._pending:
+            self._file.write("".join(self._pending))
+            self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def discard(self):
+        # El trabajo terminó bien: ya no hay nada que reanudar
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
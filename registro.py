@@ -0,0 +1,145 @@
+# registro.py
+import os, time, queue, tempfile, traceback
+from datetime import datetime
+from telemetria import TELEMETRY
+
+
+class LogSink:
+    """
+    Cola de salida para el ScrolledText.
+    Los hilos de trabajo solo hacen put() o call(); el bucle de Tk vacía la
+    cola por lotes cada interval_ms y el widget conserva como mucho max_lines
+    líneas.
+    Lo que sale del widget (o no llega a entrar) se guarda en disco.
+    Cada vaciado pasa a telemetria cuánto esperó el mensaje más antiguo
+    (ui_drain_latency) y cuánto tardó en pintarse el lote (ui_drain).
+    """
+
+    def __init__(self, widget, max_lines=5000, interval_ms=50, spill_path=None):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.spill_path = spill_path or os.path.join(
+            tempfile.gettempdir(), "valkyria",
+            f"log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt")
+        self._queue = queue.SimpleQueue()
+        self._lines = 0
+        self._spill = None
+        self._after_id = None
+        self._oldest = None     # cuándo entró el primer mensaje aún sin pintar
+
+    def put(self, text, tag=None):
+        # Seguro desde cualquier hilo: no toca Tk
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._queue.put((text, tag))
+
+    def call(self, func, *args):
+        # Seguro desde cualquier hilo: func(*args) se ejecuta en el de Tk, después del texto ya encolado
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._queue.put((None, lambda: func(*args)))
+
+    def start(self):
+        self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        try:
+            self.drain()
+        finally:
+            self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+    def _write_spill(self, text):
+        if self._spill is None:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._spill = open(self.spill_path, "a", encoding="utf-8", errors="replace")
+        self._spill.write(text)
+
+    def drain(self):
+        """
+        Vacía la cola de una vez. Devuelve el número de mensajes procesados.
+        """
+        t0 = time.monotonic()
+        oldest, self._oldest = self._oldest, None
+        batch = []
+        try:
+            while True:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return 0
+
+        # Si el lote no cabe en el widget, lo más antiguo va directo a disco
+        # (las llamadas de call() no se pierden: siguen en su sitio)
+        total = sum(text.count("\n") for text, _ in batch if text is not None)
+        skip = total - self.max_lines
+        kept = batch
+        if skip > 0:
+            # Lo que ya había en el widget es anterior al lote: sale primero, así el archivo queda en orden
+            self._trim(self._lines)
+            spilled, kept = [], []
+            for text, tag in batch:
+                if text is not None and skip > 0:
+                    spilled.append(text)
+                    skip -= text.count("\n")
+                else:
+                    kept.append((text, tag))
+            self._write_spill("".join(spilled))
+
+        # Agrupar mensajes seguidos con la misma etiqueta en un único insert
+        groups, chunk, last_tag = [], [], None
+        for text, tag in kept:
+            if chunk and (text is None or tag != last_tag):
+                groups.append(("".join(chunk), last_tag))
+                chunk = []
+            if text is None:
+                groups.append((None, tag))
+            else:
+                chunk.append(text)
+                last_tag = tag
+        if chunk:
+            groups.append(("".join(chunk), last_tag))
+
+        for text, tag in groups:
+            if text is None:
+                self._run_call(tag)
+                continue
+            self.widget.insert("end", text, tag)
+            self._lines += text.count("\n")
+        self._trim()
+        self.widget.see("end")
+        now = time.monotonic()
+        TELEMETRY.observe("ui_drain", now - t0)
+        if oldest is not None:
+            TELEMETRY.observe("ui_drain_latency", now - oldest)
+        return len(batch)
+
+    def _run_call(self, func):
+        # Como un after() de Tk: un fallo se informa y no corta el resto del lote
+        try:
+            func()
+        except Exception:
+            traceback.print_exc()
+
+    def _trim(self, excess=None):
+        # Pasa a disco las primeras excess líneas del widget (por defecto, lo que sobra de max_lines)
+        if excess is None:
+            excess = self._lines - self.max_lines
+        if excess <= 0:
+            return
+        end = f"{excess + 1}.0"
+        self._write_spill(self.widget.get("1.0", end))
+        self.widget.delete("1.0", end)
+        self._lines -= excess
+
+    def close(self):
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -1,82 +1,37 @@
-import os, sys, threading, subprocess, shutil, tempfile
+import os, sys, time, threading, subprocess
 import tkinter as tk
 from tkinter import filedialog, simpledialog, messagebox, ttk
 from datetime import datetime
-from pathlib import Path
 from tkinter.scrolledtext import ScrolledText
-from cryptography.fernet import Fernet
-from comandos import RobocopyFlags
+from comandos import RobocopyFlags, BASE_ARGS, build_cmd
 from estilos import Estilos, estilo_botones_tk
 from tooltip import ToolTip
+from registro import LogSink
+from analizador import RobocopyParser, format_bytes
+from motores import get_backend, which_robocopy
+from indice import JobIndex, SOURCE, DEST
+from planificador import Scheduler, STATE_LABELS, RUNNING, DONE, FAILED
+from autoajuste import VolumeProfiles, calibrate
+from particiones import SHARDS
+from motor_nativo import parse_robocopy_args
+from preescaneo import scan_tree, format_duration
+from paquetes import BUNDLE, DEFAULT_LIMIT
+from bloques import DELTA, DEFAULT_THRESHOLD
+from multidestino import build_fanout_cmd
+from historial import RunHistory
+from rutas import app_dir
+from telemetria import Exporter, PROFILE, default_path
+from ancho_banda import BANDWIDTH, RUN_HOURS, parse_run_hours
 
 
 WIN = os.name == "nt"
 
-BASE_ARGS = ["/COPY:DATSO", "/DCOPY:T", "/R:3", "/W:5", "/MT:16", "/FFT", "/XJ", "/NP", "/TEE"]
-
-def which_robocopy():
-    return shutil.which("robocopy.exe") or shutil.which("robocopy")
-
-def build_cmd(src, dst, *extra):
-    return ["robocopy", src, dst, *BASE_ARGS, *extra]
-
 def run_in_thread(func):
     def wrapper(*a, **kw):
         t = threading.Thread(target=func, args=a, kwargs=kw, daemon=True)
         t.start()
     return wrapper
 
-def generate_and_save_key(key_path):
-    key = Fernet.generate_key()
-    with open(key_path, "wb") as f:
-        f.write(key)
-    return key
-
-def load_key(key_path):
-    with open(key_path, "rb") as f:
-        return f.read()
-
-def encrypt_folder_to_file(folder_path, out_dir, key_path=None):
-    """
-    Comprime la carpeta a ZIP y cifra el ZIP con Fernet.
-    Devuelve ruta del .enc y del .key (si se generó).
-    """
-    os.makedirs(out_dir, exist_ok=True)
-    base_name = os.path.basename(os.path.normpath(folder_path)) or "backup"
-    zip_path = os.path.join(tempfile.gettempdir(), f"{base_name}.zip")
-    enc_path = os.path.join(out_dir, f"{base_name}.zip.enc")
-
-    # Crear ZIP temporal
-    if os.path.exists(zip_path):
-        os.remove(zip_path)
-    shutil.make_archive(zip_path[:-4], "zip", folder_path)
-
-    # Cargar o generar clave
-    key_created = False
-    if not key_path:
-        key_path = os.path.join(out_dir, f"{base_name}.key")
-    if not os.path.exists(key_path):
-        key = generate_and_save_key(key_path)
-        key_created = True
-    else:
-        key = load_key(key_path)
-
-    # Cifrar
-    f = Fernet(key)
-    with open(zip_path, "rb") as zf:
-        data = zf.read()
-    token = f.encrypt(data)
-    with open(enc_path, "wb") as ef:
-        ef.write(token)
-
-    # Limpiar ZIP temporal
-    try:
-        os.remove(zip_path)
-    except OSError:
-        pass
-
-    return enc_path, (key_path if key_created else None)
-
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -142,7 +97,7 @@ class App(tk.Tk):
 
         btnMirrorLog = tk.Button(frame_restore, text="Con Registro", command=self.log_mirror, **style)
         btnMirrorLog.grid(row=0, column=2, padx=6, pady=6)
-        ToolTip(btnMirrorLog, "Espejo con un log de registro (guardado en C:\Logs\): {Origen} - {Destino} /MIR /LOG")
+        ToolTip(btnMirrorLog, "Espejo con un log de registro en texto (por defecto en la carpeta de datos de Valkyria); todas las copias quedan además en el Historial: {Origen} - {Destino} /MIR /LOG")
 
         btnMirrorRetryWait = tk.Button(frame_restore, text="Reintento y Espera", command=self.retry_wait_mirror, **style)
         btnMirrorRetryWait.grid(row=0, column=3, padx=6, pady=6)
@@ -150,7 +105,23 @@ class App(tk.Tk):
 
         btnMirrorMultiThread = tk.Button(frame_restore, text="Multihilo", command=self.multithread_mirror, **style)
         btnMirrorMultiThread.grid(row=1, column=0, padx=6, pady=6)
-        ToolTip(btnMirrorMultiThread, "Espejo con N cantidad de hilos (máx. tu total): {Origen} - {Destino} /MIR /MT:n")
+        ToolTip(btnMirrorMultiThread, "Espejo con N hilos (0 = automático según el perfil del disco): {Origen} - {Destino} /MIR /MT:n")
+
+        btnMirrorSharded = tk.Button(frame_restore, text="Por particiones", command=self.sharded_mirror, **style)
+        btnMirrorSharded.grid(row=1, column=1, padx=6, pady=6)
+        ToolTip(btnMirrorSharded, "Espejo repartido en N procesos a la vez por subcarpetas (árboles enormes): {Origen} - {Destino} /MIR")
+
+        btnMirrorScheduled = tk.Button(frame_restore, text="Espejo en horario", command=self.scheduled_mirror, **style)
+        btnMirrorScheduled.grid(row=1, column=2, padx=6, pady=6)
+        ToolTip(btnMirrorScheduled, "Espejo que solo corre en un horario (se pausa y sigue solo) y con tope de MB/s: {Origen} - {Destino} /MIR /RH:hhmm-hhmm")
+
+        btnMirrorDelta = tk.Button(frame_restore, text="Por bloques", command=self.delta_mirror, **style)
+        btnMirrorDelta.grid(row=1, column=3, padx=6, pady=6)
+        ToolTip(btnMirrorDelta, "Espejo que en archivos grandes ya copiados (discos de VM, PST...) solo escribe los bloques cambiados (motor nativo): {Origen} - {Destino} /MIR /DELTA:MB")
+
+        btnFanOut = tk.Button(frame_restore, text="Varios destinos", command=self.fanout_copy, **style)
+        btnFanOut.grid(row=2, column=0, padx=6, pady=6)
+        ToolTip(btnFanOut, "Un origen a varios destinos (NAS, disco USB, remoto...) leyéndolo una sola vez; cada destino en espejo o incremental (motor nativo): {Origen} - {Destino 1} /MIR /TO:{Destino 2} /E /XO ...")
 
         # --- Pestaña: Avanzado ---
         frame_avanzado = tk.Frame(notebook, bg="black")
@@ -162,7 +133,71 @@ class App(tk.Tk):
 
         btnCompare = tk.Button(frame_avanzado, text="Listar y Comparar", command=self.compare_files, **style)
         btnCompare.grid(row=0, column=1, padx=6, pady=6)
-        ToolTip(btnCompare, "Compara diferencias entre archivos: {Origen} - {Destino} /L /V")
+        ToolTip(btnCompare, "Compara origen y destino sin copiar (nuevos, cambiados, extra...) y permite copiar solo eso")
+
+        btnDecrypt = tk.Button(frame_avanzado, text="Descifrar copia", command=self.restore_encrypted_copy, **style)
+        btnDecrypt.grid(row=0, column=2, padx=6, pady=6)
+        ToolTip(btnDecrypt, "Restaura una copia cifrada: {Archivo .enc} + {Clave .key} - {Destino}")
+
+        btnRestoreSnap = tk.Button(frame_avanzado, text="Restaurar instantánea", command=self.restore_snapshot_copy, **style)
+        btnRestoreSnap.grid(row=0, column=3, padx=6, pady=6)
+        ToolTip(btnRestoreSnap, "Reconstruye una instantánea cifrada: {Carpeta .snapshots} + {Clave .key} - {Destino}")
+
+        btnExportMetrics = tk.Button(frame_avanzado, text="Exportar métricas", command=self.export_metrics, **style)
+        btnExportMetrics.grid(row=1, column=0, padx=6, pady=6)
+        ToolTip(btnExportMetrics, "Guarda en JSON las métricas de la última ejecución (velocidad, fallidos, resumen)")
+
+        btnCalibrate = tk.Button(frame_avanzado, text="Calibrar hilos", command=self.calibrate_threads, **style)
+        btnCalibrate.grid(row=1, column=1, padx=6, pady=6)
+        ToolTip(btnCalibrate, "Prueba varias /MT (y /J) unos segundos y guarda el mejor ajuste para ese par de discos")
+
+        btnVerify = tk.Button(frame_avanzado, text="Verificar copia", command=self.verify_copy, **style)
+        btnVerify.grid(row=1, column=2, padx=6, pady=6)
+        ToolTip(btnVerify, "Compara el contenido (hash) de origen y destino; solo relee lo que cambió desde la última vez")
+
+        btnBandwidth = tk.Button(frame_avanzado, text="Límite de red", command=self.set_bandwidth_limit, **style)
+        btnBandwidth.grid(row=1, column=3, padx=6, pady=6)
+        ToolTip(btnBandwidth, "Tope de MB/s para todas las copias juntas; se reparte según lo que use cada una")
+
+        btnDedup = tk.Button(frame_avanzado, text="Copia deduplicada", command=self.dedup_backup, **style)
+        btnDedup.grid(row=2, column=0, padx=6, pady=6)
+        ToolTip(btnDedup, "Copia cifrada a un almacén que guarda una sola vez cada trozo repetido (varios equipos, mismo almacén): {Origen} - {Almacén}")
+
+        btnDedupRestore = tk.Button(frame_avanzado, text="Restaurar deduplicada", command=self.dedup_restore, **style)
+        btnDedupRestore.grid(row=2, column=1, padx=6, pady=6)
+        ToolTip(btnDedupRestore, "Reconstruye una copia del almacén deduplicado: {Almacén} + {Clave .key} - {Destino}")
+
+        btnBundle = tk.Button(frame_avanzado, text="Copia en paquetes", command=self.bundled_copy, **style)
+        btnBundle.grid(row=2, column=2, padx=6, pady=6)
+        ToolTip(btnBundle, "Para NAS o WAN con muchos archivos pequeños: se envían en paquetes (motor nativo): {Origen} - {Destino} /E /BUNDLE:KB")
+
+        btnProfile = tk.Button(frame_avanzado, text="Copia con perfil", command=self.profiled_copy, **style)
+        btnProfile.grid(row=2, column=3, padx=6, pady=6)
+        ToolTip(btnProfile, "Copia /E perfilada (cProfile + memoria) para ver dónde se va el tiempo; el informe queda en la carpeta de perfiles: {Origen} - {Destino} /E /PROFILE")
+
+        # --- Pestaña: Trabajos ---
+        frame_trabajos = tk.Frame(notebook, bg="black")
+        notebook.add(frame_trabajos, text="Trabajos")
+
+        columns = ("estado", "prioridad", "hilos", "origen", "destino", "rc")
+        self.jobs_view = ttk.Treeview(frame_trabajos, columns=columns, height=6)
+        self.jobs_view.heading("#0", text="#")
+        self.jobs_view.column("#0", width=50, stretch=False)
+        for col, width in zip(columns, (100, 80, 60, 380, 380, 50)):
+            self.jobs_view.heading(col, text=col.capitalize())
+            self.jobs_view.column(col, width=width, stretch=col in ("origen", "destino"))
+        self.jobs_view.grid(row=0, column=0, columnspan=4, padx=6, pady=6, sticky="ew")
+
+        for col, (text, command, tip) in enumerate((
+            ("Cancelar", self.cancel_job, "Cancela el trabajo seleccionado (en cola o en marcha)"),
+            ("Reanudar", self.resume_job, "Vuelve a encolar un trabajo cancelado o fallido"),
+            ("Subir prioridad", self.raise_job_priority, "Los trabajos con más prioridad salen antes de la cola"),
+            ("Limpiar terminados", self.clear_jobs, "Quita de la lista los trabajos terminados"),
+            ("Historial", self.show_history, "Ejecuciones anteriores con su registro completo; busca en qué copias falló una ruta"),
+        )):
+            btn = tk.Button(frame_trabajos, text=text, command=command, **style)
+            btn.grid(row=1, column=col, padx=6, pady=6)
+            ToolTip(btn, tip)
 
         # --- Pestaña: Salir ---
         frame_salir = tk.Frame(notebook, bg="black")
@@ -170,18 +205,42 @@ class App(tk.Tk):
 
         tk.Button(frame_salir, text="Salir", command=self.destroy, **style).grid(row=0, column=0, padx=6, pady=6)
 
+        # Métricas de la ejecución en curso (bytes/s, archivos/s, ETA, fallidos)
+        self.parser = None
+        self.status = tk.Label(self, text="Sin ejecuciones", bg="#222", fg="#ddd", anchor="w", font=("Roboto", 10))
+        self.status.pack(fill="x", padx=10)
+        self.after(500, self.refresh_status)
+
         # Log
         self.log = ScrolledText(self, height=28, bg="#111", fg="#ddd", insertbackground="white")
         self.log.pack(fill="both", expand=True, padx=10, pady=10)
         self.log.tag_config("err", foreground="#ff6666")
         self.log.tag_config("ok", foreground="#66ff99")
         self.log.tag_config("cmd", foreground="#66aaff")
+        # Los hilos escriben en la cola; Tk la vacía por lotes en su propio hilo
+        self.sink = LogSink(self.log)
+        self.sink.start()
+
+        # Todas las copias pasan por el planificador: cola persistente, límite
+        # por volumen y reparto de hilos entre los trabajos en marcha
+        self._parsers = {}
+        self.profiles = VolumeProfiles()
+        # La salida de cada trabajo se guarda comprimida e indexada (el widget solo tiene la cola)
+        self.history = RunHistory()
+        self.scheduler = Scheduler(thread_budget=max(16, (os.cpu_count() or 1) * 4),
+                                   on_line=self.job_line, on_change=self.job_changed, tuner=self.profiles,
+                                   history=self.history, metrics_log=default_path("trabajos.jsonl"))
+        self.scheduler.start()
+        # Tiempos por fase y contadores en texto de Prometheus, para el recolector de archivos
+        self.exporter = Exporter()
+        self.exporter.start()
+        self.after(1000, self.refresh_jobs)
 
         # Comprobaciones
         if not WIN:
             self.append("Este programa está pensado para Windows (Robocopy).\n", "err")
         if not which_robocopy():
-            self.append("No encuentro robocopy en PATH. ¿Estás en Windows? ¿Está disponible?\n", "err")
+            self.append("No encuentro robocopy en PATH: se usará el motor nativo de Python.\n", "err")
 
     def ask_src_dst(self, title_src="Selecciona carpeta de ORIGEN", title_dst="Selecciona carpeta de DESTINO"):
         src = filedialog.askdirectory(title=title_src)
@@ -201,49 +260,198 @@ class App(tk.Tk):
             return
         
     def append(self, text, tag=None):
-        self.log.insert("end", text, tag)
-        self.log.see("end")
-        self.update_idletasks()
+        # Seguro desde cualquier hilo: solo encola
+        self.sink.put(text, tag)
+
+    def refresh_status(self):
+        if self.parser is not None:
+            self.status.config(text=self.parser.metrics.status_line())
+        self.after(500, self.refresh_status)
+
+    def export_metrics(self):
+        if self.parser is None:
+            messagebox.showinfo("Exportar métricas", "Todavía no se ha ejecutado ninguna copia.")
+            return
+        path = filedialog.asksaveasfilename(title="Guardar métricas", defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not path: return
+        self.parser.metrics.to_json(path)
+        self.append(f"\nMétricas guardadas en: {path}\n", "ok")
+
+    def destroy(self):
+        self.scheduler.stop()
+        self.exporter.stop()
+        self.sink.drain()
+        self.sink.close()
+        super().destroy()
+
+    def run_cmd(self, cmd, on_done=None, priority=0, expected=None):
+        # Encola el comando; on_done(rc) se llama en el hilo del trabajo si termina bien
+        try:
+            return self.scheduler.submit(cmd, priority=priority, on_done=on_done, expected=expected)
+        except ValueError as e:
+            self.append(f"\nERROR: {e}\n", "err")
+            return None
+
+    def execute_cmd(self, cmd):
+        # Encola y espera (para hilos que encadenan varios comandos); None si se canceló o no se pudo encolar
+        job = self.run_cmd(cmd)
+        if job is None:
+            return None
+        self.scheduler.wait(job)
+        return job.rc if job.state in (DONE, FAILED) else None
+
+    def job_line(self, job, line):
+        parser = self._parsers.get(job.id)
+        if parser is not None:
+            parser.feed(line)
+        # Con varios trabajos a la vez cada línea lleva su número
+        self.append(f"[#{job.id}] {line}" if self.scheduler.running_count() > 1 else line)
+
+    def job_changed(self, job):
+        if job.state == RUNNING:
+            self.parser = self._parsers[job.id] = RobocopyParser(*(job.expected or ()))
+            cmd = job.effective_cmd()
+            self.append(f"\n$ [#{job.id}] {subprocess.list2cmdline(cmd)}  [{get_backend().name}]\n", "cmd")
+        elif job.id in self._parsers and job.state != RUNNING:
+            self._parsers.pop(job.id).metrics.finish()
+            rc = job.rc
+            if rc is None:
+                self.append(f"\n[#{job.id}] {STATE_LABELS[job.state]}\n", "err")
+            else:
+                saved = f" · historial #{job.run_id}" if job.run_id else ""
+                msg = f"\n[#{job.id}] [RC={rc}] {'OK (<8)' if rc < 8 else 'FALLO (>=8)'}{saved}\n"
+                self.append(msg, "ok" if rc < 8 else "err")
+
+    def refresh_jobs(self):
+        view = self.jobs_view
+        jobs = self.scheduler.jobs()
+        ids = {str(j["id"]) for j in jobs}
+        for item in view.get_children():
+            if item not in ids:
+                view.delete(item)
+        for j in jobs:
+            values = (STATE_LABELS[j["state"]], j["priority"], j["threads"] or "", j["src"], j["dst"],
+                      "" if j["rc"] is None else j["rc"])
+            iid = str(j["id"])
+            if view.exists(iid):
+                view.item(iid, values=values)
+            else:
+                view.insert("", "end", iid=iid, text=iid, values=values)
+        self.after(1000, self.refresh_jobs)
+
+    def selected_job(self):
+        sel = self.jobs_view.selection()
+        return int(sel[0]) if sel else None
+
+    def cancel_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.scheduler.cancel(job_id)
+
+    def resume_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.scheduler.resume(job_id)
+
+    def raise_job_priority(self):
+        job_id = self.selected_job()
+        if job_id is None: return
+        job = next(j for j in self.scheduler.jobs() if j["id"] == job_id)
+        self.scheduler.set_priority(job_id, job["priority"] + 1)
+
+    def clear_jobs(self):
+        self.scheduler.clear_finished()
+
+    def show_history(self):
+        from vista_historial import HistoryView
+        HistoryView(self, self.history)
 
     @run_in_thread
-    def run_cmd(self, cmd):
-        self.append("\n$ " + subprocess.list2cmdline(cmd) + "\n", "cmd")
+    def run_indexed(self, src, dst, *flags, on_done=None):
+        """
+        Calcula los cambios con el índice persistente del trabajo y solo lanza
+        la copia sobre las carpetas afectadas (o nada si no hay cambios).
+        """
+        index = JobIndex.for_job(src, dst)
         try:
-            # Popen para no bloquear la UI y stream de salida
-            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as p:
-                for line in p.stdout:
-                    self.append(line)
-            rc = p.wait()
-            msg = f"\n[RC={rc}] {'OK (<8)' if rc < 8 else 'FALLO (>=8)'}\n"
-            self.append(msg, "ok" if rc < 8 else "err")
+            t0 = time.monotonic()
+            self.append("\nActualizando índice de origen y destino...\n", "cmd")
+            # Sin vigilante de eventos vivo el origen se relista entero (en paralelo);
+            # el destino solo cambia por nuestras copias y basta el modo rápido
+            index.refresh(SOURCE, src, "quick" if index.source_watched() else "full")
+            index.refresh(DEST, dst, "full" if index.needs_full(DEST) else "quick")
+            changes = index.change_set(flags)
+            self.append(f"Índice: {changes.summary()} ({time.monotonic() - t0:.1f} s)\n")
+            if not changes:
+                self.append("Sin cambios: no hace falta copiar.\n", "ok")
+                rc = 0
+            else:
+                rc = 0
+                for cmd in index.plan_commands(build_cmd, src, dst, flags, changes):
+                    code = self.execute_cmd(cmd)
+                    rc = rc | code if code is not None else rc | 16
+                if RobocopyFlags.LIST_ONLY not in flags:
+                    index.after_copy(dst, changes)
         except Exception as e:
-            self.append(f"\nERROR: {e}\n", "err")
+            self.append(f"\nERROR con el índice: {e}\n", "err")
+            return
+        finally:
+            index.close()
+        if on_done:
+            on_done(rc)
 
-    def confirm_mirror(self, src, dst):
+    def confirm_mirror(self, src, dst, profile=None, eta=None):
+        size = f"Origen: {profile.summary()}\nCopia completa: {format_duration(eta)}\n\n" if profile else ""
         return messagebox.askyesno(
             "Confirmar /MIR",
-            f"Vas a ejecutar un ESPEJO (/MIR):\n\nORIGEN: {src}\nDESTINO: {dst}\n\n"
+            f"Vas a ejecutar un ESPEJO (/MIR):\n\nORIGEN: {src}\nDESTINO: {dst}\n\n{size}"
             "Esto BORRARÁ en destino lo que no exista en origen.\n\n¿Continuar?"
         )
 
+    @run_in_thread
+    def prescan(self, src, dst, flags, then):
+        """
+        Pasada previa (con caché por carpeta) de lo que copiaría src con flags;
+        después llama a then(perfil, segundos estimados) en el hilo de la
+        interfaz. Si falla la pasada se sigue sin tamaño (perfil None).
+        """
+        self.append(f"\nCalculando tamaño de {src}...\n", "cmd")
+        profile = eta = None
+        try:
+            profile = scan_tree(src, parse_robocopy_args([*BASE_ARGS, *flags]))
+            eta = self.profiles.estimate(src, dst, profile.bytes, profile.files)
+            self.append(f"Previsto: {profile.summary()} · duración {format_duration(eta)} "
+                        f"({profile.relisted} carpetas listadas, {profile.cached} de la caché, {profile.elapsed:.1f} s)\n")
+            for line in profile.histogram_lines():
+                self.append(line + "\n")
+        except Exception as e:
+            self.append(f"\nERROR en la pasada previa: {e}\n", "err")
+        self.sink.call(then, profile, eta)
+
     
 
     def copia_incremental(self):
         src, dst = self.ask_src_dst()
         if not src or not dst: return
+        # Cifrar copia (opcional): se pregunta antes y se hace cuando robocopy termina
+        encrypt = messagebox.askyesno("Cifrar copia", "¿Quieres guardar una instantánea cifrada (solo cambios, ZIP + Fernet) en el DESTINO?")
         # /E (con vacías) + /XO (excluir más antiguos) → copia más nuevos/cambiados, NO borra
-        cmd = build_cmd(src, dst, "/E", "/XO")
-        self.run_cmd(cmd)
+        self.run_indexed(src, dst, "/E", "/XO", on_done=(lambda rc: rc < 8 and self.encrypt_snapshot(dst)) if encrypt else None)
 
-        # Cifrar copia (opcional)
-        if messagebox.askyesno("Cifrar copia", "¿Quieres cifrar la copia en un archivo .enc (ZIP + Fernet) en el DESTINO?"):
-            try:
-                enc_path, key_created = encrypt_folder_to_file(dst, out_dir=dst)
-                self.append(f"\nCopia cifrada en: {enc_path}\n", "ok")
-                if key_created:
-                    self.append(f"Clave guardada en: {key_created}\nGuárdala en lugar seguro.\n", "ok")
-            except Exception as e:
-                self.append(f"\nERROR cifrando copia: {e}\n", "err")
+    def encrypt_snapshot(self, dst):
+        try:
+            # cryptography solo se importa cuando de verdad se cifra
+            from instantaneas import create_snapshot
+            snap_id, key_created, stats = create_snapshot(dst, out_dir=dst)
+            if snap_id is None:
+                self.append("\nSin cambios desde la última instantánea cifrada.\n", "ok")
+            else:
+                self.append(f"\nInstantánea cifrada #{snap_id}: {stats['changed']} archivos nuevos/cambiados "
+                            f"({stats['bytes']} bytes), {stats['reused']} sin cambios, {stats['removed']} eliminados\n", "ok")
+            if key_created:
+                self.append(f"Clave guardada en: {key_created}\nGuárdala en lugar seguro.\n", "ok")
+        except Exception as e:
+            self.append(f"\nERROR cifrando copia: {e}\n", "err")
 
     def copia_recientes(self):
         src, dst = self.ask_src_dst()
@@ -251,8 +459,18 @@ class App(tk.Tk):
         days = simpledialog.askinteger("Últimos N días", "¿Cuántos días hacia atrás (entero)?", minvalue=1, initialvalue=1)
         if not days: return
         # /MAXAGE:n excluye archivos más viejos que n → solo recientes
-        cmd = build_cmd(src, dst, "/E", f"/MAXAGE:{days}")
-        self.run_cmd(cmd)
+        flags = ("/E", f"/MAXAGE:{days}")
+
+        def confirm(profile, eta):
+            expected = None
+            if profile is not None:
+                if not messagebox.askyesno("Últimos N días", f"Se copiarán como mucho {profile.summary()}.\n"
+                                           f"Duración estimada: {format_duration(eta)}\n\n¿Continuar?"):
+                    return
+                expected = (profile.bytes, profile.files)
+            self.run_cmd(build_cmd(src, dst, *flags), expected=expected)
+
+        self.prescan(src, dst, flags, confirm)
 
     def restore(self):
         # Restaurar SIN BORRAR (seguro): /E /XO (no pisa con más antiguos)
@@ -337,9 +555,8 @@ class App(tk.Tk):
     def copia_mirror(self):
         src, dst = self.ask_src_dst()
         if not src or not dst: return
-        if not self.confirm_mirror(src, dst): return
-        cmd = build_cmd(src, dst, "/MIR")
-        self.run_cmd(cmd)
+        self.prescan(src, dst, ("/MIR",),
+                     lambda profile, eta: self.confirm_mirror(src, dst, profile, eta) and self.run_indexed(src, dst, "/MIR"))
     
     def exclude_extra_mirror(self):
         # Excluye archivos "extra" en destino (ESPEJO)
@@ -356,14 +573,14 @@ class App(tk.Tk):
         self.run_cmd(cmd)
 
     def log_mirror(self):
-        # Crea un Espejo con un log
+        # Crea un Espejo con un log en texto (además del que queda en el historial)
         src, dst = self.ask_src_dst()
         self.validator(src, dst)
-         # Crear carpeta Logs si no existe
-        log_dir = Path("C:/Logs")
-        log_dir.mkdir(parents=True, exist_ok=True)
         fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        log_file = Path("C:/Logs") / f"backup_{fecha_hora}.txt"
+        log_file = filedialog.asksaveasfilename(title="Guardar registro", initialdir=app_dir("registros"),
+                                                initialfile=f"backup_{fecha_hora}.txt", defaultextension=".txt",
+                                                filetypes=[("Texto", "*.txt")])
+        if not log_file: return
         log_flag = f'{RobocopyFlags.LOG}{log_file}'
         cmd = build_cmd(src, dst, RobocopyFlags.MIRROR, log_flag)
         self.run_cmd(cmd)
@@ -398,24 +615,273 @@ class App(tk.Tk):
         # Lo hace con multihilo para agilizar el proceso (Espejo)
         src, dst = self.ask_src_dst()
         self.validator(src, dst)
+        if not src or not dst: return
         
-        max_threads = os.cpu_count() or 1
-        threads = self.ask_prompt("Funcionalidad Multihilo", f"¿Cuántos hilos usamos? (Máximo permitido: {max_threads}", 1, 1, max_threads)
+        # Lo que rinde depende de los discos, no de los núcleos: 0 deja que decida el perfil
+        threads, unbuffered = self.profiles.suggest(src, dst, explore=False)
+        hint = f"{threads}{' + /J' if unbuffered else ''}"
+        threads = self.ask_prompt("Funcionalidad Multihilo", f"¿Cuántos hilos usamos? (0 = automático, ahora {hint}; máximo 128)", 0, 0, 128)
 
         if threads is None:
             print("Operación cancelada por el usuario.")
             return 
-        thr_flag = f"/MT:{threads}"
+        extra = [f"/MT:{threads}"] if threads else []
+
+        cmd = build_cmd(src, dst, RobocopyFlags.MIRROR, *extra)
+        self.run_cmd(cmd)
 
-        cmd = build_cmd(src, dst, RobocopyFlags.MIRROR, thr_flag)
+    def sharded_mirror(self):
+        # Varios robocopy a la vez, cada uno con su subárbol y su propia purga
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        if not self.confirm_mirror(src, dst): return
+        workers = self.ask_prompt("Particiones", "¿Cuántos procesos a la vez?", 4, 2, 32)
+        if workers is None: return
+        cmd = build_cmd(src, dst, RobocopyFlags.MIRROR, f"{SHARDS}{workers}")
+        self.run_cmd(cmd)
+
+    def scheduled_mirror(self):
+        # Espejo limitado a un horario (p. ej. de noche) y, si se quiere, a unos MB/s
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        if not self.confirm_mirror(src, dst): return
+        while True:
+            hours = simpledialog.askstring("Horario", "¿En qué horas puede copiar? (hhmm-hhmm, p. ej. 1900-0700)",
+                                           initialvalue="1900-0700", parent=self)
+            if hours is None: return
+            try:
+                parse_run_hours(hours)
+                break
+            except ValueError as e:
+                messagebox.showerror("Horario", str(e))
+        mbps = self.ask_prompt("Ancho de banda", "¿Tope en MB/s? (0 = sin tope)", 0, 0, 10000)
+        if mbps is None: return
+        extra = [f"{RUN_HOURS}{hours.strip()}"] + ([f"{BANDWIDTH}{mbps}"] if mbps else [])
+        cmd = build_cmd(src, dst, RobocopyFlags.MIRROR, *extra)
         self.run_cmd(cmd)
 
+    def delta_mirror(self):
+        # Espejo en el que los archivos grandes que ya están en destino se actualizan por bloques (bloques.py)
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        if not self.confirm_mirror(src, dst): return
+        mb = self.ask_prompt("Copia por bloques", "¿Desde qué tamaño (MB) se copia un archivo por bloques?",
+                             DEFAULT_THRESHOLD // (1024 * 1024), 1, 1024 * 1024)
+        if mb is None: return
+        self.run_cmd(build_cmd(src, dst, RobocopyFlags.MIRROR, f"{DELTA}:{mb}"))
+
+    def fanout_copy(self):
+        # Un origen a varios destinos con una sola lectura (multidestino.py); cada destino con su modo
+        src = filedialog.askdirectory(title="Selecciona carpeta de ORIGEN")
+        if not src: return
+        targets = []
+        while True:
+            dst = filedialog.askdirectory(title=f"Selecciona el DESTINO {len(targets) + 1} (Cancelar para terminar)")
+            if not dst: break
+            mirror = messagebox.askyesno("Varios destinos", f"{dst}\n\n¿Espejo (/MIR)? Borra en ese destino lo que no exista en origen.\n\n"
+                                         "No = incremental (/E /XO), no borra nada.")
+            if mirror and not self.confirm_mirror(src, dst): continue
+            targets.append((dst, [RobocopyFlags.MIRROR] if mirror else [RobocopyFlags.COPY_SUBDIRS, RobocopyFlags.EXCLUDE_OLDER]))
+        if not targets: return
+        self.run_cmd(build_fanout_cmd(src, targets))
+
+    def bundled_copy(self):
+        # Copia /E que agrupa los archivos pequeños en paquetes (paquetes.py); los grandes van uno a uno
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        kb = self.ask_prompt("Copia en paquetes", "¿Hasta qué tamaño (KB) se empaqueta un archivo?", DEFAULT_LIMIT // 1024, 1, 4096)
+        if kb is None: return
+        self.run_cmd(build_cmd(src, dst, RobocopyFlags.COPY_SUBDIRS, f"{BUNDLE}:{kb}"))
+
+    def profiled_copy(self):
+        # Copia /E con cProfile y tracemalloc (telemetria.py); al terminar el log dice dónde está el informe
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        self.run_cmd(build_cmd(src, dst, RobocopyFlags.COPY_SUBDIRS, PROFILE))
+
+    def set_bandwidth_limit(self):
+        current = self.scheduler.bandwidth.limit
+        mbps = self.ask_prompt("Límite de red", f"¿MB/s para todas las copias juntas? (0 = sin límite, ahora {current or 0:g})",
+                               int(current or 0), 0, 10000)
+        if mbps is None: return
+        self.scheduler.bandwidth.set_limit(mbps)
+        self.append(f"Límite global: {f'{mbps} MB/s' if mbps else 'sin límite'} (los robocopy ya lanzados siguen con su /IPG)\n", "ok")
+
     def compare_files(self):
-        # Mostramos por consola los cambios y comparaciones de archivos entre origen y destino
+        # Diferencias con el motor nativo (sin robocopy /L /V) en una tabla paginada
         src, dst = self.ask_src_dst()
         self.validator(src, dst)
-        cmd = build_cmd(src, dst, RobocopyFlags.LIST_ONLY, RobocopyFlags.VERBOSE)
-        self.run_cmd(cmd)
+        if not src or not dst: return
+        self.run_diff(src, dst)
+
+    @run_in_thread
+    def run_diff(self, src, dst):
+        self.append(f"\nComparando {src} con {dst}...\n", "cmd")
+        try:
+            from diferencias import diff_trees
+            result = diff_trees(src, dst, [*BASE_ARGS, RobocopyFlags.COPY_SUBDIRS])
+        except Exception as e:
+            self.append(f"\nERROR comparando: {e}\n", "err")
+            return
+        self.append(f"Diferencias: {result.summary()}\n", "ok")
+        self.sink.call(self.show_diff, result)
+
+    def show_diff(self, result):
+        from vista_diferencias import DiffView
+        DiffView(self, result, on_copy=self.copy_from_diff)
+
+    def copy_from_diff(self, result, flags):
+        if RobocopyFlags.MIRROR in flags and not self.confirm_mirror(result.src, result.dst):
+            return
+        self.run_diff_copy(result, flags)
+
+    @run_in_thread
+    def run_diff_copy(self, result, flags):
+        # La diferencia ya calculada es la lista de trabajo: solo las carpetas afectadas
+        changes = result.to_change_set(flags)
+        if not changes:
+            self.append("\nSin cambios: no hace falta copiar.\n", "ok")
+            return
+        self.append(f"\nCopiando desde la comparación: {changes.summary()}\n", "cmd")
+        for cmd in JobIndex.plan_commands(build_cmd, result.src, result.dst, flags, changes):
+            self.execute_cmd(cmd)
+        # El índice del trabajo tiene que volver a mirar lo que se ha tocado
+        index = JobIndex.for_job(result.src, result.dst)
+        try:
+            index.mark_dirty(DEST, set(changes.level_dirs) | set(changes.subtrees))
+        finally:
+            index.close()
+
+    def restore_encrypted_copy(self):
+        # Restaura una copia .zip.enc en una carpeta (descifrado por bloques)
+        enc_path = filedialog.askopenfilename(title="Selecciona la copia cifrada", filetypes=[("Copia cifrada", "*.enc")])
+        if not enc_path: return
+        key_path = filedialog.askopenfilename(title="Selecciona la clave", filetypes=[("Clave", "*.key")])
+        if not key_path: return
+        target = filedialog.askdirectory(title="Selecciona carpeta de DESTINO a restaurar")
+        if not target: return
+        self.run_restore(enc_path, key_path, target)
+
+    @run_in_thread
+    def run_restore(self, enc_path, key_path, target):
+        self.append(f"\nDescifrando {enc_path} en {target}...\n", "cmd")
+        try:
+            from cifrado import restore_encrypted
+            restore_encrypted(enc_path, target, key_path)
+            self.append(f"Copia restaurada en: {target}\n", "ok")
+        except Exception as e:
+            self.append(f"\nERROR descifrando copia: {e}\n", "err")
+
+    def restore_snapshot_copy(self):
+        # Reconstruye cualquier punto de la cadena de instantáneas cifradas
+        snap_dir = filedialog.askdirectory(title="Selecciona la carpeta .snapshots")
+        if not snap_dir: return
+        from instantaneas import list_snapshots
+        snaps = list_snapshots(snap_dir)
+        if not snaps:
+            messagebox.showerror("Restaurar instantánea", "No hay instantáneas en esa carpeta.")
+            return
+        snap_id = self.ask_prompt("Instantánea", f"¿Qué instantánea restauramos? (1 - {snaps[-1]})", snaps[-1], snaps[0], snaps[-1])
+        if snap_id is None: return
+        key_path = filedialog.askopenfilename(title="Selecciona la clave", filetypes=[("Clave", "*.key")])
+        if not key_path: return
+        target = filedialog.askdirectory(title="Selecciona carpeta de DESTINO a restaurar")
+        if not target: return
+        self.run_restore_snapshot(snap_dir, key_path, target, snap_id)
+
+    @run_in_thread
+    def run_restore_snapshot(self, snap_dir, key_path, target, snap_id):
+        self.append(f"\nRestaurando instantánea #{snap_id} en {target}...\n", "cmd")
+        try:
+            from instantaneas import restore_snapshot
+            restore_snapshot(snap_dir, key_path, target, snap_id)
+            self.append(f"Instantánea #{snap_id} restaurada en: {target}\n", "ok")
+        except Exception as e:
+            self.append(f"\nERROR restaurando instantánea: {e}\n", "err")
+
+    def calibrate_threads(self):
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        self.run_calibration(src, dst)
+
+    @run_in_thread
+    def run_calibration(self, src, dst):
+        self.append(f"\nCalibrando hilos de {src} a {dst} (unos segundos por prueba)...\n", "cmd")
+        try:
+            threads, unbuffered = calibrate(self.profiles, src, dst, get_backend(), emit=self.append)
+            self.append(f"Ajuste guardado para este par de discos: /MT:{threads}{' /J' if unbuffered else ''}\n", "ok")
+        except Exception as e:
+            self.append(f"\nERROR calibrando: {e}\n", "err")
+
+    def dedup_backup(self):
+        src, store = self.ask_src_dst(title_dst="Selecciona el ALMACÉN deduplicado")
+        if not src or not store: return
+        self.run_dedup_backup(src, store)
+
+    @run_in_thread
+    def run_dedup_backup(self, src, store):
+        self.append(f"\nCopia deduplicada de {src} en {store}...\n", "cmd")
+        try:
+            from deduplicado import backup
+            snap_id, key_created, stats = backup(src, store)
+            if snap_id is None:
+                self.append("Sin cambios desde la última copia: no se crea otra.\n", "ok")
+                return
+            self.append(f"Copia #{snap_id}: {stats['changed']} archivos leídos, {stats['reused']} sin cambios, "
+                        f"{stats['chunks_new']} de {stats['chunks']} trozos nuevos, "
+                        f"{format_bytes(stats['bytes_stored'])} escritos de {format_bytes(stats['bytes_read'])} leídos\n", "ok")
+            if key_created:
+                self.append(f"Clave nueva (guárdala aparte): {key_created}\n", "err")
+        except Exception as e:
+            self.append(f"\nERROR en la copia deduplicada: {e}\n", "err")
+
+    def dedup_restore(self):
+        from deduplicado import list_names, list_snapshots
+        store = filedialog.askdirectory(title="Selecciona el ALMACÉN deduplicado")
+        if not store: return
+        names = list_names(store)
+        if not names:
+            messagebox.showerror("Almacén", "No hay copias en esa carpeta")
+            return
+        name = names[0] if len(names) == 1 else simpledialog.askstring(
+            "Copia", "¿Qué copia restauramos?\n\n" + "\n".join(names), initialvalue=names[0], parent=self)
+        if name not in names: return
+        ids = list_snapshots(store, name)
+        snap_id = self.ask_prompt("Versión", f"¿Qué versión de {name}? ({ids[0]}-{ids[-1]})", ids[-1], ids[0], ids[-1])
+        if snap_id is None: return
+        key_path = os.path.join(store, "almacen.key")
+        if not os.path.exists(key_path):
+            key_path = filedialog.askopenfilename(title="Selecciona la clave .key", filetypes=[("Clave", "*.key")])
+            if not key_path: return
+        target = filedialog.askdirectory(title="Selecciona carpeta de DESTINO")
+        if not target: return
+        self.run_dedup_restore(store, name, key_path, target, snap_id)
+
+    @run_in_thread
+    def run_dedup_restore(self, store, name, key_path, target, snap_id):
+        try:
+            from deduplicado import restore
+            restore(store, name, key_path, target, snap_id)
+            self.append(f"Copia {name} #{snap_id} restaurada en: {target}\n", "ok")
+        except Exception as e:
+            self.append(f"\nERROR restaurando del almacén: {e}\n", "err")
+
+    def verify_copy(self):
+        src, dst = self.ask_src_dst()
+        if not src or not dst: return
+        self.run_verify(src, dst)
+
+    @run_in_thread
+    def run_verify(self, src, dst):
+        try:
+            from verificacion import verify
+            report = verify(src, dst, ("/E",), workers=min(32, (os.cpu_count() or 1) * 2), emit=self.append)
+            if report.ok:
+                self.append("Copia verificada: todo coincide.\n", "ok")
+            else:
+                self.append(f"La copia NO coincide: {len(report.mismatched)} distintos, {len(report.missing)} faltan.\n", "err")
+        except Exception as e:
+            self.append(f"\nERROR verificando: {e}\n", "err")
 
     def ask_prompt(self, title="Reintentos", prompt="¿Cuántos reintentos?", initial_value=1, min_value=1, max_value=1):
         while True:
@@ -0,0 +1,51 @@
+# rutas.py
+import os
+
+def app_dir(*parts):
+    """
+    Carpeta de datos de Valkyria (índices, perfiles, historial...).
+    Se puede cambiar con la variable VALKYRIA_HOME.
+    """
+    base = os.environ.get("VALKYRIA_HOME")
+    if not base:
+        if os.name == "nt":
+            base = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "Valkyria")
+        else:
+            base = os.path.join(os.path.expanduser("~"), ".valkyria")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+TMP_SUFFIX = ".vkparte"
+
+
+def partial_path(path):
+    """
+    Nombre temporal, en la misma carpeta, con el que se escribe una copia
+    hasta que está completa; luego se renombra (os.replace) al nombre bueno.
+    """
+    head, name = os.path.split(path)
+    return os.path.join(head, f".{name}{TMP_SUFFIX}")
+
+
+def discard_partial(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def fsync_dir(path):
+    """
+    Lleva a disco las entradas de una carpeta (los rename y mkdir hechos en
+    ella). En Windows no se puede abrir una carpeta para esto ni hace falta:
+    NTFS registra esos cambios en su diario.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,285 @@
+# telemetria.py
+import os, io, sys, json, time, pstats, cProfile, threading, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from rutas import app_dir
+
+# Tiempos por fase y contadores de todo el proceso, para saber en qué se fue
+# el tiempo de una copia nocturna (recorrer, copiar, purgar, comprimir,
+# cifrar...). Registrar es sumar bajo un lock: los módulos acumulan por
+# carpeta o por bloque y no por línea, así el coste no se nota.
+#
+# - count(nombre, n, **etiquetas): contadores que solo crecen (bytes, archivos).
+# - gauge(nombre, valor, **etiquetas): valores del momento (cola, en marcha).
+# - observe(fase, segundos, **etiquetas) y phase(fase): veces, suma y máximo.
+#   Lo que se mide en varios hilos suma el tiempo de todos ellos.
+#
+# Exporter lo vuelca cada EXPORT_EVERY segundos a un archivo de texto de
+# Prometheus (el "textfile collector" de node_exporter o windows_exporter lo
+# recoge tal cual) o, si acaba en .jsonl, a una línea JSON por volcado.
+#
+# /PROFILE (propio de Valkyria, como /SHARDS o /BUNDLE) pide capturar un
+# trabajo con cProfile y tracemalloc: ver profile_capture.
+PREFIX = "valkyria"
+EXPORT_EVERY = 15
+PROFILE = "/PROFILE"
+PROFILE_TOP = 40        # funciones y líneas de memoria en el informe .txt
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}   # (nombre, etiquetas) -> valor
+        self.gauges = {}
+        self.timings = {}    # (fase, etiquetas) -> [veces, segundos, máximo]
+
+    def count(self, name, n=1, **labels):
+        if not n:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            t = self.timings.get(key)
+            if t is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]:
+                    t[2] = seconds
+
+    @contextmanager
+    def phase(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def phase_totals(self):
+        # {fase: segundos} sumando todas las etiquetas (para restar antes/después de un trabajo)
+        totals = {}
+        with self._lock:
+            for (name, _), (_, seconds, _) in self.timings.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ts": round(time.time(), 3),
+                "uptime": round(time.time() - self.started, 3),
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())],
+                "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.gauges.items())],
+                "phases": [{"name": n, "labels": dict(l), "count": c, "seconds": round(s, 6), "max": round(m, 6)}
+                           for (n, l), (c, s, m) in sorted(self.timings.items())],
+            }
+
+    def prometheus(self):
+        """
+        Todo en formato de texto de Prometheus: contadores como
+        valkyria_<nombre>_total, gauges tal cual y las fases como un summary
+        valkyria_phase_seconds{phase=...} más su máximo.
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            timings = sorted(self.timings.items())
+        out = io.StringIO()
+        w = out.write
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                w(f"# TYPE {metric} counter\n")
+            w(f"{metric}{_labels(labels)} {value}\n")
+        for (name, labels), value in gauges:
+            metric = f"{PREFIX}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                w(f"# TYPE {metric} gauge\n")
+            w(f"{metric}{_labels(labels)} {value}\n")
+        if timings:
+            w(f"# TYPE {PREFIX}_phase_seconds summary\n")
+            for (name, labels), (count, seconds, _) in timings:
+                lab = _labels((("phase", name),) + labels)
+                w(f"{PREFIX}_phase_seconds_sum{lab} {seconds:.6f}\n")
+                w(f"{PREFIX}_phase_seconds_count{lab} {count}\n")
+            w(f"# TYPE {PREFIX}_phase_seconds_max gauge\n")
+            for (name, labels), (_, _, peak) in timings:
+                w(f"{PREFIX}_phase_seconds_max{_labels((('phase', name),) + labels)} {peak:.6f}\n")
+        w(f"# TYPE {PREFIX}_start_time_seconds gauge\n{PREFIX}_start_time_seconds {self.started:.0f}\n")
+        return out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+            self.started = time.time()
+
+
+# Registro único del proceso: los módulos escriben aquí sin que se lo pasen
+TELEMETRY = Telemetry()
+count = TELEMETRY.count
+gauge = TELEMETRY.gauge
+observe = TELEMETRY.observe
+phase = TELEMETRY.phase
+
+
+def write_prometheus(path, telemetry=TELEMETRY):
+    # A un temporal y rename: el recolector nunca lee un archivo a medias
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        f.write(telemetry.prometheus())
+    os.replace(tmp, path)
+
+
+def append_jsonl(path, record):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def default_path(name="valkyria.prom"):
+    return os.path.join(app_dir("metricas"), name)
+
+
+class Exporter:
+    """
+    Vuelca telemetry a path cada interval segundos en un hilo (y una última
+    vez al parar). Con .jsonl añade una línea con snapshot(); con cualquier
+    otra extensión reescribe el archivo de texto de Prometheus.
+    """
+
+    def __init__(self, path=None, interval=EXPORT_EVERY, telemetry=TELEMETRY):
+        self.path = path or default_path()
+        self.interval = interval
+        self.telemetry = telemetry
+        self.jsonl = self.path.lower().endswith(".jsonl")
+        self._stop = threading.Event()
+
+    def write(self):
+        try:
+            if self.jsonl:
+                append_jsonl(self.path, self.telemetry.snapshot())
+            else:
+                write_prometheus(self.path, self.telemetry)
+        except OSError:
+            pass
+
+    def start(self):
+        t = threading.Thread(target=self._loop, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+        self.write()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+# ---------- perfilado de un trabajo ----------
+
+def split_profile_arg(cmd):
+    # (comando sin /PROFILE, si se pidió)
+    rest = [a for a in cmd if a.upper() != PROFILE]
+    return rest, len(rest) != len(cmd)
+
+
+class ProfileResult:
+    def __init__(self, stats_path, report_path, peak_bytes):
+        self.stats_path = stats_path
+        self.report_path = report_path
+        self.peak_bytes = peak_bytes
+
+
+@contextmanager
+def profile_capture(name, out_dir=None, top=PROFILE_TOP):
+    """
+    Perfila lo que se ejecute dentro: cProfile en este hilo y en los que se
+    creen mientras tanto (los pools del motor nativo, las particiones...) y
+    tracemalloc para la memoria. Al salir deja en out_dir (por defecto
+    app_dir("perfiles")) un .pstats (para snakeviz o pstats) y un .txt con
+    las funciones más costosas y las líneas que más memoria tenían en el pico.
+    Cuesta bastante: es para un trabajo suelto, y lo que lancen a la vez
+    otros trabajos también sale en el perfil.
+    Produce un ProfileResult que se rellena al terminar.
+    """
+    out_dir = out_dir or app_dir("perfiles")
+    base = os.path.join(out_dir, f"{name}_{datetime.now():%Y%m%d-%H%M%S}")
+    result = ProfileResult(base + ".pstats", base + ".txt", 0)
+    profiles, lock = [], threading.Lock()
+
+    def start_thread(frame, event, arg):
+        # Primer evento de un hilo nuevo: se cambia el gancho por un perfilador propio
+        sys.setprofile(None)
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            return      # ya hay otro perfilador activo: el hilo sigue sin perfil propio
+        with lock:
+            profiles.append(prof)
+
+    own_trace = not tracemalloc.is_tracing()
+    if own_trace:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    main = cProfile.Profile()
+    # Desde Python 3.12 cProfile usa sys.monitoring, que es de todo el proceso:
+    # el perfilador principal ya ve los hilos nuevos y un segundo no se puede activar
+    per_thread = sys.version_info < (3, 12)
+    if per_thread:
+        threading.setprofile(start_thread)
+    main.enable()
+    try:
+        yield result
+    finally:
+        main.disable()
+        if per_thread:
+            threading.setprofile(None)
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+        memory = tracemalloc.take_snapshot().statistics("lineno")[:top]
+        if own_trace:
+            tracemalloc.stop()
+        stats = pstats.Stats(main)
+        with lock:
+            for prof in profiles:
+                try:
+                    stats.add(prof)
+                except (TypeError, ValueError):
+                    pass    # hilo que no llegó a registrar nada
+        stats.dump_stats(result.stats_path)
+        with open(result.report_path, "w", encoding="utf-8") as f:
+            f.write(f"Perfil de {name}: {len(profiles) + 1} hilos, pico de memoria {result.peak_bytes} bytes\n\n")
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(top)
+            f.write("\nMemoria (tracemalloc, por línea):\n")
+            for stat in memory:
+                f.write(f"{stat}\n")
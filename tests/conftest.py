@@ -0,0 +1,33 @@
+# conftest.py
+import os, sys
+import pytest
+
+# Los módulos de Valkyria están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def valkyria_home(tmp_path, monkeypatch):
+    # Cachés, diarios e historial de cada prueba en su carpeta temporal
+    home = tmp_path / "valkyria"
+    monkeypatch.setenv("VALKYRIA_HOME", str(home))
+    return home
+
+
+def write(path, data=b"x", mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def tree_files(root):
+    # {ruta relativa con '/': contenido} de todos los archivos bajo root
+    out = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                out[os.path.relpath(path, root).replace(os.sep, "/")] = f.read()
+    return out
@@ -0,0 +1,41 @@
+from analizador import (RobocopyParser, FileEvent, DirEvent, ErrorEvent, SummaryEvent, parse_lines, parse_size)
+
+
+def test_parse_size():
+    assert parse_size("1024") == 1024
+    assert parse_size("12.5 m") == int(12.5 * 1024 ** 2)
+    assert parse_size("1,5 k") == 1536
+    assert parse_size("abc") is None
+
+
+def test_entries_error_and_summary():
+    lines = [
+        "\t  New Dir          2\tC:\\origen\\\n",
+        "\t    New File  \t\t    1024\ta.txt\n",
+        "\t    *EXTRA File \t\t     12 m\tviejo.bin\n",
+        "2024/01/01 10:00:00 ERROR 5 (0x00000005) Copying File C:\\origen\\b.txt\n",
+        "Access is denied.\n",
+        "   Files :         3         1         0         0         1         1\n",
+        "   Bytes :    12.5 m      1024         0         0         0      12 m\n",
+    ]
+    events, metrics = parse_lines(lines)
+    assert events[0] == DirEvent("new", 2, "C:\\origen\\")
+    assert events[1] == FileEvent("new", 1024, "a.txt")
+    assert events[2] == FileEvent("extra", 12 * 1024 ** 2, "viejo.bin")
+    assert events[3] == ErrorEvent(5, "Copying File", "C:\\origen\\b.txt", "")
+    assert isinstance(events[4], SummaryEvent) and events[4].values["failed"] == 1
+    assert events[5].values["total"] == int(12.5 * 1024 ** 2)
+    assert len(events) == 6
+
+
+def test_spanish_output():
+    parser = RobocopyParser()
+    assert parser.feed("\t    Nuevo archivo  \t\t    10\tb.txt\n") == FileEvent("new", 10, "b.txt")
+    event = parser.feed("   Archivos :   2   1   1   0   0   0\n")
+    assert event.section == "files" and event.values["copied"] == 1
+
+
+def test_posix_error_paths():
+    # El motor nativo escribe rutas POSIX en Linux
+    event = RobocopyParser().feed("2024/01/01 10:00:00 ERROR 13 (0x0000000D) Accessing Source Directory /tmp/x/\n")
+    assert event == ErrorEvent(13, "Accessing Source Directory", "/tmp/x/", "")
@@ -0,0 +1,76 @@
+from datetime import datetime
+import pytest
+import ancho_banda
+from ancho_banda import (TokenBucket, parse_run_hours, split_run_hours, in_window, next_open,
+                         split_bandwidth_arg, mbps_to_ipg, ipg_to_rate, fair_shares)
+
+
+class Clock:
+    # Reloj falso: sleep avanza el tiempo en vez de esperar
+    def __init__(self):
+        self.now, self.slept = 100.0, 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+def test_token_bucket_holds_the_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ancho_banda.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ancho_banda.time, "sleep", clock.sleep)
+    bucket = TokenBucket(1000)
+    for _ in range(10):
+        bucket.consume(500)
+    # 5000 bytes a 1000 B/s: unos 5 s, pagando la deuda de cada bloque
+    assert bucket.consumed == 5000
+    assert clock.slept == pytest.approx(5.0)
+    # Sin límite no espera, pero sigue contando
+    bucket.set_rate(None)
+    bucket.consume(10 ** 9)
+    assert clock.slept == pytest.approx(5.0) and bucket.consumed == 5000 + 10 ** 9
+
+
+def test_token_bucket_burst_is_capped(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ancho_banda.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ancho_banda.time, "sleep", clock.sleep)
+    bucket = TokenBucket(1000, burst=1.0)
+    clock.now += 60     # un minuto sin usar no da 60 s de margen, solo burst
+    bucket.consume(1000)
+    assert clock.slept == 0
+    bucket.consume(1000)
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_run_hours_parsing_and_windows():
+    assert parse_run_hours("1900-0700") == (1140, 420)
+    assert parse_run_hours("0000-2400") == (0, 1440)
+    for bad in ("19-07", "2500-0700", "1960-0700", "1900-2430"):
+        with pytest.raises(ValueError):
+            parse_run_hours(bad)
+    assert split_run_hours(["/MIR", "/rh:0800-1800", "/PF"]) == (["/MIR"], (480, 1080))
+
+    night = (1140, 420)     # cruza la medianoche
+    assert in_window(night, datetime(2024, 5, 1, 23, 0))
+    assert in_window(night, datetime(2024, 5, 1, 6, 59))
+    assert not in_window(night, datetime(2024, 5, 1, 7, 0))
+    assert next_open(night, datetime(2024, 5, 1, 12, 0)) == datetime(2024, 5, 1, 19, 0)
+    assert next_open((480, 1080), datetime(2024, 5, 1, 20, 0)) == datetime(2024, 5, 2, 8, 0)
+    assert in_window(None) and in_window((600, 600), datetime(2024, 5, 1, 3, 0))
+
+
+def test_bandwidth_arg_and_ipg():
+    assert split_bandwidth_arg(["/MIR", "/BW:2.5"]) == (["/MIR"], 2.5)
+    with pytest.raises(ValueError):
+        split_bandwidth_arg(["/BW:0"])
+    ipg = mbps_to_ipg(1_000_000, streams=2)
+    assert ipg == 131 and ipg_to_rate(ipg) == pytest.approx(500_000, rel=0.01)
+
+
+def test_fair_shares_gives_unused_bandwidth_to_others():
+    assert fair_shares(90, {"a": None, "b": None, "c": None}) == {"a": 30, "b": 30, "c": 30}
+    assert fair_shares(90, {"a": 10, "b": None, "c": None}) == {"a": 10, "b": 40, "c": 40}
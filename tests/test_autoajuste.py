@@ -0,0 +1,54 @@
+import os, time
+from conftest import write
+from autoajuste import VolumeProfiles, calibrate
+from analizador import RunMetrics
+from comandos import DEFAULT_THREADS
+
+# Archivos por pasada según /MT: el volumen de prueba rinde mejor con 8 hilos
+FILES_BY_THREADS = {2: 2, 8: 10, 32: 6, 64: 3}
+
+
+class FakeBackend:
+    name = "robocopy"
+
+    def __init__(self):
+        self.cmds = []
+
+    def run(self, cmd, on_line, cancel=None):
+        self.cmds.append(cmd)
+        threads = int(next(a for a in cmd if a.startswith("/MT:"))[4:])
+        files = FILES_BY_THREADS.get(threads, 1) * (2 if "/J" in cmd else 1)
+        for i in range(files):
+            on_line(f"\t    New File  \t\t    {8 << 20}\tf{i}.bin\n")
+        time.sleep(0.05)
+        return 1
+
+
+def test_calibration_picks_the_fastest_combination(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "nuevo"
+    write(src / "a.bin", b"a")
+    profiles = VolumeProfiles(str(tmp_path / "perfiles.json"))
+    backend = FakeBackend()
+    best = calibrate(profiles, str(src), str(dst), backend, seconds=1.0, emit=lambda line: None)
+    # Calentamiento + cuatro pasos + /J sobre el mejor
+    threads = [a for c in backend.cmds for a in c if a.startswith("/MT:")]
+    assert threads == [
+        f"/MT:{DEFAULT_THREADS}", "/MT:2", "/MT:8", "/MT:32", "/MT:64", "/MT:8"]
+    assert "/J" in backend.cmds[-1]
+    assert best == (8, True)
+    # No deja la carpeta de calibración ni el destino que no existía
+    assert not dst.exists()
+    # El perfil queda guardado y lo usa una instancia nueva
+    again = VolumeProfiles(str(tmp_path / "perfiles.json"))
+    assert again.suggest(str(src), str(dst), avg_size=8 << 20, explore=False) == (8, True)
+    assert again.apply(["robocopy", str(src), str(dst), "/MT:4"]) == ["robocopy", str(src), str(dst), "/MT:4"]
+
+
+def test_short_copies_are_not_recorded(tmp_path):
+    profiles = VolumeProfiles(str(tmp_path / "perfiles.json"))
+    m = RunMetrics()
+    m.files_done, m.bytes_done = 3, 3000
+    m.finish()
+    assert not profiles.record(str(tmp_path), str(tmp_path), 8, False, m)
+    assert profiles.record(str(tmp_path), str(tmp_path), 8, False, m, force=True)
+    assert not os.path.exists(tmp_path / "perfiles.json.tmp")
@@ -0,0 +1,65 @@
+import os
+from bloques import SignatureCache, delta_copy
+
+
+def test_delta_rewrites_only_changed_blocks(tmp_path):
+    block = 1024
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    data = bytearray(os.urandom(block * 8))
+    dst.write_bytes(bytes(data))
+    data[block * 3 + 5] ^= 0xFF
+    data += b"cola"
+    src.write_bytes(bytes(data))
+
+    cache = SignatureCache(str(tmp_path / "firmas.sqlite"))
+    result = delta_copy(str(src), str(dst), os.stat(src), cache, block)
+    assert dst.read_bytes() == bytes(data)
+    assert (result.blocks, result.changed) == (9, 2)
+    assert not result.cached and result.read_dst == block * 8
+
+    # Segunda pasada: el destino queda con la fecha del origen y se usa la firma guardada
+    st = os.stat(src)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    data[0] ^= 0xFF
+    src.write_bytes(bytes(data))
+    result = delta_copy(str(src), str(dst), os.stat(src), cache, block)
+    assert dst.read_bytes() == bytes(data)
+    assert result.cached and result.read_dst == 0 and result.changed == 1
+    cache.close()
+
+
+def test_delta_truncates_shorter_source(tmp_path):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    dst.write_bytes(b"a" * 3000)
+    src.write_bytes(b"a" * 1500)
+    result = delta_copy(str(src), str(dst), os.stat(src), None, 1024)
+    assert dst.read_bytes() == b"a" * 1500
+    assert result.written == 1500 - 1024   # solo el último bloque, que quedó corto
+
+
+def test_cancelled_delta_is_recopied_under_xo(tmp_path):
+    import threading, time
+    from conftest import write
+    from comandos import build_cmd
+    from motores import NativeBackend
+    from bloques import UNFINISHED_MTIME_NS
+    block = 256 * 1024
+    old = time.time() - 3600
+    src = write(tmp_path / "src" / "disk.img", os.urandom(block * 8), old)
+    dst = write(tmp_path / "dst" / "disk.img", os.urandom(block * 8), old - 3600)
+    cancel = threading.Event()
+    seen = []
+
+    def on_block(n):
+        seen.append(n)
+        if len(seen) == 3:
+            cancel.set()
+
+    assert delta_copy(str(src), str(dst), os.stat(src), None, block, on_block, cancel) is None
+    assert os.stat(dst).st_mtime_ns == UNFINISHED_MTIME_NS
+    # El destino a medias es más viejo que el origen: /XO no se lo salta
+    lines = []
+    rc = NativeBackend().run(build_cmd(str(src.parent), str(dst.parent), "/E", "/XO", "/DELTA:1"), lines.append)
+    assert rc == 1 and dst.read_bytes() == src.read_bytes()
+    assert "Delta:" in "".join(lines)
+    assert os.stat(dst).st_mtime_ns // 10 ** 9 == os.stat(src).st_mtime_ns // 10 ** 9
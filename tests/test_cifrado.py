@@ -0,0 +1,80 @@
+import io, os
+import pytest
+from conftest import write, tree_files
+from cifrado import (MAGIC, EncryptedWriter, iter_decrypted_chunks, encrypt_folder_to_file, restore_encrypted,
+                     generate_and_save_key)
+
+
+def make_folder(root):
+    write(root / "a.txt", b"hola " * 1000)
+    write(root / "sub" / "b.bin", os.urandom(50000))
+    (root / "vacia").mkdir()
+
+
+def test_folder_round_trip_single_thread(tmp_path):
+    src, out = tmp_path / "datos", tmp_path / "salida"
+    make_folder(src)
+    enc, key = encrypt_folder_to_file(str(src), str(out), chunk_size=4096, workers=1)
+    assert key and os.path.exists(enc) and not os.path.exists(enc + ".part")
+    restored = tmp_path / "restaurado"
+    restore_encrypted(enc, str(restored), key)
+    assert tree_files(restored) == tree_files(src)
+    assert (restored / "vacia").is_dir()
+
+
+def frame_offsets(blob):
+    # Dónde empieza cada bloque: tras la cabecera, longitud (>I) + token
+    offsets, pos = [], len(MAGIC) + 4
+    while pos < len(blob):
+        offsets.append(pos)
+        pos += 4 + int.from_bytes(blob[pos:pos + 4], "big")
+    return offsets
+
+
+def encrypted(key, data, chunk_size=1000):
+    buf = io.BytesIO()
+    writer = EncryptedWriter(buf, key, chunk_size)
+    writer.write(data)
+    writer.close()
+    return buf.getvalue()
+
+
+def test_truncated_or_reordered_file_is_rejected(tmp_path):
+    key = generate_and_save_key(str(tmp_path / "k.key"))
+    data = os.urandom(3500)
+    blob = encrypted(key, data)
+    assert b"".join(iter_decrypted_chunks(io.BytesIO(blob), key)) == data
+    offsets = frame_offsets(blob)
+    assert len(offsets) == 4
+    # Cortado a mitad de un bloque o justo tras un bloque completo (sin el último)
+    for cut in (len(blob) - 10, offsets[-1]):
+        with pytest.raises(ValueError, match="truncado"):
+            b"".join(iter_decrypted_chunks(io.BytesIO(blob[:cut]), key))
+    # Un bloque quitado de en medio
+    with pytest.raises(ValueError, match="fuera de orden"):
+        b"".join(iter_decrypted_chunks(io.BytesIO(blob[:offsets[1]] + blob[offsets[2]:]), key))
+    with pytest.raises(ValueError):
+        b"".join(iter_decrypted_chunks(io.BytesIO(blob), generate_and_save_key(str(tmp_path / "otra.key"))))
+
+
+def test_parallel_round_trip_matches_single_thread(tmp_path):
+    src = tmp_path / "datos"
+    make_folder(src)
+    write(src / "grande.txt", b"0123456789" * 40000)     # varios bloques comprimibles
+    enc, key = encrypt_folder_to_file(str(src), str(tmp_path / "salida"), chunk_size=8192, workers=3)
+    restored = tmp_path / "restaurado"
+    restore_encrypted(enc, str(restored), key)
+    assert tree_files(restored) == tree_files(src)
+    # Con bloques comprimidos el cifrado ocupa menos que los datos
+    assert os.path.getsize(enc) < len(b"0123456789" * 40000)
+
+
+def test_parallel_writer_keeps_block_order(tmp_path):
+    key = generate_and_save_key(str(tmp_path / "k.key"))
+    data = os.urandom(20000) + b"a" * 30000
+    buf = io.BytesIO()
+    writer = EncryptedWriter(buf, key, chunk_size=1000, workers=2)
+    for i in range(0, len(data), 777):
+        writer.write(data[i:i + 777])
+    writer.close()
+    assert b"".join(iter_decrypted_chunks(io.BytesIO(buf.getvalue()), key)) == data
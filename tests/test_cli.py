@@ -0,0 +1,42 @@
+import json
+from conftest import write, tree_files
+import cli
+
+
+def run_cli(tmp_path, capsys, jobs, *args):
+    jobfile = tmp_path / "trabajos.json"
+    jobfile.write_text(json.dumps({"jobs": jobs}), encoding="utf-8")
+    rc = cli.main([str(jobfile), "--backend", "nativo", "--no-history",
+                   "--summary", str(tmp_path / "resumen.json"), *args])
+    return rc, json.loads(capsys.readouterr().out)
+
+
+def test_job_file_runs_and_reports(tmp_path, capsys):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt", b"a")
+    write(src / "sub" / "b.txt", b"bb")
+    write(dst / "extra.txt", b"e")
+    rc, summary = run_cli(tmp_path, capsys, [{"name": "espejo", "src": str(src), "dst": str(dst),
+                                               "mode": "mirror", "retries": 0, "wait": 0, "verify": True}])
+    assert rc == 0 and summary["ok"]
+    (job,) = summary["jobs"]
+    assert job["name"] == "espejo" and job["state"] == "done" and job["rc"] == 3
+    assert job["files_copied"] == 2 and job["verify"]["ok"]
+    assert tree_files(dst) == tree_files(src)
+    assert json.loads((tmp_path / "resumen.json").read_text(encoding="utf-8")) == summary
+
+
+def test_failed_job_exits_with_one(tmp_path, capsys):
+    src = tmp_path / "src"
+    write(src / "a.txt", b"a")
+    blocker = write(tmp_path / "archivo", b"no es una carpeta")
+    rc, summary = run_cli(tmp_path, capsys, [{"src": str(src), "dst": str(blocker / "dst"), "retries": 0, "wait": 0}])
+    assert rc == 1 and not summary["ok"]
+    assert summary["jobs"][0]["rc"] >= 8
+
+
+def test_invalid_job_file_exits_with_two(tmp_path, capsys):
+    rc, summary = run_cli(tmp_path, capsys, [{"src": "x", "dst": "y", "mode": "nada"}])
+    assert rc == 2 and "modo desconocido" in summary["error"]
+    rc, summary = run_cli(tmp_path, capsys, [{"src": "x"}])
+    assert rc == 2 and "falta 'dst'" in summary["error"]
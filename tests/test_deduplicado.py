@@ -0,0 +1,57 @@
+import os, random
+import pytest
+from conftest import write, tree_files
+from deduplicado import backup, restore, list_snapshots, iter_chunks, MIN_CHUNK, MAX_CHUNK
+
+
+def random_bytes(n, seed):
+    return random.Random(seed).randbytes(n)
+
+
+def test_chunks_rejoin_and_respect_limits(tmp_path):
+    import io
+    data = random_bytes(6 << 20, 1)
+    chunks = list(iter_chunks(io.BytesIO(data)))
+    assert b"".join(chunks) == data
+    assert all(MIN_CHUNK <= len(c) <= MAX_CHUNK for c in chunks[:-1])
+
+
+def test_two_machines_share_chunks_and_restore(tmp_path):
+    store = tmp_path / "almacen"
+    shared = random_bytes(3 << 20, 2)
+    pc1, pc2 = tmp_path / "pc1", tmp_path / "pc2"
+    write(pc1 / "sistema.bin", shared)
+    write(pc1 / "propio.txt", b"pc1")
+    write(pc2 / "sub" / "sistema.bin", shared)
+    write(pc2 / "propio.txt", b"pc2")
+
+    id1, key_path, first = backup(str(pc1), str(store), "pc1", workers=1)
+    assert id1 == 1 and key_path
+    assert first["chunks_new"] == first["chunks"] and first["changed"] == 2
+    _, _, second = backup(str(pc2), str(store), "pc2", key_path, workers=2)
+    # Del archivo común no se sube nada: solo el trozo del propio.txt distinto
+    assert second["chunks_new"] == 1 and second["bytes_read"] == len(shared) + 3
+
+    # Sin cambios no hay copia nueva; un cambio solo relee ese archivo
+    assert backup(str(pc1), str(store), "pc1", key_path)[0] is None
+    write(pc1 / "propio.txt", b"pc1 cambiado")
+    id2, _, third = backup(str(pc1), str(store), "pc1", key_path)
+    assert id2 == 2 and third["changed"] == 1 and third["reused"] == 1 and third["bytes_read"] == 12
+    assert list_snapshots(str(store), "pc1") == [1, 2]
+
+    restore(str(store), "pc2", key_path, str(tmp_path / "r2"))
+    assert tree_files(tmp_path / "r2") == tree_files(pc2)
+    restore(str(store), "pc1", key_path, str(tmp_path / "r1"), snap_id=1)
+    assert tree_files(tmp_path / "r1") == {"sistema.bin": shared, "propio.txt": b"pc1"}
+
+
+def test_restore_detects_a_damaged_chunk(tmp_path):
+    store, src = tmp_path / "almacen", tmp_path / "pc"
+    write(src / "a.bin", random_bytes(100000, 3))
+    _, key_path, _ = backup(str(src), str(store), "pc", workers=1)
+    (chunk,) = [os.path.join(d, f) for d, _, names in os.walk(store / "chunks") for f in names]
+    with open(chunk, "r+b") as f:
+        f.seek(40)
+        f.write(b"\xff\xff\xff\xff")
+    with pytest.raises(ValueError):
+        restore(str(store), "pc", key_path, str(tmp_path / "r"))
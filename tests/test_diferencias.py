@@ -0,0 +1,41 @@
+import os, time
+import pytest
+from conftest import write
+from diferencias import diff_trees
+
+
+def rels(result, category):
+    return [rel for rel, _, _ in result.entries[category]]
+
+
+def test_diff_classifies_like_robocopy(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    now = time.time()
+    write(src / "same.txt", b"s", now)
+    write(dst / "same.txt", b"s", now)
+    write(src / "newer.txt", b"n", now)
+    write(dst / "newer.txt", b"n", now - 60)
+    write(src / "sub" / "new.txt", b"x")
+    write(dst / "extra.txt", b"e")
+    write(dst / "old" / "x.txt", b"e")
+    result = diff_trees(str(src), str(dst), ["/E", "/FFT"], keep_same=True)
+    assert rels(result, "same") == ["same.txt"]
+    assert rels(result, "newer") == ["newer.txt"]
+    assert rels(result, "new") == ["sub/new.txt"]
+    assert rels(result, "extra") == ["extra.txt", "old/x.txt"]
+    assert result.new_dirs == ["sub"] and result.extra_dirs == ["old"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+def test_diff_skips_links_under_xj(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt")
+    dst.mkdir()
+    write(tmp_path / "elsewhere" / "b.txt")
+    try:
+        os.symlink(tmp_path / "elsewhere", src / "link", target_is_directory=True)
+    except OSError:
+        pytest.skip("sin permiso para crear enlaces")
+    result = diff_trees(str(src), str(dst), ["/E", "/XJ"])
+    assert rels(result, "new") == ["a.txt"]
+    assert result.new_dirs == []
@@ -0,0 +1,45 @@
+import historial
+from historial import RunHistory
+
+
+def error(code, path):
+    return [f"2024/01/01 10:00:00 ERROR {code} (0x{code:08X}) Copying File {path}\n", "Access is denied.\n"]
+
+
+def record(history, name, lines):
+    log = history.open_run(name, ["robocopy", "/datos", "/copia", "/E"])
+    for line in lines:
+        log.write(line)
+    log.close("done", 8)
+    return log.run_id
+
+
+def test_failure_queries_and_reading_from_the_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(historial, "SEGMENT_BYTES", 200)     # varios segmentos por ejecución
+    history = RunHistory(str(tmp_path / "historial"))
+    filler = [f"\t    New File  \t\t    10\t/datos/otros/f{i}.txt\n" for i in range(20)]
+    first = record(history, "diaria", filler + error(5, "/datos/proyectos/a/informe.docx")
+                   + error(32, "/datos/proyectos2/b.tmp"))
+    second = record(history, "diaria", error(5, "/datos/proyectos/informe.docx") + filler)
+
+    # Prefijo de carpeta: lo de debajo, pero no /datos/proyectos2
+    rows = history.failures("/datos/proyectos/")
+    assert sorted(r["path"] for r in rows) == ["/datos/proyectos/a/informe.docx", "/datos/proyectos/informe.docx"]
+    assert [r["run"] for r in rows] == [second, first]      # la más reciente primero
+    # Sin separador, por nombre de archivo; con comodines, GLOB
+    assert {r["run"] for r in history.failures("informe.docx")} == {first, second}
+    assert [r["path"] for r in history.failures("*.tmp")] == ["/datos/proyectos2/b.tmp"]
+    assert [r["code"] for r in history.failures("/datos/*/b.tmp")] == [32]
+    assert history.failures("/datos/nada") == []
+
+    # El log se lee desde el segmento y la posición del ERROR
+    (row,) = [r for r in rows if r["run"] == first]
+    assert row["seq"] > 0
+    lines = list(history.read(first, row["seq"], row["offset"], max_lines=2))
+    assert lines == error(5, "/datos/proyectos/a/informe.docx")
+    assert "".join(history.read(first)) == "".join(filler + error(5, "/datos/proyectos/a/informe.docx")
+                                                     + error(32, "/datos/proyectos2/b.tmp"))
+    run = history.run(first)
+    assert run["failed"] == 2 and run["state"] == "done"
+    assert [r["id"] for r in history.runs(failed_only=True)] == [second, first]
+    history.close()
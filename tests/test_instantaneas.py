@@ -0,0 +1,47 @@
+import os, time
+from conftest import write, tree_files
+from instantaneas import create_snapshot, restore_snapshot, snapshot_dir, list_snapshots, load_manifest
+from cifrado import load_key
+
+
+def test_snapshot_chain_create_delta_and_restore(tmp_path):
+    src, out = tmp_path / "datos", tmp_path / "copias"
+    old = time.time() - 3600
+    write(src / "a.txt", b"uno", old)
+    write(src / "sub" / "b.txt", b"dos", old)
+    first, key_path, stats = create_snapshot(str(src), str(out), workers=1)
+    assert first == 1 and key_path and stats["changed"] == 2
+    state1 = tree_files(src)
+
+    # Sin cambios no se crea otra
+    assert create_snapshot(str(src), str(out), workers=1)[0] is None
+
+    write(src / "a.txt", b"uno cambiado")
+    write(src / "c.txt", b"tres")
+    os.remove(src / "sub" / "b.txt")
+    second, _, stats = create_snapshot(str(src), str(out), workers=2)
+    assert second == 2
+    assert stats == {"changed": 2, "reused": 0, "removed": 1, "bytes": len(b"uno cambiado") + len(b"tres")}
+
+    snaps = snapshot_dir(str(out), "datos")
+    assert list_snapshots(snaps) == [1, 2]
+    # El eslabón 2 solo guarda lo cambiado; lo demás apunta al 1
+    manifest = load_manifest(snaps, 2, load_key(key_path))
+    assert {rel: entry[3] for rel, entry in manifest["files"].items()} == {"a.txt": 2, "c.txt": 2}
+
+    restore_snapshot(snaps, key_path, str(tmp_path / "r2"))
+    assert tree_files(tmp_path / "r2") == tree_files(src)
+    restore_snapshot(snaps, key_path, str(tmp_path / "r1"), snap_id=1)
+    assert tree_files(tmp_path / "r1") == state1
+    assert abs(os.stat(tmp_path / "r1" / "a.txt").st_mtime - old) < 1    # con su fecha
+
+
+def test_touched_file_reuses_previous_content(tmp_path):
+    src, out = tmp_path / "datos", tmp_path / "copias"
+    write(src / "a.txt", b"igual", time.time() - 3600)
+    create_snapshot(str(src), str(out), workers=1)
+    os.utime(src / "a.txt")
+    snap_id, _, stats = create_snapshot(str(src), str(out), workers=1)
+    assert snap_id == 2 and stats["changed"] == 0 and stats["reused"] == 1
+    snaps = snapshot_dir(str(out), "datos")
+    assert not os.path.exists(os.path.join(snaps, "000002.zip.enc"))
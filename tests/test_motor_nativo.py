@@ -0,0 +1,147 @@
+import os, time
+import pytest
+from conftest import write, tree_files
+from comandos import build_cmd
+from motores import NativeBackend
+from motor_nativo import (Selector, parse_robocopy_args, RC_COPIED, RC_EXTRAS, RC_FAILED, RC_FATAL)
+
+
+def run(src, dst, *flags):
+    lines = []
+    rc = NativeBackend().run(build_cmd(str(src), str(dst), *flags, "/R:0", "/W:0"), lines.append)
+    return rc, "".join(lines)
+
+
+def test_mirror_copies_and_purges(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt", b"a")
+    write(src / "sub" / "b.txt", b"bb")
+    (src / "empty").mkdir()
+    write(dst / "extra.txt", b"old")
+    write(dst / "gone" / "c.txt", b"c")
+    rc, out = run(src, dst, "/MIR")
+    assert rc == RC_COPIED | RC_EXTRAS
+    assert tree_files(dst) == tree_files(src)
+    assert (dst / "empty").is_dir() and not (dst / "gone").exists()
+    assert "*EXTRA File" in out and "*EXTRA Dir" in out
+
+
+def test_second_run_copies_nothing(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt", b"a")
+    assert run(src, dst, "/E")[0] == RC_COPIED
+    assert run(src, dst, "/E")[0] == 0
+
+
+def test_classify_with_fft_and_exclusions():
+    select = Selector(parse_robocopy_args(["/FFT", "/XO"]))
+
+    class St:
+        def __init__(self, size, mtime_s):
+            self.st_size, self.st_mtime_ns = size, int(mtime_s * 1e9)
+
+    now = time.time()
+    assert select.classify(St(1, now), None) == ("New File", True)
+    assert select.classify(St(1, now), St(1, now + 1)) == ("same", False)    # dentro de los 2 s de /FFT
+    assert select.classify(St(2, now), St(1, now)) == ("Changed", True)
+    assert select.classify(St(1, now + 10), St(1, now)) == ("Newer", True)
+    assert select.classify(St(1, now), St(1, now + 10)) == ("Older", False)   # /XO
+
+
+def test_selector_filters():
+    select = Selector(parse_robocopy_args(["*.txt", "/XF", "skip*", "/XD", "node_modules"]))
+    assert not select.excluded_file("a.txt", None)
+    assert select.excluded_file("a.log", None)
+    assert select.excluded_file("skip.txt", None)
+    assert select.excluded_dir("node_modules", "/x/node_modules")
+    assert not select.excluded_dir("src", "/x/src")
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+def test_xj_skips_symlinked_directory(tmp_path):
+    # Con /XJ (siempre en BASE_ARGS) un enlace a una carpeta no se copia, ni como archivo
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt", b"a")
+    write(tmp_path / "elsewhere" / "b.txt", b"b")
+    try:
+        os.symlink(tmp_path / "elsewhere", src / "link", target_is_directory=True)
+    except OSError:
+        pytest.skip("sin permiso para crear enlaces")
+    rc, out = run(src, dst, "/E")
+    assert rc == RC_COPIED
+    assert "ERROR" not in out
+    assert tree_files(dst) == {"a.txt": b"a"}
+
+
+def test_destination_error_is_counted_and_the_rest_continues(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "ok" / "a.txt", b"a")
+    write(src / "bad" / "b.txt", b"b")
+    write(dst / "bad", b"un archivo donde va una carpeta")
+    (dst / "ok").mkdir()
+    rc, out = run(src, dst, "/E", "/XX")
+    assert rc == RC_COPIED | RC_FAILED
+    assert "Creating Destination Directory" in out or "Accessing Destination Directory" in out
+    assert (dst / "ok" / "a.txt").read_bytes() == b"a"
+    assert "Dirs :" in out    # la tabla final sale igual
+
+
+def test_source_listing_error_is_counted_and_the_rest_continues(tmp_path, monkeypatch):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "ok" / "a.txt", b"a")
+    write(src / "locked" / "b.txt", b"b")
+    write(src / "locked" / "deep" / "c.txt", b"c")
+    real = os.scandir
+
+    def scandir(path):
+        if os.path.basename(path) == "locked" and str(src) in str(path):
+            raise PermissionError(13, "Permission denied", path)
+        return real(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    rc, out = run(src, dst, "/E")
+    assert rc == RC_COPIED | RC_FAILED
+    assert "ERROR 13 (0x0000000D) Accessing Source Directory" in out
+    assert tree_files(dst) == {"ok/a.txt": b"a"}
+
+
+def test_unreadable_destination_root_is_fatal(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "a.txt", b"a")
+    write(dst, b"un archivo")
+    rc, out = run(src, dst, "/E")
+    assert rc == RC_FATAL
+    assert "Dirs :" in out
+
+
+class _CutAfter:
+    # Cubo de ancho de banda falso: tras el primer bloque falla o cancela la copia
+    def __init__(self, cancel=None):
+        self.cancel, self.blocks = cancel, 0
+
+    def consume(self, n, cancel=None):
+        self.blocks += 1
+        if self.blocks == 1:
+            if self.cancel is None:
+                raise OSError(5, "Input/output error")
+            self.cancel.set()
+
+
+@pytest.mark.parametrize("cancelled", [False, True])
+def test_cut_copy_never_leaves_a_partial_file(tmp_path, monkeypatch, cancelled):
+    import threading
+    import motor_nativo
+    from motor_nativo import NativeEngine
+    monkeypatch.setattr(motor_nativo, "COPY_BLOCK", 1000)
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    old = time.time() - 3600
+    write(src / "big.bin", os.urandom(10000), old)
+    cancel = threading.Event()
+    opts = parse_robocopy_args(["/E", "/XO", "/R:0", "/W:0"])
+    rc = NativeEngine(str(src), str(dst), opts, lambda line: None, cancel, None,
+                      _CutAfter(cancel if cancelled else None)).run()
+    assert rc == (RC_FATAL if cancelled else RC_FAILED)
+    assert tree_files(dst) == {}
+    # La siguiente pasada incremental (/E /XO) lo copia entero
+    assert run(src, dst, "/E", "/XO")[0] == RC_COPIED
+    assert tree_files(dst) == tree_files(src)
@@ -0,0 +1,76 @@
+import os
+import pytest
+from conftest import write, tree_files
+from multidestino import FanOutBackend, build_fanout_cmd, split_fanout_cmd
+from motor_nativo import RC_COPIED, RC_EXTRAS, RC_FAILED, RC_FATAL
+
+
+def run(src, targets):
+    lines = []
+    cmd = build_fanout_cmd(str(src), [(str(d), [*flags, "/R:0", "/W:0"]) for d, flags in targets])
+    return FanOutBackend().run(cmd, lines.append), "".join(lines)
+
+
+def test_split_keeps_flags_per_target():
+    cmd = ["robocopy", "S", "A", "/MIR", "/TO:B", "/E", "/MT:4"]
+    assert split_fanout_cmd(cmd) == ("S", [("A", ["/MIR"]), ("B", ["/E"])], 4)
+
+
+def test_fanout_copies_to_every_target(tmp_path):
+    src, a, b = tmp_path / "src", tmp_path / "a", tmp_path / "b"
+    write(src / "x.txt", b"x" * 5000)
+    write(src / "sub" / "y.txt", b"y")
+    write(b / "extra.txt", b"old")
+    rc, out = run(src, [(a, ["/E"]), (b, ["/MIR"])])
+    assert rc == RC_COPIED | RC_EXTRAS
+    assert tree_files(a) == tree_files(b) == tree_files(src)
+
+
+def test_fanout_failed_target_does_not_stop_the_others(tmp_path):
+    src, a, b = tmp_path / "src", tmp_path / "a", tmp_path / "b"
+    write(src / "sub" / "y.txt", b"y")
+    write(b / "sub", b"un archivo donde va una carpeta")
+    rc, out = run(src, [(a, ["/E"]), (b, ["/E", "/XX"])])
+    assert rc & RC_FAILED and not rc & RC_FATAL
+    assert tree_files(a) == {"sub/y.txt": b"y"}
+    assert "Dirs :" in out
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+def test_fanout_skips_symlinked_directory(tmp_path):
+    src, a, b = tmp_path / "src", tmp_path / "a", tmp_path / "b"
+    write(src / "x.txt", b"x")
+    write(tmp_path / "elsewhere" / "y.txt", b"y")
+    try:
+        os.symlink(tmp_path / "elsewhere", src / "link", target_is_directory=True)
+    except OSError:
+        pytest.skip("sin permiso para crear enlaces")
+    rc, out = run(src, [(a, ["/E"]), (b, ["/E"])])
+    assert rc == RC_COPIED and "ERROR" not in out
+    assert tree_files(a) == tree_files(b) == {"x.txt": b"x"}
+
+
+class _CancelAfterFirstBlock:
+    def __init__(self, cancel):
+        self.cancel = cancel
+
+    def consume(self, n, cancel=None):
+        self.cancel.set()
+
+
+def test_cancelled_fanout_leaves_no_partial_files(tmp_path, monkeypatch):
+    import threading, time
+    import multidestino
+    from multidestino import FanOutEngine
+    from motor_nativo import parse_robocopy_args
+    monkeypatch.setattr(multidestino, "STREAM_BLOCK", 1000)
+    src, a, b = tmp_path / "src", tmp_path / "a", tmp_path / "b"
+    write(src / "big.bin", os.urandom(10000), time.time() - 3600)
+    cancel = threading.Event()
+    targets = [(str(d), parse_robocopy_args(["/E", "/XO", "/R:0", "/W:0"])) for d in (a, b)]
+    FanOutEngine(str(src), targets, lambda line: None, cancel, 2, _CancelAfterFirstBlock(cancel)).run()
+    assert tree_files(a) == tree_files(b) == {}
+    # La siguiente pasada incremental lo copia entero a los dos
+    rc, _ = run(src, [(a, ["/E", "/XO"]), (b, ["/E", "/XO"])])
+    assert rc == RC_COPIED
+    assert tree_files(a) == tree_files(b) == tree_files(src)
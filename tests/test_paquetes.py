@@ -0,0 +1,60 @@
+import os
+import pytest
+from conftest import write, tree_files
+from comandos import build_cmd
+from motores import NativeBackend
+from motor_nativo import RC_COPIED
+from paquetes import read_bundle, write_entry
+
+
+def test_read_bundle_caps_at_limit_and_checks_size(tmp_path):
+    write(tmp_path / "small.txt", b"x" * 10)
+    write(tmp_path / "grown.txt", b"x" * 10)
+    write(tmp_path / "big.txt", b"x" * 100)
+    items = [(name, os.stat(tmp_path / name)) for name in ("small.txt", "grown.txt", "big.txt")]
+    write(tmp_path / "grown.txt", b"x" * 20)     # cambió después del recorrido
+    entries, rest = read_bundle(str(tmp_path), items, 50)
+    assert [e.name for e in entries] == ["small.txt"]
+    assert [name for name, _ in rest] == ["grown.txt", "big.txt"]
+
+
+def test_write_entry_keeps_times_and_mode(tmp_path):
+    src = write(tmp_path / "a.txt", b"datos", mtime=1_000_000_000)
+    os.chmod(src, 0o640)
+    (entry,), _ = read_bundle(str(tmp_path), [("a.txt", os.stat(src))], 1024)
+    out = tmp_path / "out"
+    out.mkdir()
+    assert write_entry(entry, str(out)) == 5
+    st = os.stat(out / "a.txt")
+    assert st.st_mtime_ns == os.stat(src).st_mtime_ns
+    if os.name != "nt":
+        assert st.st_mode & 0o777 == 0o640
+
+
+def test_bundle_copy_matches_plain_copy(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    for i in range(300):
+        write(src / f"d{i % 3}" / f"f{i}.txt", os.urandom(i * 10))
+    write(src / "big.bin", os.urandom(200 * 1024))
+    lines = []
+    rc = NativeBackend().run(build_cmd(str(src), str(dst), "/E", "/BUNDLE:64"), lines.append)
+    assert rc == RC_COPIED
+    assert tree_files(dst) == tree_files(src)
+    assert all(os.stat(src / rel).st_mtime_ns // 10 ** 9 == os.stat(dst / rel).st_mtime_ns // 10 ** 9
+               for rel in tree_files(src))
+
+
+def test_cut_write_leaves_the_old_file(tmp_path, monkeypatch):
+    src = write(tmp_path / "a.txt", b"nuevo contenido")
+    out = tmp_path / "out"
+    old = write(out / "a.txt", b"viejo", mtime=1_000_000_000)
+    (entry,), _ = read_bundle(str(tmp_path), [("a.txt", os.stat(src))], 1024)
+
+    def broken_write(fd, data):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "write", broken_write)
+    with pytest.raises(OSError):
+        write_entry(entry, str(out))
+    monkeypatch.undo()
+    assert old.read_bytes() == b"viejo" and os.listdir(out) == ["a.txt"]
@@ -0,0 +1,54 @@
+import os
+from conftest import write, tree_files
+from comandos import build_cmd
+from motores import NativeBackend
+from motor_nativo import RC_COPIED, RC_EXTRAS
+from particiones import ShardedBackend, plan_shards
+
+
+def tree_dirs(root):
+    return {os.path.relpath(d, root).replace(os.sep, "/") for d, _, _ in os.walk(root)}
+
+
+def make_tree(src):
+    # "big" pesa mucho más que el resto: se parte en su nivel y sus hijos
+    for i in range(4):
+        for j in range(20):
+            write(src / "big" / f"p{i}" / f"f{j}.bin", b"x" * 1000)
+    write(src / "big" / "own.txt", b"own")
+    write(src / "small" / "s.txt", b"s")
+    write(src / "top.txt", b"t")
+    (src / "empty").mkdir()
+
+
+def test_plan_shards_splits_heavy_folders_and_covers_the_tree(tmp_path):
+    src = tmp_path / "src"
+    make_tree(src)
+    shards = plan_shards(str(src), ["/MIR"], workers=2)
+    units = {(s.rel, s.recursive) for s in shards}
+    assert ("", False) in units and ("big", False) in units
+    assert {("big/p0", True), ("big/p1", True), ("big/p2", True), ("big/p3", True)} <= units
+    assert ("small", True) in units and ("empty", True) in units
+    # De mayor a menor peso y sin ninguna parte mucho mayor que el reparto
+    weights = [s.weight for s in shards]
+    assert weights == sorted(weights, reverse=True)
+    assert weights[0] <= 2 * sum(weights) / 4
+    # Sin recursión o con /LEV no se parte nada
+    assert [(s.rel, s.recursive) for s in plan_shards(str(src), ["/LEV:2", "/E"])] == [("", True)]
+
+
+def test_sharded_mirror_purges_extras_at_every_depth(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src)
+    write(dst / "extra.txt", b"e")                       # en el nivel de la raíz (L:)
+    write(dst / "gone" / "deep" / "x.txt", b"x")         # carpeta sobrante en la raíz
+    write(dst / "big" / "extra.txt", b"e")               # en un nivel partido (L:big)
+    write(dst / "big" / "gone" / "y.txt", b"y")          # carpeta sobrante en un nivel partido
+    write(dst / "big" / "p1" / "extra.txt", b"e")        # dentro de un subárbol (T:big/p1)
+    write(dst / "big" / "p1" / "gone" / "z.txt", b"z")
+    lines = []
+    cmd = build_cmd(str(src), str(dst), "/MIR", "/R:0", "/W:0")
+    rc = ShardedBackend(NativeBackend(), workers=2).run(cmd, lines.append)
+    assert rc == RC_COPIED | RC_EXTRAS
+    assert tree_files(dst) == tree_files(src)
+    assert tree_dirs(dst) == tree_dirs(src)
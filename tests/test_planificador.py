@@ -0,0 +1,64 @@
+import pytest
+from conftest import write, tree_files
+from comandos import build_cmd
+from motores import NativeBackend
+from planificador import Scheduler, DONE, CANCELLED, FAILED, QUEUED
+
+
+def scheduler(tmp_path, **kwargs):
+    kwargs.setdefault("backend_factory", NativeBackend)
+    return Scheduler(str(tmp_path / "trabajos.sqlite"), **kwargs)
+
+
+def test_job_runs_and_records_metrics(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "sub" / "a.txt", b"a")
+    lines = []
+    sched = scheduler(tmp_path, on_line=lambda job, line: lines.append(line))
+    sched.start()
+    job = sched.submit(build_cmd(str(src), str(dst), "/E"))
+    assert sched.wait(job, 30) == 1
+    sched.stop()
+    assert job.state == DONE and tree_files(dst) == {"sub/a.txt": b"a"}
+    assert job.metrics["files_copied"] == 1 and job.metrics["backend"] == "nativo"
+
+
+def broken_backend():
+    raise OSError("sin motor")
+
+
+def test_job_that_cannot_start_fails_with_an_error_line(tmp_path):
+    lines = []
+    sched = scheduler(tmp_path, on_line=lambda job, line: lines.append(line),
+                      backend_factory=broken_backend)
+    sched.start()
+    job = sched.submit(build_cmd(str(tmp_path / "a"), str(tmp_path / "b")))
+    sched.wait(job, 30)
+    sched.stop()
+    assert job.state == FAILED and job.rc is None
+    assert "ERROR: sin motor" in "".join(lines)
+
+
+@pytest.mark.parametrize("cmd", [build_cmd(None, None), build_cmd("", "x"), build_cmd("a", "b", "/RH:99")])
+def test_submit_rejects_invalid_commands(tmp_path, cmd):
+    sched = scheduler(tmp_path)
+    with pytest.raises(ValueError):
+        sched.submit(cmd)
+    assert sched.jobs() == []
+
+
+def test_failed_and_cancelled_jobs_can_be_resumed_next_session(tmp_path):
+    sched = scheduler(tmp_path)
+    job = sched.submit(build_cmd(str(tmp_path / "a"), str(tmp_path / "b")))
+    assert sched.cancel(job.id)
+    sched.db.close()
+
+    again = scheduler(tmp_path)
+    assert [j["state"] for j in again.jobs()] == [CANCELLED]
+    assert again.resume(job.id)
+    assert again.jobs()[0]["state"] == QUEUED
+
+    again.cancel(job.id)
+    again.clear_finished()
+    again.db.close()
+    assert scheduler(tmp_path).jobs() == []
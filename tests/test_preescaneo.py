@@ -0,0 +1,50 @@
+import os, shutil
+import pytest
+from conftest import write
+from motor_nativo import parse_robocopy_args
+from preescaneo import ScanCache, scan_tree
+
+
+def test_scan_counts_with_filters(tmp_path):
+    root = tmp_path / "src"
+    write(root / "a.txt", b"x" * 10)
+    write(root / "sub" / "b.txt", b"x" * 20)
+    write(root / "sub" / "skip.log", b"x" * 30)
+    cache = str(tmp_path / "cache.sqlite")
+    profile = scan_tree(str(root), parse_robocopy_args(["/E", "/XF", "*.log"]), 4, cache_path=cache)
+    assert (profile.files, profile.bytes, profile.dirs) == (2, 30, 2)
+    assert (profile.skipped_files, profile.skipped_bytes) == (1, 30)
+    again = scan_tree(str(root), parse_robocopy_args(["/E"]), 4, cache_path=cache)
+    assert again.files == 3 and again.cached == 2
+
+
+def test_full_rescan_forgets_deleted_dirs(tmp_path):
+    root = tmp_path / "src"
+    write(root / "keep" / "a.txt")
+    write(root / "gone" / "deep" / "b.txt")
+    cache = str(tmp_path / "cache.sqlite")
+    opts = parse_robocopy_args(["/E"])
+    scan_tree(str(root), opts, 2, cache_path=cache)
+    shutil.rmtree(root / "gone")
+    scan_tree(str(root), opts, 2, full=True, cache_path=cache)
+    known = ScanCache(cache)
+    assert sorted(known.load(os.path.normcase(str(root)))) == ["", "keep"]
+    known.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+def test_scan_skips_links_under_xj(tmp_path):
+    root = tmp_path / "src"
+    write(root / "a.txt", b"x")
+    write(tmp_path / "elsewhere" / "b.txt", b"yy")
+    try:
+        os.symlink(tmp_path / "elsewhere", root / "dir_link", target_is_directory=True)
+        os.symlink(tmp_path / "elsewhere" / "b.txt", root / "file_link")
+    except OSError:
+        pytest.skip("sin permiso para crear enlaces")
+    cache = str(tmp_path / "cache.sqlite")
+    with_xj = scan_tree(str(root), parse_robocopy_args(["/E", "/XJ"]), 2, cache_path=cache)
+    assert (with_xj.files, with_xj.dirs) == (1, 1)
+    # El mismo listado en caché, sin /XJ, sigue los enlaces
+    without = scan_tree(str(root), parse_robocopy_args(["/E"]), 2, cache_path=cache)
+    assert (without.files, without.bytes, without.dirs) == (3, 5, 2)
@@ -0,0 +1,70 @@
+import os
+from conftest import write, tree_files
+from comandos import build_cmd
+from motores import NativeBackend
+from motor_nativo import RC_COPIED
+from puntos_control import Journal
+
+
+def test_journal_reload_ignores_torn_last_line(tmp_path):
+    path = str(tmp_path / "j.diario")
+    journal = Journal(path, "firma")
+    journal.add("D", "a")
+    journal.add("T", "b")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("T\tmedia")     # caída a mitad de línea
+    again = Journal(path, "firma")
+    assert again.resumed
+    assert again.dirs == {"a"} and again.subtrees == {"b"}
+    again.close()
+    assert not Journal(path, "otra").resumed
+
+
+def test_native_engine_records_and_resumes(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "done" / "a.txt", b"a")
+    write(src / "todo" / "b.txt", b"b")
+    write(src / "c.txt", b"c")
+    cmd = build_cmd(str(src), str(dst), "/E", "/R:0", "/W:0")
+    path = str(tmp_path / "j.diario")
+
+    # Un intento anterior dejó terminado el subárbol "done"
+    journal = Journal(path, "firma")
+    journal.add("T", "done")
+    journal.close()
+    journal = Journal(path, "firma")
+    lines = []
+    assert NativeBackend().run(cmd, lines.append, journal=journal) == RC_COPIED
+    journal.close()
+    assert "Reanudando" in "".join(lines)
+    assert tree_files(dst) == {"c.txt": b"c", "todo/b.txt": b"b"}
+
+    # Y este intento apunta todo lo que terminó, raíz incluida
+    reloaded = Journal(path, "firma")
+    assert {"", "todo"} <= reloaded.subtrees
+    assert "" in reloaded.dirs and os.path.join("todo") in reloaded.dirs
+    reloaded.close()
+
+
+def test_data_reaches_disk_before_it_is_journaled(tmp_path, monkeypatch):
+    import puntos_control
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "sub" / "a.txt", b"a")
+    events = []
+    real_fsync, real_add = os.fsync, puntos_control.Journal.add
+    monkeypatch.setattr(os, "fsync", lambda fd: (events.append(os.fstat(fd).st_ino), real_fsync(fd))[1])
+
+    def add(self, kind, value):
+        events.append((kind, value))
+        real_add(self, kind, value)
+
+    monkeypatch.setattr(puntos_control.Journal, "add", add)
+    journal = Journal(str(tmp_path / "j.diario"), "firma")
+    cmd = build_cmd(str(src), str(dst), "/E", "/R:0", "/W:0")
+    assert NativeBackend().run(cmd, lambda line: None, journal=journal) == RC_COPIED
+    journal.close()
+    done = events.index(("D", "sub"))
+    assert os.stat(dst / "sub" / "a.txt").st_ino in events[:done]
+    if os.name != "nt":
+        assert os.stat(dst / "sub").st_ino in events[:done]
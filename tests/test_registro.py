@@ -0,0 +1,73 @@
+from registro import LogSink
+
+
+class FakeText:
+    # Lo mínimo de un ScrolledText que usa LogSink, con índices "línea.0"
+    def __init__(self):
+        self.lines = [""]
+
+    def insert(self, index, text, tag=None):
+        parts = text.split("\n")
+        self.lines[-1] += parts[0]
+        self.lines.extend(parts[1:])
+
+    def get(self, start, end):
+        return "".join(line + "\n" for line in self.lines[:int(end.split(".")[0]) - 1])
+
+    def delete(self, start, end):
+        del self.lines[:int(end.split(".")[0]) - 1]
+
+    def see(self, index):
+        pass
+
+
+def test_spill_keeps_order_when_a_batch_overflows(tmp_path):
+    widget = FakeText()
+    spill = tmp_path / "derrame.txt"
+    sink = LogSink(widget, max_lines=5, spill_path=str(spill))
+    for i in range(3):
+        sink.put(f"viejo {i}\n")
+    sink.drain()
+    for i in range(8):
+        sink.put(f"nuevo {i}\n")
+    sink.drain()
+    sink.close()
+    assert widget.lines[:-1] == [f"nuevo {i}" for i in range(3, 8)]
+    assert spill.read_text(encoding="utf-8") == "".join(
+        [f"viejo {i}\n" for i in range(3)] + [f"nuevo {i}\n" for i in range(3)])
+
+
+def test_trim_spills_oldest_lines(tmp_path):
+    widget = FakeText()
+    spill = tmp_path / "derrame.txt"
+    sink = LogSink(widget, max_lines=3, spill_path=str(spill))
+    for i in range(5):
+        sink.put(f"línea {i}\n", "ok" if i % 2 else None)
+        sink.drain()
+    sink.close()
+    assert widget.lines[:-1] == ["línea 2", "línea 3", "línea 4"]
+    assert spill.read_text(encoding="utf-8") == "línea 0\nlínea 1\n"
+
+
+def test_calls_run_on_drain_after_the_text_before_them(tmp_path):
+    import threading
+    widget = FakeText()
+    sink = LogSink(widget, max_lines=3, spill_path=str(tmp_path / "derrame.txt"))
+    seen = []
+
+    def worker():
+        for i in range(5):
+            sink.put(f"línea {i}\n")
+        sink.call(lambda n: seen.append((n, list(widget.lines))), 5)
+        sink.call(lambda: 1 / 0)            # se informa, no corta el lote
+        sink.put("después\n", "ok")
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+    assert seen == []                       # nada se ejecuta en el hilo de trabajo
+    assert sink.drain() == 8
+    sink.close()
+    # La llamada ve ya pintado lo anterior aunque parte del lote fuera a disco
+    assert seen == [(5, ["línea 3", "línea 4", ""])]
+    assert widget.lines[:-1] == ["línea 3", "línea 4", "después"]
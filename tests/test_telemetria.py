@@ -0,0 +1,40 @@
+import os, cProfile, threading
+from concurrent.futures import ThreadPoolExecutor
+import telemetria
+from telemetria import Telemetry, profile_capture
+
+
+def work(n):
+    return sum(range(n))
+
+
+def test_phase_and_counters():
+    t = Telemetry()
+    t.count("bytes", 10, dst="a")
+    t.count("bytes", 5, dst="a")
+    with t.phase("copy"):
+        pass
+    assert t.counters[("bytes", (("dst", "a"),))] == 15
+    assert t.phase_totals()["copy"] >= 0
+
+
+def test_profile_capture_with_worker_threads(tmp_path):
+    with profile_capture("prueba", str(tmp_path)) as result:
+        with ThreadPoolExecutor(4) as pool:
+            assert list(pool.map(work, [1000] * 8)) == [work(1000)] * 8
+    assert os.path.exists(result.stats_path)
+    assert "work" in open(result.report_path, encoding="utf-8").read()
+
+
+def test_profile_hook_never_breaks_new_threads(tmp_path, monkeypatch):
+    # Como en Python 3.12+: activar un segundo perfilador en otro hilo falla
+    class Busy(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                raise ValueError("Another profiling tool is already active")
+            super().enable(*args, **kwargs)
+
+    monkeypatch.setattr(telemetria.cProfile, "Profile", Busy)
+    with profile_capture("prueba", str(tmp_path)):
+        with ThreadPoolExecutor(2) as pool:
+            assert list(pool.map(work, [10, 20])) == [work(10), work(20)]
@@ -0,0 +1,32 @@
+import os
+import pytest
+from conftest import write
+from verificacion import iter_selected, verify
+
+
+def test_verify_reports_mismatch_and_missing(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    write(src / "same.txt", b"igual")
+    write(dst / "same.txt", b"igual")
+    write(src / "sub" / "diff.txt", b"origen")
+    write(dst / "sub" / "diff.txt", b"destin")
+    write(src / "gone.txt", b"g")
+    report = verify(str(src), str(dst), emit=lambda line: None)
+    assert not report.ok
+    assert report.matched == 1
+    assert report.mismatched == [{"path": os.path.join("sub", "diff.txt"), "reason": "contenido"}]
+    assert report.missing == ["gone.txt"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+def test_iter_selected_skips_links_under_xj(tmp_path):
+    src = tmp_path / "src"
+    write(src / "a.txt")
+    write(src / "skip.log")
+    write(tmp_path / "elsewhere" / "b.txt")
+    try:
+        os.symlink(tmp_path / "elsewhere", src / "link", target_is_directory=True)
+    except OSError:
+        pytest.skip("sin permiso para crear enlaces")
+    assert sorted(rel for rel, _ in iter_selected(str(src), ["/E", "/XJ", "/XF", "*.log"])) == ["a.txt"]
+    assert sorted(rel for rel, _ in iter_selected(str(src), ["/E"])) == ["a.txt", os.path.join("link", "b.txt"), "skip.log"]
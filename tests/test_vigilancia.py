@@ -0,0 +1,44 @@
+import threading
+from vigilancia import SyncDaemon, coalesce
+
+
+class _CountingEvent(threading.Event):
+    def __init__(self):
+        super().__init__()
+        self.waits = 0
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        return super().wait(timeout)
+
+
+def test_take_batch_waits_out_the_debounce_without_spinning(tmp_path):
+    daemon = SyncDaemon(str(tmp_path), str(tmp_path), ["/MIR"], debounce=0.3, backend=object(), tuner=object())
+    daemon._wake = _CountingEvent()
+    daemon.notify("a")
+    daemon.notify("b/c", recursive=True)
+    assert daemon._take_batch(threading.Event()) == ({"a"}, {"b/c"})
+    # Una espera por el evento y otra por lo que queda de calma, no miles
+    assert daemon._wake.waits <= 4
+
+
+def test_coalesce_lifts_to_parents_when_over_the_limit():
+    assert coalesce({"a/x", "a/y"}, {"a/x/z"}, 8) == ({"a/x", "a/y"}, {"a/x/z"})
+    assert coalesce({"a/x", "a/y", "b"}, set(), 2) == ({"b"}, {"a"})
+
+
+def test_watch_heartbeat_expires_on_its_own(tmp_path, monkeypatch):
+    import indice
+    from indice import JobIndex
+    index = JobIndex.for_job(str(tmp_path / "src"), str(tmp_path / "dst"))
+    try:
+        assert not index.source_watched()
+        index.set_meta("watching_s", 1)      # marca antigua de un vigilante que murió
+        assert not index.source_watched()
+        index.set_watching(10)
+        assert index.source_watched()
+        now = indice.time.time()
+        monkeypatch.setattr(indice.time, "time", lambda: now + 11)
+        assert not index.source_watched()
+    finally:
+        index.close()
@@ -0,0 +1,240 @@
+# verificacion.py
+import os, json, time, sqlite3, hashlib, threading, importlib.util
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from analizador import format_bytes
+from motor_nativo import Selector, parse_robocopy_args
+from rutas import app_dir
+from telemetria import TELEMETRY
+
+# Verificación de una copia por contenido: hashea origen y destino en paralelo
+# y avisa de lo que no coincide. Los hashes se guardan por (ruta, tamaño,
+# mtime), así una verificación nocturna solo vuelve a leer lo que cambió.
+# OJO: un archivo reescrito con el mismo tamaño y mtime no se vuelve a leer.
+READ_BLOCK = 1024 * 1024
+BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT NOT NULL, algo TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL,
+    PRIMARY KEY (path, algo)
+) WITHOUT ROWID;
+"""
+
+
+def default_algo():
+    # xxhash es bastante más rápido si está instalado; si no, BLAKE2 de la biblioteca estándar
+    return "xxh3_128" if importlib.util.find_spec("xxhash") else "blake2b"
+
+
+def _new_hash(algo):
+    if algo == "xxh3_128":
+        import xxhash
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(path, algo="blake2b"):
+    # Lectura por bloques grandes en un búfer reutilizado; hashlib suelta el GIL al procesarlos
+    h = _new_hash(algo)
+    buf = bytearray(READ_BLOCK)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Caché persistente de hashes. Las escrituras se agrupan (put + flush) para
+    no hacer un commit por archivo.
+    """
+
+    def __init__(self, db_path=None):
+        self.conn = sqlite3.connect(db_path or os.path.join(app_dir(), "hashes.sqlite"))
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._pending = []
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, path, st, algo):
+        row = self.conn.execute("SELECT size, mtime_ns, hash FROM hashes WHERE path=? AND algo=?",
+                                (self._key(path), algo)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def put(self, path, st, algo, digest):
+        self._pending.append((self._key(path), algo, st.st_size, st.st_mtime_ns, digest))
+        if len(self._pending) >= BATCH:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class VerifyReport:
+
+    def __init__(self, src, dst):
+        self.src, self.dst = src, dst
+        self.files = 0
+        self.matched = 0
+        self.cached = 0
+        self.bytes_hashed = 0
+        self.mismatched = []
+        self.missing = []
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not (self.mismatched or self.missing or self.errors)
+
+    def summary(self):
+        return (f"{self.files} archivos, {self.matched} iguales, {len(self.mismatched)} distintos, "
+                f"{len(self.missing)} faltan, {len(self.errors)} errores · {format_bytes(self.bytes_hashed)} leídos, "
+                f"{self.cached} desde caché · {self.elapsed:.1f} s")
+
+    def as_dict(self):
+        return {"src": self.src, "dst": self.dst, "ok": self.ok, "files": self.files, "matched": self.matched,
+                "cached": self.cached, "bytes_hashed": self.bytes_hashed, "elapsed": round(self.elapsed, 3),
+                "mismatched": self.mismatched, "missing": self.missing, "errors": self.errors}
+
+    def to_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+
+
+def iter_selected(src, args=()):
+    """
+    Archivos de src que copiaría robocopy con estos argumentos (patrones, /XF,
+    /XD, /XJ, edad y tamaño): rutas relativas con su stat.
+    """
+    opts = parse_robocopy_args(list(args))
+    select = Selector(opts)
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(src, rel) if rel else src) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for e in entries:
+            kind = select.entry_kind(e)
+            if kind == "dir":
+                if opts.subdirs and not select.excluded_dir(e.name, e.path):
+                    stack.append(os.path.join(rel, e.name))
+            elif kind == "file":
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                if not select.excluded_file(e.name, st):
+                    yield os.path.join(rel, e.name), st
+
+
+def verify(src, dst, args=("/E",), workers=8, cache=None, algo=None, emit=print, cancel=None):
+    """
+    Compara por contenido cada archivo seleccionado de src con su copia en
+    dst. Los tamaños distintos se dan por diferentes sin leer nada; el resto
+    se hashea (lo que no está en caché) en un pool de workers hilos.
+    Devuelve un VerifyReport.
+    """
+    algo = algo or default_algo()
+    own_cache = cache is None
+    cache = cache or HashCache()
+    report = VerifyReport(src, dst)
+    lock = threading.Lock()
+
+    def hash_pair(rel, s_path, s_st, d_path, d_st, hs, hd):
+        # En el pool: solo los lados que no estaban en caché
+        read = 0
+        if hs is None:
+            hs = hash_file(s_path, algo)
+            read += s_st.st_size
+        if hd is None:
+            hd = hash_file(d_path, algo)
+            read += d_st.st_size
+        with lock:
+            report.bytes_hashed += read
+        return rel, s_path, s_st, d_path, d_st, hs, hd
+
+    def settle(future):
+        try:
+            rel, s_path, s_st, d_path, d_st, hs, hd = future.result()
+        except OSError as e:
+            report.errors.append({"path": e.filename or "", "message": e.strerror or str(e)})
+            emit(f"  ERROR\t{e.filename}\t{e.strerror or e}\n")
+            return
+        cache.put(s_path, s_st, algo, hs)
+        cache.put(d_path, d_st, algo, hd)
+        compare(rel, hs, hd)
+
+    def compare(rel, hs, hd):
+        if hs == hd:
+            report.matched += 1
+        else:
+            report.mismatched.append({"path": rel, "reason": "contenido"})
+            emit(f"  *DISTINTO\t{rel}\n")
+
+    emit(f"Verificando {src} -> {dst} ({algo}, {workers} hilos)\n")
+    inflight = set()
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            for rel, s_st in iter_selected(src, args):
+                if cancel is not None and cancel.is_set():
+                    break
+                report.files += 1
+                s_path, d_path = os.path.join(src, rel), os.path.join(dst, rel)
+                try:
+                    d_st = os.stat(d_path)
+                except FileNotFoundError:
+                    report.missing.append(rel)
+                    emit(f"  *FALTA\t{rel}\n")
+                    continue
+                except OSError as e:
+                    report.errors.append({"path": d_path, "message": e.strerror or str(e)})
+                    continue
+                if d_st.st_size != s_st.st_size:
+                    report.mismatched.append({"path": rel, "reason": "tamaño"})
+                    emit(f"  *DISTINTO\t{rel}\t(tamaño {s_st.st_size} / {d_st.st_size})\n")
+                    continue
+                hs, hd = cache.get(s_path, s_st, algo), cache.get(d_path, d_st, algo)
+                if hs is not None and hd is not None:
+                    report.cached += 1
+                    compare(rel, hs, hd)
+                    continue
+                inflight.add(pool.submit(hash_pair, rel, s_path, s_st, d_path, d_st, hs, hd))
+                # Cola acotada: el recorrido no se adelanta demasiado a la lectura
+                if len(inflight) >= workers * 4:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        settle(future)
+            for future in inflight:
+                settle(future)
+    finally:
+        if own_cache:
+            cache.close()
+        else:
+            cache.flush()
+    report.elapsed = time.monotonic() - report.started
+    TELEMETRY.observe("verify", report.elapsed)
+    TELEMETRY.count("bytes_hashed", report.bytes_hashed)
+    emit(f"Verificación: {report.summary()}\n")
+    return report
@@ -0,0 +1,412 @@
+# vigilancia.py
+"""
+Modo vigilancia: mantiene un espejo al día a partir de eventos del sistema de
+archivos, sin recorrer el árbol entero en cada pasada.
+
+Uso: python vigilancia.py ORIGEN DESTINO [/MIR ...] [--debounce 2] [--max-jobs 32]
+"""
+import os, sys, time, errno, struct, select, argparse, threading, importlib.util
+from comandos import build_cmd
+from motores import get_backend
+from autoajuste import VolumeProfiles
+from indice import JobIndex, SOURCE, DEST
+
+# Los vigilantes avisan con callback(ruta_relativa, recursivo):
+#   recursivo=False  algo cambió dentro de esa carpeta (basta /LEV:1)
+#   recursivo=True   la carpeta es nueva o se perdieron eventos: hay que
+#                    sincronizar todo el subárbol
+
+# El latido en el índice se renueva cada periodo de calma (al menos cada
+# HEARTBEAT segundos) y caduca tras STALE_PERIODS sin renovarse
+HEARTBEAT = 1.0
+STALE_PERIODS = 5
+
+
+def _rel(root, path):
+    rel = os.path.relpath(path, root)
+    return "" if rel == "." else rel.replace(os.sep, "/")
+
+def _parent(rel):
+    return rel.rpartition("/")[0]
+
+def _join(root, rel):
+    return os.path.join(root, *rel.split("/")) if rel else root
+
+
+class InotifyWatcher:
+    """
+    inotify (Linux) con ctypes: una vigilancia por carpeta, añadidas al vuelo
+    cuando se crean carpetas nuevas. Si la cola del kernel se desborda o se
+    agota el límite de vigilancias, avisa de la raíz como recursiva.
+    """
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED = 0x400, 0x800, 0x4000, 0x8000
+    IN_ONLYDIR, IN_ISDIR = 0x1000000, 0x40000000
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    _EVENT = struct.Struct("iIII")
+
+    @staticmethod
+    def available():
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            return hasattr(libc, "inotify_init1")
+        except OSError:
+            return False
+
+    def __init__(self, root):
+        import ctypes, ctypes.util
+        self.root = os.path.abspath(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._ctypes = ctypes
+        self._fd = self._libc.inotify_init1(0o2000000)  # IN_CLOEXEC
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._wds = {}
+        self._stop = threading.Event()
+
+    def _add_tree(self, path, callback):
+        for root, dirs, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(root), self.MASK)
+            if wd < 0:
+                err = self._ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    # Sin vigilancias libres: no podemos fiarnos de los eventos
+                    callback("", True)
+                    return
+                continue
+            self._wds[wd] = root
+
+    def start(self, callback):
+        self._add_tree(self.root, callback)
+        t = threading.Thread(target=self._loop, args=(callback,), daemon=True)
+        t.start()
+        return t
+
+    def _loop(self, callback):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 256 * 1024)
+            except (OSError, ValueError):
+                # stop() cerró el descriptor
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+                name = data[offset + self._EVENT.size:offset + self._EVENT.size + length].rstrip(b"\0")
+                offset += self._EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    callback("", True)
+                    continue
+                base = self._wds.get(wd)
+                if base is None:
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._wds.pop(wd, None)
+                    continue
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    callback(_parent(_rel(self.root, base)), False)
+                    continue
+                path = os.path.join(base, os.fsdecode(name)) if name else base
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_tree(path, callback)
+                    callback(_rel(self.root, path), True)
+                else:
+                    callback(_rel(self.root, base), False)
+
+    def stop(self):
+        self._stop.set()
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+
+class WatchdogWatcher:
+    """
+    Usa el paquete watchdog si está instalado (ReadDirectoryChangesW en Windows,
+    FSEvents en macOS).
+    """
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("watchdog") is not None
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._observer = None
+
+    def start(self, callback):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+        root = self.root
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in filter(None, (event.src_path, getattr(event, "dest_path", None))):
+                    if event.is_directory and event.event_type in ("created", "moved"):
+                        callback(_rel(root, path), True)
+                    else:
+                        callback(_rel(root, os.path.dirname(path)), False)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), root, recursive=True)
+        self._observer.start()
+        return self._observer
+
+    def stop(self):
+        if self._observer:
+            self._observer.stop()
+
+
+class PollingWatcher:
+    """
+    Último recurso: compara cada interval segundos el (tamaño, mtime) de todo
+    el árbol. Funciona en cualquier sistema pero cuesta un recorrido por pasada.
+    """
+
+    @staticmethod
+    def available():
+        return True
+
+    def __init__(self, root, interval=30):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def _snapshot(self):
+        snap = {}
+        for root, dirs, files in os.walk(self.root):
+            entries = {}
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                    entries[name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    pass
+            snap[_rel(self.root, root)] = (frozenset(dirs), entries)
+        return snap
+
+    def start(self, callback):
+        def loop():
+            prev = self._snapshot()
+            while not self._stop.wait(self.interval):
+                cur = self._snapshot()
+                for rel, state in cur.items():
+                    if rel not in prev:
+                        if _parent(rel) in prev or not rel:
+                            callback(rel, True)
+                    elif prev[rel] != state:
+                        callback(rel, False)
+                for rel in prev.keys() - cur.keys():
+                    if _parent(rel) in cur:
+                        callback(_parent(rel), False)
+                prev = cur
+        t = threading.Thread(target=loop, daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_watcher(root):
+    for cls in (InotifyWatcher, WatchdogWatcher, PollingWatcher):
+        if cls.available():
+            return cls(root)
+
+
+def coalesce(level_dirs, subtrees, max_jobs):
+    """
+    Reduce los cambios pendientes a trabajos: quita lo que ya cubre un subárbol
+    y, si siguen siendo demasiados, sube de nivel hasta que quepan (en último
+    término, un único trabajo sobre la raíz). Devuelve (level_dirs, subtrees).
+    """
+    subtrees = set(subtrees)
+    level_dirs = set(level_dirs)
+    while True:
+        def covered(rel):
+            rel = _parent(rel) if rel else None
+            while rel is not None:
+                if rel in subtrees:
+                    return True
+                rel = _parent(rel) if rel else None
+            return False
+        subtrees = {s for s in subtrees if not covered(s)}
+        level_dirs = {d for d in level_dirs if d not in subtrees and not covered(d)}
+        if len(level_dirs) + len(subtrees) <= max_jobs or "" in subtrees:
+            return level_dirs, subtrees
+        # Contrapresión: lo más profundo se convierte en subárbol del nivel superior
+        depth = max(rel.count("/") + 1 if rel else 0 for rel in level_dirs | subtrees)
+        lifted = set()
+        for rel in level_dirs | subtrees:
+            parts = rel.split("/") if rel else []
+            if len(parts) >= depth:
+                lifted.add("/".join(parts[:depth - 1]))
+        subtrees = {s for s in subtrees if (s.count("/") + 1 if s else 0) < depth} | lifted
+        level_dirs = {d for d in level_dirs if (d.count("/") + 1 if d else 0) < depth}
+
+
+class SyncDaemon:
+    """
+    Junta los eventos en ráfagas (espera debounce segundos de calma, como mucho
+    max_delay) y lanza trabajos por subárbol con los mismos modificadores que
+    build_cmd. Mientras corre un trabajo los eventos nuevos se acumulan en el
+    mismo conjunto, así nunca hay más de un trabajo pendiente por carpeta.
+    """
+
+    def __init__(self, src, dst, flags, emit=print, debounce=2.0, max_delay=30.0, max_jobs=32, backend=None, tuner=None):
+        self.src = os.path.abspath(src)
+        self.dst = os.path.abspath(dst)
+        self.flags = list(flags)
+        self.emit = emit
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_jobs = max_jobs
+        self.backend = backend or get_backend()
+        # Hilos y /J del perfil del par de volúmenes (sin explorar: son copias pequeñas)
+        self.tuner = tuner or VolumeProfiles()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._level, self._subtrees = set(), set()
+        self._first = self._last = None
+
+    def notify(self, rel, recursive=False):
+        with self._lock:
+            (self._subtrees if recursive else self._level).add(rel)
+            now = time.monotonic()
+            self._first = self._first or now
+            self._last = now
+        self._wake.set()
+
+    def _take_batch(self, stop, idle=None):
+        timeout = 0.5
+        while not stop.is_set():
+            self._wake.wait(timeout)
+            if idle:
+                idle()
+            with self._lock:
+                self._wake.clear()
+                timeout = 0.5
+                if self._first is None:
+                    continue
+                now = time.monotonic()
+                due = min(self._last + self.debounce, self._first + self.max_delay)
+                if now < due:
+                    # Se espera solo lo que falta (o hasta el siguiente evento)
+                    timeout = min(due - now, 0.5)
+                    continue
+                batch = coalesce(self._level, self._subtrees, self.max_jobs)
+                self._level, self._subtrees = set(), set()
+                self._first = self._last = None
+                return batch
+        return None
+
+    def _commands(self, level_dirs, subtrees):
+        cmds = []
+        for rel in sorted(level_dirs):
+            cmds.append((rel, build_cmd(_join(self.src, rel), _join(self.dst, rel), *self.flags, "/LEV:1")))
+        for rel in sorted(subtrees):
+            # Si la carpeta ya no existe en origen, se purga desde su padre
+            while rel and not os.path.isdir(_join(self.src, rel)):
+                rel = _parent(rel)
+            cmds.append((rel, build_cmd(_join(self.src, rel), _join(self.dst, rel), *self.flags)))
+        return cmds
+
+    def _tuned(self, cmd):
+        return self.tuner.apply(cmd, unbuffered_ok=self.backend.name == "robocopy")
+
+    def sync(self, level_dirs, subtrees):
+        rc = 0
+        for rel, cmd in self._commands(level_dirs, subtrees):
+            self.emit(f"[vigilancia] {'/' + rel if rel else '/'} ({len(level_dirs)} carpetas, {len(subtrees)} subárboles)\n")
+            rc |= self.backend.run(self._tuned(cmd), self.emit)
+        return rc
+
+    def _record(self, index, level_dirs, subtrees):
+        # Los eventos también mantienen al día el índice del trabajo, así la
+        # interfaz puede refrescar el origen en modo rápido mientras vigilamos
+        dirty = set(level_dirs) | set(subtrees) | {_parent(s) for s in subtrees if s}
+        index.mark_dirty(SOURCE, dirty)
+        index.mark_dirty(DEST, dirty)
+        if "" in subtrees:
+            # Se perdieron eventos: el índice de origen ya no es fiable
+            index.set_watching(0)
+
+    def initial_sync(self, index):
+        # Lo que cambió antes de empezar a vigilar: pasada con el índice (como la interfaz)
+        index.refresh(SOURCE, self.src, "full")
+        index.refresh(DEST, self.dst, "full" if index.needs_full(DEST) else "quick")
+        changes = index.change_set(self.flags)
+        self.emit(f"[vigilancia] inicial: {changes.summary()}\n")
+        for cmd in index.plan_commands(build_cmd, self.src, self.dst, self.flags, changes):
+            self.backend.run(self._tuned(cmd), self.emit)
+        if changes:
+            index.after_copy(self.dst, changes)
+
+    def run_forever(self, stop=None, initial=True):
+        stop = stop or threading.Event()
+        watcher = make_watcher(self.src)
+        self.emit(f"[vigilancia] {type(watcher).__name__} sobre {self.src}\n")
+        # Se vigila antes de la pasada inicial para no perder nada entre medias
+        watcher.start(self.notify)
+        index = JobIndex.for_job(self.src, self.dst)
+        period = max(min(self.debounce, HEARTBEAT), 0.1)
+        beat = {"next": 0.0, "live": False}
+
+        def heartbeat():
+            # Un trabajo largo no renueva el latido: mejor caducar y que la
+            # interfaz relista entero que fiarse de un origen sin vigilar
+            now = time.monotonic()
+            if beat["live"] and now >= beat["next"]:
+                index.set_watching(STALE_PERIODS * max(self.debounce, period))
+                beat["next"] = now + period
+
+        try:
+            if initial:
+                self.initial_sync(index)
+                beat["live"] = True
+            while not stop.is_set():
+                batch = self._take_batch(stop, heartbeat)
+                if batch:
+                    self._record(index, *batch)
+                    if "" in batch[1]:
+                        beat["live"] = False
+                    self.sync(*batch)
+                    if "" in batch[1]:
+                        index.refresh(SOURCE, self.src, "full")
+                        beat["live"] = True
+                    beat["next"] = 0.0
+        finally:
+            watcher.stop()
+            index.set_watching(0)
+            index.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sincronización continua por eventos del sistema de archivos")
+    ap.add_argument("src")
+    ap.add_argument("dst")
+    ap.add_argument("flags", nargs="*", default=["/MIR"], help="Modificadores de robocopy (por defecto /MIR)")
+    ap.add_argument("--debounce", type=float, default=2.0, help="Segundos de calma antes de sincronizar")
+    ap.add_argument("--max-delay", type=float, default=30.0, help="Espera máxima desde el primer evento")
+    ap.add_argument("--max-jobs", type=int, default=32, help="Trabajos por ráfaga antes de agrupar en subárboles")
+    ap.add_argument("--no-initial", action="store_true", help="No hacer la pasada completa inicial")
+    args = ap.parse_args(argv)
+    daemon = SyncDaemon(args.src, args.dst, args.flags or ["/MIR"], emit=lambda l: print(l, end="", flush=True),
+                        debounce=args.debounce, max_delay=args.max_delay, max_jobs=args.max_jobs)
+    try:
+        daemon.run_forever(initial=not args.no_initial)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
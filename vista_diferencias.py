@@ -0,0 +1,85 @@
+# vista_diferencias.py
+import os
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+from analizador import format_bytes
+from diferencias import CATEGORIES, LABELS
+from estilos import estilo_botones_tk
+from tooltip import ToolTip
+
+PAGE_SIZE = 500
+
+
+class DiffView(tk.Toplevel):
+    """
+    Resultado de diferencias.diff_trees: totales por categoría y una tabla
+    paginada (solo PAGE_SIZE filas en el Treeview a la vez, aunque haya
+    millones). on_copy(result, flags) lanza la copia usando la diferencia
+    como lista de trabajo.
+    """
+
+    def __init__(self, master, result, on_copy=None):
+        super().__init__(master, bg="black")
+        self.title(f"Diferencias: {result.src} -> {result.dst}")
+        self.geometry("1100x600")
+        self.result = result
+        self.on_copy = on_copy
+        self.page = 0
+        self.rows = []
+        style = dict(estilo_botones_tk(), width=16)
+
+        totals = tk.Frame(self, bg="black")
+        totals.pack(fill="x", padx=10, pady=6)
+        self.filter = tk.StringVar(value="todos")
+        choices = ["todos"] + [c for c in CATEGORIES if c != "same" or result.entries["same"]]
+        for col, c in enumerate(choices):
+            text = "Todos" if c == "todos" else f"{LABELS[c]}: {result.counts[c]} ({format_bytes(result.bytes[c])})"
+            tk.Radiobutton(totals, text=text, value=c, variable=self.filter, command=self.apply_filter,
+                           bg="black", fg="white", selectcolor="#333", activebackground="black").grid(row=0, column=col, padx=4)
+        tk.Label(totals, text=f"Carpetas nuevas: {len(result.new_dirs)} · extra: {len(result.extra_dirs)} · "
+                              f"{result.elapsed:.1f} s", bg="black", fg="#ddd").grid(row=1, column=0, columnspan=len(choices), sticky="w")
+
+        columns = ("tipo", "tamaño", "modificado")
+        self.table = ttk.Treeview(self, columns=columns, height=18)
+        self.table.heading("#0", text="Ruta")
+        self.table.column("#0", width=700, stretch=True)
+        for col, width in zip(columns, (110, 110, 150)):
+            self.table.heading(col, text=col.capitalize())
+            self.table.column(col, width=width, stretch=False, anchor="e" if col == "tamaño" else "w")
+        self.table.pack(fill="both", expand=True, padx=10)
+
+        nav = tk.Frame(self, bg="black")
+        nav.pack(fill="x", padx=10, pady=6)
+        tk.Button(nav, text="< Anterior", command=lambda: self.show(self.page - 1), **style).pack(side="left", padx=4)
+        tk.Button(nav, text="Siguiente >", command=lambda: self.show(self.page + 1), **style).pack(side="left", padx=4)
+        self.page_label = tk.Label(nav, bg="black", fg="#ddd")
+        self.page_label.pack(side="left", padx=10)
+        if on_copy is not None:
+            btn = tk.Button(nav, text="Espejo con esto", command=lambda: self.copy(["/MIR"]), **style)
+            btn.pack(side="right", padx=4)
+            ToolTip(btn, "Copia nuevos/cambiados y BORRA los extra del destino, solo en las carpetas afectadas")
+            btn = tk.Button(nav, text="Copiar cambios", command=lambda: self.copy(["/E"]), **style)
+            btn.pack(side="right", padx=4)
+            ToolTip(btn, "Copia solo lo nuevo y cambiado, solo en las carpetas afectadas (sin volver a comparar)")
+        self.apply_filter()
+
+    def apply_filter(self):
+        chosen = self.filter.get()
+        categories = [c for c in CATEGORIES if c != "same"] if chosen == "todos" else [chosen]
+        # Lista de referencias (categoría, fila): no copia los datos, solo los apunta
+        self.rows = [(c, row) for c in categories for row in self.result.entries[c]]
+        self.show(0)
+
+    def show(self, page):
+        pages = max(1, -(-len(self.rows) // PAGE_SIZE))
+        self.page = max(0, min(page, pages - 1))
+        self.table.delete(*self.table.get_children())
+        start = self.page * PAGE_SIZE
+        for c, (rel, size, mtime_ns) in self.rows[start:start + PAGE_SIZE]:
+            stamp = datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M")
+            self.table.insert("", "end", text=rel.replace("/", os.sep), values=(LABELS[c], format_bytes(size), stamp))
+        self.page_label.config(text=f"Página {self.page + 1} de {pages} · {len(self.rows)} filas")
+
+    def copy(self, flags):
+        self.on_copy(self.result, flags)
@@ -0,0 +1,145 @@
+# vista_historial.py
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from tkinter.scrolledtext import ScrolledText
+from datetime import datetime
+from analizador import format_bytes
+from estilos import estilo_botones_tk
+from tooltip import ToolTip
+
+PAGE_LINES = 2000
+
+
+def _stamp(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M") if ts else ""
+
+
+class HistoryView(tk.Toplevel):
+    """
+    Ejecuciones guardadas en historial.RunHistory y búsqueda de fallos por
+    ruta o nombre de archivo (consultas al índice, sin leer los logs).
+    """
+
+    def __init__(self, master, history):
+        super().__init__(master, bg="black")
+        self.title("Historial de ejecuciones")
+        self.geometry("1200x600")
+        self.history = history
+        self.rows = {}
+        style = dict(estilo_botones_tk(), width=16)
+
+        top = tk.Frame(self, bg="black")
+        top.pack(fill="x", padx=10, pady=6)
+        self.text = tk.StringVar()
+        entry = tk.Entry(top, textvariable=self.text, width=70, bg="#222", fg="white", insertbackground="white")
+        entry.pack(side="left", padx=4)
+        entry.bind("<Return>", lambda e: self.search())
+        self.mode = tk.StringVar(value="runs")
+        for value, text in (("runs", "Ejecuciones"), ("failures", "Fallos de la ruta")):
+            tk.Radiobutton(top, text=text, value=value, variable=self.mode, command=self.search,
+                           bg="black", fg="white", selectcolor="#333", activebackground="black").pack(side="left", padx=4)
+        self.failed_only = tk.BooleanVar()
+        tk.Checkbutton(top, text="Solo con fallos", variable=self.failed_only, command=self.search,
+                       bg="black", fg="white", selectcolor="#333", activebackground="black").pack(side="left", padx=4)
+        btn = tk.Button(top, text="Buscar", command=self.search, **style)
+        btn.pack(side="left", padx=4)
+        ToolTip(btn, "Ejecuciones: filtra por nombre, origen o destino. Fallos: ruta (y lo que hay debajo) o nombre de archivo; admite * y ?")
+
+        self.table = ttk.Treeview(self, columns=("a", "b", "c", "d", "e", "f"), height=18)
+        self.table.pack(fill="both", expand=True, padx=10)
+        self.table.bind("<Double-1>", lambda e: self.open_log())
+
+        nav = tk.Frame(self, bg="black")
+        nav.pack(fill="x", padx=10, pady=6)
+        tk.Button(nav, text="Ver registro", command=self.open_log, **style).pack(side="left", padx=4)
+        tk.Button(nav, text="Exportar .txt", command=self.export, **style).pack(side="left", padx=4)
+        self.info = tk.Label(nav, bg="black", fg="#ddd")
+        self.info.pack(side="left", padx=10)
+        self.search()
+
+    def _columns(self, first, headings):
+        self.table.heading("#0", text=first[0])
+        self.table.column("#0", width=first[1], stretch=False)
+        for col, (text, width) in zip(("a", "b", "c", "d", "e", "f"), headings):
+            self.table.heading(col, text=text)
+            self.table.column(col, width=width, stretch=width >= 300)
+
+    def search(self):
+        self.table.delete(*self.table.get_children())
+        self.rows = {}
+        text = self.text.get().strip()
+        if self.mode.get() == "failures":
+            if not text:
+                self.info.config(text="Escribe una ruta o un nombre de archivo")
+                return
+            self._columns(("Ejecución", 90), (("Fecha", 130), ("Trabajo", 140), ("Error", 60),
+                                              ("Ruta", 560), ("Mensaje", 300), ("RC", 40)))
+            rows = self.history.failures(text)
+            for i, f in enumerate(rows):
+                self.rows[str(i)] = (f["run"], f["seq"], f["offset"])
+                self.table.insert("", "end", iid=str(i), text=f"#{f['run']}",
+                                  values=(_stamp(f["started"]), f["name"] or "", f["code"], f["path"],
+                                          f["message"] or "", "" if f["rc"] is None else f["rc"]))
+            self.info.config(text=f"{len(rows)} fallos en {len({r[0] for r in self.rows.values()})} ejecuciones")
+            return
+        self._columns(("#", 60), (("Fecha", 130), ("Trabajo / estado", 160), ("Archivos", 160),
+                                  ("Origen", 360), ("Destino", 360), ("Fallidos", 60)))
+        rows = self.history.runs(text or None, self.failed_only.get())
+        for run in rows:
+            self.rows[str(run["id"])] = (run["id"], 0, 0)
+            rc = "" if run["rc"] is None else f" rc={run['rc']}"
+            self.table.insert("", "end", iid=str(run["id"]), text=f"#{run['id']}",
+                              values=(_stamp(run["started"]), f"{run['name'] or ''} {run['state']}{rc}",
+                                      f"{run['files']} · {format_bytes(run['bytes'] or 0)}",
+                                      run["src"] or "", run["dst"] or "", run["failed"]))
+        self.info.config(text=f"{len(rows)} ejecuciones")
+
+    def _selected(self):
+        sel = self.table.selection()
+        return self.rows.get(sel[0]) if sel else None
+
+    def open_log(self):
+        target = self._selected()
+        if target is not None:
+            LogView(self, self.history, *target)
+
+    def export(self):
+        target = self._selected()
+        if target is None:
+            return
+        path = filedialog.asksaveasfilename(parent=self, title="Exportar registro", defaultextension=".txt",
+                                            initialfile=f"ejecucion_{target[0]}.txt", filetypes=[("Texto", "*.txt")])
+        if not path:
+            return
+        try:
+            self.history.export(target[0], path)
+        except OSError as e:
+            messagebox.showerror("Exportar registro", str(e), parent=self)
+
+
+class LogView(tk.Toplevel):
+    """
+    Log de una ejecución desde (seq, offset), de PAGE_LINES en PAGE_LINES:
+    solo se descomprime lo que se va mostrando.
+    """
+
+    def __init__(self, master, history, run_id, seq=0, offset=0):
+        super().__init__(master, bg="black")
+        self.title(f"Registro de la ejecución #{run_id}" + (f" (desde el fallo, segmento {seq})" if offset or seq else ""))
+        self.geometry("1100x600")
+        self.lines = history.read(run_id, seq, offset)
+        self.text = ScrolledText(self, bg="#111", fg="#ddd", insertbackground="white")
+        self.text.pack(fill="both", expand=True, padx=10, pady=6)
+        self.text.tag_config("err", foreground="#ff6666")
+        self.more = tk.Button(self, text="Más líneas", command=self.load, **dict(estilo_botones_tk(), width=16))
+        self.more.pack(pady=6)
+        self.load()
+
+    def load(self):
+        count = 0
+        for line in self.lines:
+            self.text.insert("end", line, "err" if "ERROR " in line else None)
+            count += 1
+            if count >= PAGE_LINES:
+                return
+        self.more.config(state="disabled", text="Fin del registro")